@@ -0,0 +1,167 @@
+"""
+Production ASGI entry point for the NLP service.
+
+Run with several worker processes, e.g.:
+    uvicorn asgi_backend:app --host 0.0.0.0 --port 3002 --workers 4
+
+The public routes are served by async handlers that call the same
+request-checking and response-building functions as python_backend
+(keywords_result and friends), so both entry points answer alike. Calls to Mistral, FreeSound and Unsplash use
+blocking clients, so each handler awaits them on a large worker-thread pool;
+the event loop keeps accepting requests while hundreds of upstream calls are
+in flight. Any route not defined here falls through to the Flask app.
+"""
+import json
+import time
+import logging
+import anyio
+import metrics
+from contextlib import asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse, FileResponse, RedirectResponse
+from starlette.routing import Mount, Route
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
+
+from config import settings
+import python_backend
+from python_backend import (
+    error_result, keywords_result, keywords_batch_result, keywords_stream_events, track_names_result,
+    search_sound_result, description_result, description_stream_events, image_result, chat_result,
+    chat_stream_events, auto_keywords_result, mix_audio, wants_event_stream, stream_media_type,
+    format_stream_events, STREAM_HEADERS, MIX_RESPONSE_HEADERS, PREVIEW_MAX_AGE
+)
+from preview_cache import resolve_preview
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on blocking upstream calls in flight per worker process
+ASGI_THREAD_LIMIT = settings.asgi_thread_limit
+
+async def _json_body(request):
+    """Parsed JSON body, or None when the body is missing or not JSON (like Flask's get_json)."""
+    try:
+        return await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+class RequestMetricsMiddleware:
+    """
+    Counts and times requests to the async routes defined here, up to the
+    response headers. Requests that fall through to the Flask app are
+    recorded by its own request hooks.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        response = {"status": 500}
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["latency"] = time.perf_counter() - start
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            route = scope.get("route")
+            if isinstance(route, Route):
+                latency = response.get("latency", time.perf_counter() - start)
+                metrics.HTTP_LATENCY.observe(latency, route=route.path)
+                metrics.HTTP_REQUESTS.inc(route=route.path, method=scope["method"], status=response["status"])
+
+async def health_check(request):
+    """Health check endpoint to verify API is running"""
+    return JSONResponse({"status": "healthy"})
+
+def _json_response(result):
+    payload, status, headers = result
+    return JSONResponse(payload, status_code=status, headers=headers)
+
+def _json_route(handler):
+    """
+    Async twin of a python_backend route: the shared *_result function (checks,
+    upstream calls and response body) runs on the worker-thread pool.
+    """
+    async def endpoint(request):
+        return _json_response(await run_in_threadpool(handler, await _json_body(request)))
+    endpoint.__doc__ = f"Async route for python_backend.{handler.__name__}"
+    return endpoint
+
+def _stream_route(events_for, route):
+    """Async twin of a python_backend streaming route; the blocking event generator runs on the thread pool."""
+    async def endpoint(request):
+        events, error = await run_in_threadpool(events_for, await _json_body(request))
+        if error:
+            return _json_response(error)
+        sse = wants_event_stream(request.headers.get("accept", ""))
+        return StreamingResponse(
+            iterate_in_threadpool(format_stream_events(events, sse, route)),
+            media_type=stream_media_type(sse),
+            headers=STREAM_HEADERS
+        )
+    endpoint.__doc__ = f"Async route for python_backend.{events_for.__name__}"
+    return endpoint
+
+async def get_preview(request):
+    """Async twin of python_backend.get_preview; FileResponse handles Range requests"""
+    path, source = await run_in_threadpool(resolve_preview, request.path_params['sound_id'])
+    if path is not None:
+        return FileResponse(path, media_type="audio/mpeg", headers={"Cache-Control": f"public, max-age={PREVIEW_MAX_AGE}"})
+    if source is not None:
+        return RedirectResponse(source, status_code=302)
+    return _json_response(error_result(404, "Unknown preview."))
+
+async def mix(request):
+    """Async twin of python_backend.mix"""
+    audio, error = await run_in_threadpool(mix_audio, await _json_body(request))
+    if error:
+        return _json_response(error)
+    return StreamingResponse(iterate_in_threadpool(audio), media_type="audio/mpeg", headers=MIX_RESPONSE_HEADERS)
+
+async def auto_keywords(request):
+    """Async twin of python_backend.auto_keywords; a catalog pop may wait on Redis, so it runs on the pool too"""
+    return _json_response(await run_in_threadpool(auto_keywords_result))
+
+@asynccontextmanager
+async def lifespan(app):
+    # Starlette's run_in_threadpool shares anyio's default limiter (40 threads)
+    anyio.to_thread.current_default_thread_limiter().total_tokens = ASGI_THREAD_LIMIT
+    yield
+
+app = Starlette(
+    routes=[
+        Route('/health', health_check, methods=['GET']),
+        Route('/api/keywords', _json_route(keywords_result), methods=['POST']),
+        Route('/api/keywords/batch', _json_route(keywords_batch_result), methods=['POST']),
+        Route('/api/keywords/stream', _stream_route(keywords_stream_events, "/api/keywords/stream"), methods=['POST']),
+        Route('/api/track-names', _json_route(track_names_result), methods=['POST']),
+        Route('/api/sound/search', _json_route(search_sound_result), methods=['POST']),
+        Route('/api/description', _json_route(description_result), methods=['POST']),
+        Route('/api/description/stream', _stream_route(description_stream_events, "/api/description/stream"),
+              methods=['POST']),
+        Route('/api/get-image', _json_route(image_result), methods=['POST']),
+        Route('/api/preview/{sound_id:int}', get_preview, methods=['GET']),
+        Route('/api/mix', mix, methods=['POST']),
+        Route('/api/chat', _json_route(chat_result), methods=['POST']),
+        Route('/api/chat/stream', _stream_route(chat_stream_events, "/api/chat/stream"), methods=['POST']),
+        Route('/api/auto-keywords', auto_keywords, methods=['GET']),
+        # Everything else is still served by the Flask app
+        Mount('/', app=WSGIMiddleware(python_backend.app)),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+        Middleware(RequestMetricsMiddleware),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,249 @@
+"""
+Offline latency and throughput benchmark for the NLP service.
+
+Starts local stand-ins for Mistral, FreeSound and Unsplash (bench_stubs.py),
+serves python_backend.app (or the ASGI app under uvicorn) against them, then
+drives every route at each concurrency level and reports p50/p95/p99 latency,
+throughput, errors and upstream calls per request.
+
+Caches, stores and coalescing are disabled by default so every request
+exercises the full pipeline and the upstream call counts are cold; pass
+--warm to keep them all enabled. The client-side governor limits are raised
+out of the way unless --governed is given, since a shed call is answered
+with a fast degraded response; the "shed" column counts governor rejections
+per request so such runs are easy to spot. Answers flagged "degraded" are
+counted in their own column and, like errors, left out of the percentiles.
+
+Usage:
+    python bench_load.py
+    python bench_load.py --concurrency 1 8 32 --requests 64 --mistral-latency 0.8
+    python bench_load.py --server asgi --error-rate 0.05 --routes keywords chat
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_stubs import StubUpstreams, StubConfig, UPSTREAMS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# (name, method, path, JSON body or None)
+ROUTES = [
+    ("keywords", "POST", "/api/keywords", {"str": "a rainy night in a forest cabin"}),
+    ("keywords-batch", "POST", "/api/keywords/batch", {"prompts": [
+        f"a rainy night in a forest cabin {i}" for i in range(8)
+    ]}),
+    ("keywords-stream", "POST", "/api/keywords/stream", {"str": "a rainy night in a forest cabin"}),
+    ("auto-keywords", "GET", "/api/auto-keywords", None),
+    ("sound-search", "POST", "/api/sound/search", {"query": "ocean waves"}),
+    ("track-names", "POST", "/api/track-names", {"sounds": [
+        {"name": f"rain_{i}.wav", "description": "Rain on a tin roof, recorded at night."} for i in range(6)
+    ]}),
+    ("description", "POST", "/api/description", {"str": "Soft Rain, Distant Thunder, Crackling Fire"}),
+    ("description-stream", "POST", "/api/description/stream", {"str": "Soft Rain, Distant Thunder, Crackling Fire"}),
+    ("get-image", "POST", "/api/get-image", {"str": "rainy forest"}),
+    ("chat", "POST", "/api/chat", {"message": "How do I download my mix?"}),
+    ("chat-stream", "POST", "/api/chat/stream", {"message": "How do I download my mix?"}),
+]
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def _request(base_url, method, path, body):
+    """Send one request, read the full body; return (latency seconds, "ok", "degraded" or "error")."""
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            payload = response.read()
+            if response.status >= 400 or b'"event": "error"' in payload:
+                outcome = "error"
+            elif b'"degraded": true' in payload:
+                outcome = "degraded"
+            else:
+                outcome = "ok"
+    except (urllib.error.URLError, OSError):
+        outcome = "error"
+    return time.perf_counter() - start, outcome
+
+def governor_rejections(base_url):
+    """Upstream calls the service's governor has rejected so far, from /metrics."""
+    with urllib.request.urlopen(base_url + "/metrics", timeout=5) as response:
+        text = response.read().decode("utf-8")
+    return sum(
+        float(line.rsplit(" ", 1)[1]) for line in text.splitlines()
+        if line.startswith("nlp_governor_rejections_total{")
+    )
+
+def run_route(base_url, stubs, route, concurrency, total):
+    """Drive one route with `total` requests at a fixed concurrency."""
+    name, method, path, body = route
+    before = stubs.snapshot()
+    rejections_before = governor_rejections(base_url)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: _request(base_url, method, path, body), range(total)))
+    elapsed = time.perf_counter() - start
+    after = stubs.snapshot()
+    shed = governor_rejections(base_url) - rejections_before
+
+    # Only full answers count towards the percentiles; fast fallbacks would flatter them
+    latencies = sorted(latency for latency, outcome in results if outcome == "ok")
+    return {
+        "route": name,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": sum(1 for _, outcome in results if outcome == "error"),
+        "degraded": sum(1 for _, outcome in results if outcome == "degraded"),
+        "shed_per_request": shed / total,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "throughput_rps": total / elapsed,
+        "upstream_calls_per_request": {u: (after[u] - before[u]) / total for u in UPSTREAMS},
+    }
+
+def _wait_healthy(base_url, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(base_url + "/health", timeout=0.5) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError("service did not become healthy")
+
+def start_service(server, env):
+    """Start the app against the stubs; returns (base_url, stop callable)."""
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+
+    if server == "asgi":
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "asgi_backend:app", "--host", "127.0.0.1",
+             "--port", str(port), "--log-level", "warning"],
+            cwd=HERE, env={**os.environ, **env}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        _wait_healthy(base_url)
+
+        def stop():
+            proc.terminate()
+            proc.wait()
+        return base_url, stop
+
+    # Settings are read at import time, so configure the environment first
+    os.environ.update(env)
+    import logging
+    from werkzeug.serving import make_server
+    import python_backend
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("python_backend").setLevel(logging.WARNING)
+    httpd = make_server("127.0.0.1", port, python_backend.app, threaded=True)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    _wait_healthy(base_url)
+    return base_url, httpd.shutdown
+
+def print_report(rows):
+    header = f"{'route':<20}{'conc':>5}{'reqs':>6}{'err':>5}{'degr':>5}{'shed':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>8}   upstream calls/req"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        calls = " ".join(f"{u}={n:.2f}" for u, n in row["upstream_calls_per_request"].items())
+        print(f"{row['route']:<20}{row['concurrency']:>5}{row['requests']:>6}{row['errors']:>5}{row['degraded']:>5}{row['shed_per_request']:>6.2f}"
+              f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['throughput_rps']:>8.1f}   {calls}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=["flask", "asgi"], default="flask")
+    parser.add_argument("--routes", nargs="*", default=[r[0] for r in ROUTES],
+                        help="route names to drive (default: all)")
+    parser.add_argument("--concurrency", nargs="*", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=32, help="requests per route and concurrency level")
+    parser.add_argument("--mistral-latency", type=float, default=0.5, help="seconds per Mistral call")
+    parser.add_argument("--freesound-latency", type=float, default=0.25, help="seconds per FreeSound call")
+    parser.add_argument("--unsplash-latency", type=float, default=0.15, help="seconds per Unsplash call")
+    parser.add_argument("--jitter", type=float, default=0.1, help="latency standard deviation as a fraction of the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls that fail")
+    parser.add_argument("--warm", action="store_true", help="keep the caches, stores and coalescing enabled")
+    parser.add_argument("--governed", action="store_true",
+                        help="keep the configured client-side rate and concurrency limits")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    latencies = {"mistral": args.mistral_latency, "freesound": args.freesound_latency, "unsplash": args.unsplash_latency}
+    stubs = StubUpstreams({
+        name: StubConfig(latency, latency * args.jitter, args.error_rate) for name, latency in latencies.items()
+    }).start()
+
+    data_dir = tempfile.mkdtemp(prefix="soundscape-bench-")
+    env = {
+        **stubs.env(),
+        "REDIS_URL": "",
+        "FREESOUND_INDEX_PATH": os.path.join(data_dir, "freesound_index.db"),
+        "SEMANTIC_INDEX_DIR": data_dir,
+    }
+    if not args.warm:
+        # Everything that lets a request skip or share an upstream call
+        env.update({
+            "LLM_CACHE_ENABLED": "0",
+            "FREESOUND_INDEX_MODE": "off",
+            "TRACK_NAME_STORE_ENABLED": "0",
+            "CATALOG_ENABLED": "0",
+            "SINGLEFLIGHT_ENABLED": "0",
+            "PREVIEW_CACHE_ENABLED": "0",
+            "SOUND_ANALYSIS_ENABLED": "0",
+        })
+
+    if not args.governed:
+        # The stubs have no quota to protect; measure the service, not the limiter
+        for upstream in UPSTREAMS:
+            prefix = upstream.upper()
+            env.update({
+                f"{prefix}_RATE_LIMIT": "100000",
+                f"{prefix}_BURST": "100000",
+                f"{prefix}_MAX_CONCURRENCY": str(max(args.concurrency) * 8),
+            })
+
+    base_url, stop = start_service(args.server, env)
+    rows = []
+    try:
+        selected = [route for route in ROUTES if route[0] in args.routes]
+        for concurrency in args.concurrency:
+            for route in selected:
+                rows.append(run_route(base_url, stubs, route, concurrency, args.requests))
+    finally:
+        stop()
+        stubs.stop()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_report(rows)
+
+if __name__ == "__main__":
+    main()
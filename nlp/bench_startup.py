@@ -0,0 +1,86 @@
+"""
+Startup benchmark for the NLP service.
+
+Measures, in fresh processes:
+  - import time of the app module (python_backend or asgi_backend)
+  - time from process start until GET /health first returns 200
+
+Usage:
+    python bench_startup.py                 # ASGI server (uvicorn), 5 runs
+    python bench_startup.py --server flask  # Flask dev server
+    python bench_startup.py --runs 10
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def measure_import(module):
+    """Seconds spent importing `module` in a fresh interpreter."""
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True, check=True
+    ).stdout
+    return float(out.strip().splitlines()[-1])
+
+def measure_first_health(server, timeout=30.0):
+    """Seconds from spawning the server until /health answers 200."""
+    port = _free_port()
+    if server == "flask":
+        code = f"import python_backend; python_backend.app.run(host='127.0.0.1', port={port})"
+        cmd = [sys.executable, "-c", code]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "asgi_backend:app", "--host", "127.0.0.1",
+               "--port", str(port), "--log-level", "warning"]
+
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        url = f"http://127.0.0.1:{port}/health"
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{server} server exited with code {proc.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=0.5) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"/health did not answer within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def _summary(samples):
+    return (f"median {statistics.median(samples) * 1000:7.1f} ms   "
+            f"min {min(samples) * 1000:7.1f} ms   max {max(samples) * 1000:7.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=["asgi", "flask"], default="asgi")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    module = "asgi_backend" if args.server == "asgi" else "python_backend"
+    imports = [measure_import(module) for _ in range(args.runs)]
+    healthy = [measure_first_health(args.server) for _ in range(args.runs)]
+
+    print(f"import {module:<15} {_summary(imports)}")
+    print(f"first healthy /health  {_summary(healthy)}")
+
+if __name__ == "__main__":
+    main()
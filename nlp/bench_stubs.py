@@ -0,0 +1,196 @@
+"""
+Local stand-ins for Mistral, FreeSound and Unsplash used by bench_load.py.
+
+One threaded HTTP server answers all three APIs with canned but well-formed
+responses, after a configurable latency and with a configurable error rate,
+and counts the calls it receives per upstream. Point the service at it with:
+
+    MISTRAL_SERVER_URL=http://127.0.0.1:<port>
+    FREESOUND_API_URL=http://127.0.0.1:<port>/apiv2
+    UNSPLASH_API_URL=http://127.0.0.1:<port>/search/photos
+"""
+import re
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+UPSTREAMS = ("mistral", "freesound", "unsplash")
+
+class StubConfig:
+    """Latency (seconds, mean and jitter) and error rate for one upstream."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def delay(self):
+        return max(0.0, random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+
+class StubUpstreams:
+    """Threaded HTTP server impersonating the three upstream APIs."""
+
+    def __init__(self, configs=None, host="127.0.0.1", port=0):
+        self.configs = {name: StubConfig() for name in UPSTREAMS}
+        self.configs.update(configs or {})
+        self.counts = {name: 0 for name in UPSTREAMS}
+        self._lock = threading.Lock()
+
+        stubs = self
+
+        class Handler(_StubHandler):
+            upstreams = stubs
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self):
+        """Environment variables that point the NLP service at these stubs."""
+        return {
+            "MISTRAL_API_KEY": "stub",
+            "FREESOUND_API_KEY": "stub",
+            "UNSPLASH_API_KEY": "stub",
+            "MISTRAL_SERVER_URL": self.url,
+            "FREESOUND_API_URL": f"{self.url}/apiv2",
+            "UNSPLASH_API_URL": f"{self.url}/search/photos",
+        }
+
+    def record(self, upstream):
+        with self._lock:
+            self.counts[upstream] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class _StubHandler(BaseHTTPRequestHandler):
+    upstreams = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _simulate(self, upstream):
+        """Record the call, sleep for the configured latency; return False to fail it."""
+        self.upstreams.record(upstream)
+        config = self.upstreams.configs[upstream]
+        time.sleep(config.delay())
+        if config.error_rate and random.random() < config.error_rate:
+            self._send_json({"message": "stub upstream error"}, status=random.choice([429, 500, 503]))
+            return False
+        return True
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        params = parse_qs(parsed.query)
+        if parsed.path.rstrip("/").endswith("/search/text"):
+            if self._simulate("freesound"):
+                self._send_json(_freesound_results(params.get("query", [""])[0], params))
+        elif parsed.path.endswith("/search/photos"):
+            if self._simulate("unsplash"):
+                self._send_json({"results": [{"urls": {"small": "https://images.example/stub.jpg"}}]})
+        else:
+            self._send_json({"message": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json({"message": "not found"}, status=404)
+            return
+        if not self._simulate("mistral"):
+            return
+
+        prompt = request["messages"][-1]["content"]
+        content = _mistral_answer(prompt)
+        if request.get("stream"):
+            self._send_stream(request.get("model", "stub"), content)
+        else:
+            self._send_json({
+                "id": "stub", "object": "chat.completion", "model": request.get("model", "stub"),
+                "created": int(time.time()),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                          "total_tokens": (len(prompt) + len(content)) // 4},
+            })
+
+    def _send_stream(self, model, content):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+        for index, piece in enumerate(pieces):
+            chunk = {
+                "id": "stub", "object": "chat.completion.chunk", "model": model, "created": int(time.time()),
+                "choices": [{"index": 0, "delta": {"content": piece},
+                             "finish_reason": "stop" if index == len(pieces) - 1 else None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+def _freesound_results(query, params):
+    page_size = int(params.get("page_size", ["15"])[0])
+    base = abs(hash(query)) % 100000 * 100
+    return {"count": page_size, "results": [
+        {
+            "id": base + i,
+            "name": f"{query} take {i}.wav",
+            "description": f"Field recording of {query}, take {i}. Recorded with a stub microphone.",
+            "download": f"https://freesound.example/sounds/{base + i}/download/",
+            "previews": {"preview-hq-mp3": f"https://freesound.example/previews/{base + i}-hq.mp3"},
+        }
+        for i in range(page_size)
+    ]}
+
+_SOUND_COUNT_RE = re.compile(r'^Name: "', re.MULTILINE)
+_DESCRIPTION_RE = re.compile(r'^\s*\d+\. "', re.MULTILINE)
+
+def _mistral_answer(prompt):
+    """Canned answer in the format each nlp_model prompt asks for."""
+    if "naming expert" in prompt:
+        count = len(_SOUND_COUNT_RE.findall(prompt)) or 1
+        return json.dumps([f"Stub Track {i + 1}" for i in range(count)])
+    if "User Question" in prompt:
+        return json.dumps({"response": "This is a stub answer about SoundscapeGen."})
+    if '"description"' in prompt:
+        return json.dumps({"description": "A stub soundscape where gentle layers blend into one calm scene."})
+    keywords = ["soft rain", "distant thunder", "wind in trees", "river stream", "bird song", "night crickets"]
+    if "numbered list of descriptions" in prompt:
+        count = len(_DESCRIPTION_RE.findall(prompt)) or 1
+        return json.dumps([
+            {"is_valid": True, "keywords": [f"{k} {i}" for k in keywords]} for i in range(count)
+        ])
+    if '"is_valid"' in prompt and '"keywords"' in prompt:
+        return json.dumps({"is_valid": True, "keywords": keywords})
+    if '"is_valid"' in prompt:
+        return json.dumps({"is_valid": True})
+    return json.dumps(keywords)
@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import fcntl
+import random
+import logging
+import threading
+from collections import deque
+import metrics
+from llm_cache import connect_redis
+from config import settings
+from nlp_model import auto_generate_keywords, AUTO_STYLES
+from pipeline import run_keywords_pipeline
+from governor import degraded_scope
+
+logger = logging.getLogger(__name__)
+
+# Set CATALOG_ENABLED=0 to always run /api/auto-keywords live
+CATALOG_ENABLED = settings.catalog_enabled
+# Ready-made soundscapes kept per style
+CATALOG_POOL_SIZE = settings.catalog_pool_size
+# Seconds an entry may wait in the pool before it is thrown away
+CATALOG_ENTRY_TTL = settings.catalog_entry_ttl
+# Pause (seconds) between two refills, so refilling never crowds out live requests
+CATALOG_REFILL_INTERVAL = settings.catalog_refill_interval
+# Lock file electing the one worker process on the host that refills the pool
+CATALOG_LOCK_PATH = settings.catalog_lock_path
+# Shared pool for every worker when set; otherwise each worker keeps its own
+REDIS_URL = settings.redis_url
+# Pause after a failed refill (e.g. Mistral unavailable)
+_FAILURE_BACKOFF = 30.0
+# How often a worker that is not the refiller checks whether it can take over,
+# and how often the refiller looks at a shared pool that other workers consume
+_ELECTION_INTERVAL = 30.0
+_SHARED_POLL_INTERVAL = 5.0
+
+class _LocalPools:
+    """Entries kept in this process, oldest first, in one deque for every style."""
+
+    shared = False
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = deque()  # (created_at, entry)
+        self._lock = threading.Lock()
+
+    def pop(self, style=None):
+        now = time.time()
+        with self._lock:
+            if style is None:
+                while self._entries:
+                    created_at, entry = self._entries.popleft()
+                    if now - created_at < self.ttl:
+                        return entry
+                return None
+            for item in self._entries:
+                if item[1]["style"] == style and now - item[0] < self.ttl:
+                    self._entries.remove(item)
+                    return item[1]
+            return None
+
+    def push(self, entry):
+        with self._lock:
+            self._entries.append((time.time(), entry))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def counts(self):
+        """{style: fresh entries}; only styles with at least one entry appear."""
+        now = time.time()
+        with self._lock:
+            entries = list(self._entries)
+        counts = {}
+        for created_at, entry in entries:
+            if now - created_at < self.ttl:
+                counts[entry["style"]] = counts.get(entry["style"], 0) + 1
+        return counts
+
+    def drop_expired(self):
+        now = time.time()
+        with self._lock:
+            self._entries = deque(item for item in self._entries if now - item[0] < self.ttl)
+
+class _RedisPools:
+    """
+    Entries in one Redis list shared by every worker, oldest first, so a pop
+    for any style is a single LPOP. Redis errors read as an empty pool for
+    pop() and a full one for counts(), so a Redis outage neither breaks
+    requests nor sets off refilling.
+    """
+
+    shared = True
+    KEY = "catalog:entries"
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+
+    def pop(self, style=None):
+        now = time.time()
+        try:
+            if style is not None:
+                return self._pop_style(style, now)
+            while True:
+                raw = self.client.lpop(self.KEY)
+                if raw is None:
+                    return None
+                item = json.loads(raw)
+                if now - item["created_at"] < self.ttl:
+                    return item["entry"]
+        except Exception as e:
+            logger.warning("Soundscape catalog Redis pop failed: %s", e)
+            return None
+
+    def _pop_style(self, style, now):
+        # Not on the /api/auto-keywords path: scan the short list for the style
+        for raw in self.client.lrange(self.KEY, 0, -1):
+            item = json.loads(raw)
+            # LREM tells whether this worker or another one took it
+            if item["entry"]["style"] == style and now - item["created_at"] < self.ttl and self.client.lrem(self.KEY, 1, raw):
+                return item["entry"]
+        return None
+
+    def push(self, entry):
+        try:
+            self.client.rpush(self.KEY, json.dumps({"created_at": time.time(), "entry": entry}))
+        except Exception as e:
+            logger.warning("Soundscape catalog Redis push failed: %s", e)
+
+    def __len__(self):
+        try:
+            return self.client.llen(self.KEY)
+        except Exception as e:
+            logger.warning("Soundscape catalog Redis read failed: %s", e)
+            return 0
+
+    def counts(self):
+        """{style: fresh entries}, or None when Redis cannot be read."""
+        now = time.time()
+        try:
+            items = [json.loads(raw) for raw in self.client.lrange(self.KEY, 0, -1)]
+        except Exception as e:
+            logger.warning("Soundscape catalog Redis read failed: %s", e)
+            return None
+        counts = {}
+        for item in items:
+            if now - item["created_at"] < self.ttl:
+                style = item["entry"]["style"]
+                counts[style] = counts.get(style, 0) + 1
+        return counts
+
+    def drop_expired(self):
+        now = time.time()
+        try:
+            for raw in self.client.lrange(self.KEY, 0, -1):
+                if now - json.loads(raw)["created_at"] >= self.ttl:
+                    self.client.lrem(self.KEY, 1, raw)
+        except Exception as e:
+            logger.warning("Soundscape catalog Redis cleanup failed: %s", e)
+
+def _make_pools(ttl, redis_url):
+    client = connect_redis(redis_url) if redis_url else None
+    if client is None:
+        return _LocalPools(ttl)
+    return _RedisPools(client, ttl)
+
+class SoundscapeCatalog:
+    """
+    Pool of precomputed /api/auto-keywords answers (keywords, sounds and
+    renamed tracks) for every style in AUTO_STYLES.
+
+    Entries of every style share one queue, oldest first, so pop() hands out
+    and consumes an entry with a single LPOP (or popleft). The queue lives in
+    Redis when REDIS_URL is set, shared by every worker, and in the process
+    otherwise. A background thread, started with the app, keeps each style
+    topped up to `pool_size` entries off the request path, refilling one of
+    the emptiest styles (picked at random, so the queue mixes styles) at most
+    once every `refill_interval` seconds; only the worker holding the
+    CATALOG_LOCK_PATH file lock refills, so WEB_CONCURRENCY workers do not
+    multiply the background Mistral and FreeSound calls. (Without Redis the
+    other workers' pools then stay empty and they answer live.)
+    """
+
+    def __init__(self, styles=AUTO_STYLES, pool_size=CATALOG_POOL_SIZE, ttl=CATALOG_ENTRY_TTL,
+                 refill_interval=CATALOG_REFILL_INTERVAL, redis_url=REDIS_URL, lock_path=CATALOG_LOCK_PATH):
+        self.styles = list(styles)
+        self.pool_size = pool_size
+        self.ttl = ttl
+        self.refill_interval = refill_interval
+        self.lock_path = lock_path
+        self._pools = _make_pools(ttl, redis_url)
+        self._lock_file = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def pop(self, style=None):
+        """
+        Consume one ready entry {"style", "keywords", "sounds"} for `style`,
+        or the oldest entry of any style when none is given. Returns None when
+        the pool has nothing fresh, so the caller can fall back to the live
+        pipeline.
+        """
+        self._wake.set()
+        entry = self._pools.pop(style) if style is None or style in self.styles else None
+        metrics.CATALOG_POPS.inc(result="miss" if entry is None else "hit")
+        return entry
+
+    def size(self) -> int:
+        return len(self._pools)
+
+    def start(self):
+        """Start the refill thread (once)."""
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._refill_forever, name="catalog-refill", daemon=True)
+                self._worker.start()
+
+    def _claim_refill(self) -> bool:
+        """Take the host-wide refill lock (held until the process exits); False if another worker has it."""
+        if self._lock_file is not None:
+            return True
+        try:
+            lock_dir = os.path.dirname(self.lock_path)
+            if lock_dir:
+                os.makedirs(lock_dir, exist_ok=True)
+            lock_file = open(self.lock_path, "a")
+        except OSError as e:
+            # No shared lock file: refill from this worker rather than not at all
+            logger.warning("Catalog refill lock unavailable (%s); refilling from this worker", e)
+            self._lock_file = True
+            return True
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info("This worker refills the soundscape catalog")
+        return True
+
+    def _refill_forever(self):
+        while not self._claim_refill():
+            # Another worker refills; take over if it goes away
+            time.sleep(_ELECTION_INTERVAL)
+
+        while True:
+            counts = self._pools.counts()
+            fewest = min(counts.get(style, 0) for style in self.styles) if counts is not None else self.pool_size
+            if fewest >= self.pool_size:
+                # Every style is full; sleep until an entry is consumed (by this
+                # worker, or by any worker when the pool is shared)
+                self._wake.clear()
+                self._wake.wait(timeout=_SHARED_POLL_INTERVAL if self._pools.shared else self.ttl)
+                self._pools.drop_expired()
+                continue
+
+            style = random.choice([style for style in self.styles if counts.get(style, 0) == fewest])
+            try:
+                entry = self.build_entry(style)
+            except Exception:
+                logger.exception("Refilling the soundscape catalog for '%s' failed", style)
+                entry = None
+            if entry is None:
+                time.sleep(_FAILURE_BACKOFF)
+                continue
+            self._pools.push(entry)
+            time.sleep(self.refill_interval)
+
+    @staticmethod
+    def build_entry(style):
+        """
+        Run the live auto-keywords pipeline for one style; None if it produced
+        nothing usable, or served a fallback that should not be kept for a day.
+        """
+        with degraded_scope() as degraded:
+            keywords = auto_generate_keywords(min_keywords=6, style=style)
+            if not keywords:
+                return None
+            result = run_keywords_pipeline(None, keywords=keywords)
+        if not result["sounds"] or degraded:
+            return None
+        return {"style": style, "keywords": keywords, "sounds": result["sounds"]}
+
+catalog = SoundscapeCatalog()
+
+metrics.Gauge("nlp_catalog_entries", "Precomputed auto-keywords soundscapes ready.", catalog.size)
+
+def start_refill():
+    """Start filling the catalog when the app starts, rather than on the first request."""
+    if CATALOG_ENABLED:
+        catalog.start()
+
+def pop_soundscape(style=None):
+    """A precomputed auto-keywords answer, or None (catalog disabled or empty)."""
+    if not CATALOG_ENABLED:
+        return None
+    return catalog.pop(style)
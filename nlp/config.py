@@ -0,0 +1,162 @@
+import os
+from dotenv import load_dotenv
+
+_DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+class Settings:
+    """
+    Configuration for the NLP service, read from the environment once at startup.
+    Modules import the shared `settings` object instead of reading os.environ
+    themselves, so .env is loaded a single time and every value has one default.
+    """
+
+    def __init__(self, environ):
+        # API keys (missing keys only fail when the upstream is first used)
+        self.mistral_api_key = environ.get("MISTRAL_API_KEY")
+        self.freesound_api_key = environ.get("FREESOUND_API_KEY")
+        self.unsplash_api_key = environ.get("UNSPLASH_API_KEY")
+
+        # Upstream base URLs (overridden to point at local stand-ins in benchmarks)
+        self.mistral_server_url = environ.get("MISTRAL_SERVER_URL") or None
+        self.freesound_api_url = environ.get("FREESOUND_API_URL", "https://freesound.org/apiv2")
+        self.unsplash_api_url = environ.get("UNSPLASH_API_URL", "https://api.unsplash.com/search/photos")
+
+        # Mistral
+        self.mistral_model = environ.get("MISTRAL_MODEL", "mistral-large-latest")
+        self.keywords_mode = environ.get("KEYWORDS_MODE", "single")
+        # Ask Mistral for JSON mode (response_format json_object) on prompts that expect a JSON object
+        self.mistral_json_mode = environ.get("MISTRAL_JSON_MODE", "1") != "0"
+        # Smaller model used for the listed tasks (MISTRAL_SMALL_MODEL= to always use MISTRAL_MODEL)
+        self.mistral_small_model = environ.get("MISTRAL_SMALL_MODEL", "mistral-small-latest")
+        self.mistral_small_model_tasks = {
+            task.strip() for task in
+            environ.get("MISTRAL_SMALL_MODEL_TASKS", "validation,track_names,auto_keywords").split(",") if task.strip()
+        }
+        # Batch API: prompts per request, prompts per keyword call, sounds per naming call
+        self.batch_max_prompts = int(environ.get("BATCH_MAX_PROMPTS", "50"))
+        self.keywords_batch_size = int(environ.get("KEYWORDS_BATCH_SIZE", "8"))
+        self.track_names_batch_size = int(environ.get("TRACK_NAMES_BATCH_SIZE", "24"))
+        # Mistral calls batch jobs may have in flight at once, across all batch requests
+        self.batch_max_concurrency = int(environ.get("BATCH_MAX_CONCURRENCY", "2"))
+
+        # Shared HTTP client
+        self.http_pool_connections = int(environ.get("HTTP_POOL_CONNECTIONS", "4"))
+        self.http_pool_maxsize = int(environ.get("HTTP_POOL_MAXSIZE", "16"))
+        self.http_connect_timeout = float(environ.get("HTTP_CONNECT_TIMEOUT", "3.05"))
+        self.http_read_timeout = float(environ.get("HTTP_READ_TIMEOUT", "10"))
+        self.http_max_retries = int(environ.get("HTTP_MAX_RETRIES", "2"))
+        self.http_backoff_factor = float(environ.get("HTTP_BACKOFF_FACTOR", "0.3"))
+        self.http_retry_after_max = float(environ.get("HTTP_RETRY_AFTER_MAX", "2"))
+
+        # FreeSound search
+        self.freesound_max_concurrency = int(environ.get("FREESOUND_MAX_CONCURRENCY", "6"))
+        self.freesound_search_deadline = float(environ.get("FREESOUND_SEARCH_DEADLINE", "8"))
+
+        # Client-side governor: requests/second, burst and concurrent calls per upstream key.
+        # Sized so a worker serving hundreds of concurrent requests (each /api/keywords makes
+        # two Mistral calls and up to six FreeSound searches) is not shed by its own limiter;
+        # the bucket halves on every 429, so the upstream's real limit still wins.
+        # FreeSound's standard keys allow 60 requests/minute; set FREESOUND_RATE_LIMIT=1 for those.
+        self.mistral_rate_limit = float(environ.get("MISTRAL_RATE_LIMIT", "50"))
+        self.mistral_burst = int(environ.get("MISTRAL_BURST", "100"))
+        self.mistral_max_concurrency = int(environ.get("MISTRAL_MAX_CONCURRENCY", "256"))
+        self.freesound_rate_limit = float(environ.get("FREESOUND_RATE_LIMIT", "10"))
+        self.freesound_burst = int(environ.get("FREESOUND_BURST", "60"))
+        self.unsplash_rate_limit = float(environ.get("UNSPLASH_RATE_LIMIT", "2"))
+        self.unsplash_burst = int(environ.get("UNSPLASH_BURST", "20"))
+        self.unsplash_max_concurrency = int(environ.get("UNSPLASH_MAX_CONCURRENCY", "16"))
+        # Seconds a call may wait for rate or concurrency capacity before it is shed
+        self.governor_max_wait = float(environ.get("GOVERNOR_MAX_WAIT", "2"))
+        # Consecutive failures that open a circuit, and seconds before it is probed again
+        self.circuit_failure_threshold = int(environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+        self.circuit_reset_timeout = float(environ.get("CIRCUIT_RESET_TIMEOUT", "30"))
+
+        # Local FreeSound index and semantic retrieval
+        self.freesound_index_path = environ.get(
+            "FREESOUND_INDEX_PATH", os.path.join(_DEFAULT_DATA_DIR, "freesound_index.db")
+        )
+        self.freesound_index_mode = environ.get("FREESOUND_INDEX_MODE", "read-through")
+        self.freesound_index_ttl = int(environ.get("FREESOUND_INDEX_TTL", str(7 * 24 * 60 * 60)))
+        # Results requested per FreeSound search (a few more than a mix keeps, so duplicates can be dropped)
+        self.freesound_page_size = int(environ.get("FREESOUND_PAGE_SIZE", "8"))
+        # Sounds of one keyword a generated mix takes before other keywords get a turn
+        self.mix_sounds_per_keyword = int(environ.get("MIX_SOUNDS_PER_KEYWORD", "2"))
+        # Generated track names per FreeSound id
+        self.track_name_store_enabled = environ.get("TRACK_NAME_STORE_ENABLED", "1") != "0"
+        self.track_name_store_path = environ.get(
+            "TRACK_NAME_STORE_PATH", os.path.join(os.path.dirname(self.freesound_index_path), "track_names.db")
+        )
+        # Local copies of FreeSound preview audio served from /api/preview/<id>
+        self.preview_cache_enabled = environ.get("PREVIEW_CACHE_ENABLED", "1") != "0"
+        self.preview_cache_dir = environ.get(
+            "PREVIEW_CACHE_DIR", os.path.join(os.path.dirname(self.freesound_index_path), "previews")
+        )
+        self.preview_cache_max_mb = int(environ.get("PREVIEW_CACHE_MAX_MB", "1024"))
+        self.preview_cache_base_url = environ.get("PREVIEW_CACHE_BASE_URL", "")
+        # Loudness and loop-point analysis of returned sounds
+        self.sound_analysis_enabled = environ.get("SOUND_ANALYSIS_ENABLED", "1") != "0"
+        self.sound_analysis_path = environ.get(
+            "SOUND_ANALYSIS_PATH", os.path.join(os.path.dirname(self.freesound_index_path), "sound_analysis.db")
+        )
+        self.sound_analysis_workers = int(environ.get("SOUND_ANALYSIS_WORKERS", "2"))
+        self.sound_analysis_max_pending = int(environ.get("SOUND_ANALYSIS_MAX_PENDING", "256"))
+        self.sound_analysis_max_seconds = float(environ.get("SOUND_ANALYSIS_MAX_SECONDS", "60"))
+        self.sound_analysis_retry_after = float(environ.get("SOUND_ANALYSIS_RETRY_AFTER", str(24 * 60 * 60)))
+        self.sound_analysis_target_lufs = float(environ.get("SOUND_ANALYSIS_TARGET_LUFS", "-23"))
+        self.semantic_search = environ.get("SEMANTIC_SEARCH", "0") == "1"
+        self.semantic_model = environ.get("SEMANTIC_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+        self.semantic_min_score = float(environ.get("SEMANTIC_MIN_SCORE", "0.55"))
+        self.semantic_index_dir = environ.get("SEMANTIC_INDEX_DIR", os.path.dirname(self.freesound_index_path))
+
+        # Precomputed /api/auto-keywords soundscapes
+        self.catalog_enabled = environ.get("CATALOG_ENABLED", "1") != "0"
+        self.catalog_pool_size = int(environ.get("CATALOG_POOL_SIZE", "3"))
+        self.catalog_entry_ttl = float(environ.get("CATALOG_ENTRY_TTL", str(24 * 60 * 60)))
+        # Each entry costs a Mistral call, up to six FreeSound searches and a naming call; one
+        # every 10 s keeps the prefill to a small share of a standard FreeSound key's 60/minute
+        self.catalog_refill_interval = float(environ.get("CATALOG_REFILL_INTERVAL", "10"))
+        self.catalog_lock_path = environ.get(
+            "CATALOG_LOCK_PATH", os.path.join(os.path.dirname(self.freesound_index_path), "catalog.lock")
+        )
+
+        # Retrieval-backed chat
+        self.chat_top_k = int(environ.get("CHAT_TOP_K", "3"))
+        self.chat_faq_min_score = float(environ.get("CHAT_FAQ_MIN_SCORE", "0.8"))
+
+        # LLM response cache
+        self.llm_cache_enabled = environ.get("LLM_CACHE_ENABLED", "1") != "0"
+        self.llm_cache_maxsize = int(environ.get("LLM_CACHE_MAXSIZE", "1024"))
+        self.llm_cache_ttl = int(environ.get("LLM_CACHE_TTL", str(6 * 60 * 60)))
+        self.redis_url = environ.get("REDIS_URL")
+
+        # Directory where every worker writes its metric samples, so that /metrics on any
+        # worker reports the sum over all of them (empty: each worker reports only its own)
+        self.metrics_multiproc_dir = environ.get("METRICS_MULTIPROC_DIR", "")
+        self.metrics_flush_interval = float(environ.get("METRICS_FLUSH_INTERVAL", "1"))
+
+        # Single-flight coalescing of identical concurrent calls
+        self.singleflight_enabled = environ.get("SINGLEFLIGHT_ENABLED", "1") != "0"
+        self.singleflight_wait = float(environ.get("SINGLEFLIGHT_WAIT", "30"))
+        self.singleflight_result_ttl = float(environ.get("SINGLEFLIGHT_RESULT_TTL", "5"))
+
+        # Server-side mixdown (/api/mix)
+        self.ffmpeg_path = environ.get("FFMPEG_PATH", "ffmpeg")
+        self.mix_max_tracks = int(environ.get("MIX_MAX_TRACKS", "6"))
+        self.mix_default_duration = float(environ.get("MIX_DEFAULT_DURATION", "90"))
+        self.mix_max_duration = float(environ.get("MIX_MAX_DURATION", "600"))
+        self.mix_bitrate = environ.get("MIX_BITRATE", "192k")
+        # Mixes rendered at once by a worker; each runs an ffmpeg per track plus an encoder
+        self.mix_max_concurrency = int(environ.get("MIX_MAX_CONCURRENCY", "4"))
+        self.mix_allowed_hosts = [
+            host.strip().lower() for host in environ.get("MIX_ALLOWED_HOSTS", "freesound.org").split(",") if host.strip()
+        ]
+
+        # ASGI serving
+        self.asgi_thread_limit = int(environ.get("ASGI_THREAD_LIMIT", "256"))
+
+def load_settings():
+    """Load .env (without overriding real environment variables) and build Settings."""
+    load_dotenv()
+    return Settings(os.environ)
+
+settings = load_settings()
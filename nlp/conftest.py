@@ -0,0 +1,18 @@
+"""
+pytest setup: run the tests against throwaway local state, with no Redis and
+no persistent caches, whatever the developer's .env says.
+"""
+import os
+import tempfile
+
+_DATA_DIR = tempfile.mkdtemp(prefix="nlp-tests-")
+
+os.environ.update({
+    "REDIS_URL": "",
+    "LLM_CACHE_ENABLED": "0",
+    "CATALOG_ENABLED": "0",
+    "FREESOUND_INDEX_PATH": os.path.join(_DATA_DIR, "freesound_index.db"),
+})
+
+# A manual smoke test that calls the live Mistral API on import
+collect_ignore = ["test_mistral.py"]
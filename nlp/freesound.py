@@ -1,62 +1,229 @@
-import os
+import logging
 import requests
-from dotenv import load_dotenv
+import http_client
+import metrics
+from freesound_index import get_index, normalize_query, FREESOUND_INDEX_MODE
+from semantic_index import semantic_search, schedule_refresh
+from singleflight import coalesce, CoalescingExecutor
+from governor import get_governor, UpstreamUnavailable, mark_degraded, carry_degraded
+from sound_selection import dedupe_sounds
+from preview_cache import cache_previews
+from sound_analysis import schedule_analysis
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from config import settings
 
-# Load environment variable from .env file
-load_dotenv()
-# Get Freesound API key from environment variables
-FREESOUND_API_KEY = os.environ.get("FREESOUND_API_KEY")
+logger = logging.getLogger(__name__)
+
+# Get Freesound API key from the service settings
+FREESOUND_API_KEY = settings.freesound_api_key
+FREESOUND_API_URL = settings.freesound_api_url
 
 # Validate API key exists
 if not FREESOUND_API_KEY:
-    print("Error: Freesound Api key is not loaded.")
+    logger.error("Freesound Api key is not loaded.")
+
+# Maximum number of keyword searches running against FreeSound at the same time
+FREESOUND_MAX_CONCURRENCY = settings.freesound_max_concurrency
+# Seconds a whole search_freesound call may take before unfinished searches are dropped
+FREESOUND_SEARCH_DEADLINE = settings.freesound_search_deadline
+# Results requested per search: a few more than a keyword contributes, so duplicates can be dropped
+FREESOUND_PAGE_SIZE = settings.freesound_page_size
+
+# Shared, bounded pool so concurrent Flask requests cannot flood FreeSound
+_search_executor = ThreadPoolExecutor(
+    max_workers=FREESOUND_MAX_CONCURRENCY,
+    thread_name_prefix="freesound-search"
+)
+# A keyword already queued or running is not searched again by concurrent requests
+_searches = CoalescingExecutor("freesound_submit", _search_executor)
+# Keep enough pooled connections for every search thread to reuse one
+http_client.get_session("freesound", pool_maxsize=max(FREESOUND_MAX_CONCURRENCY, http_client.HTTP_POOL_MAXSIZE))
 
-def search_freesound(keywords, max_per_keyword=3):
+def _search_key(query, max_per_keyword):
+    '''Key shared by identical searches, or None for a query without any word.'''
+    key = normalize_query(query)
+    return (key, max_per_keyword) if key else None
+
+# Identical keywords searched at the same time (by search_freesound or the
+# pipeline, in this or another worker) share one FreeSound call
+@coalesce("freesound_search", _search_key)
+def _search_keyword(query, max_per_keyword):
     '''
-    Perform multiple queries to FreeSound (one per keyword).
-    Then combine results, removing duplicates if desired.
+    Search FreeSound for one keyword and return its top results. The local
+    index grows with every response; if FreeSound fails, whatever the index
+    knows about the query is served instead, even if stale.
     '''
-    all_results = []
+    index = get_index()
+    results = _fetch_search(query)
+    if results is None:
+        # FreeSound unavailable: serve whatever the index knows, even if stale
+        mark_degraded("freesound")
+        if index is None:
+            return []
+        results = index.lookup(query, allow_stale=True) or index.search(query)
+        metrics.FREESOUND_LOCAL_RESULTS.inc(source="fallback")
+    elif index is not None:
+        index.record(query, results)
+        # Embed the new sounds for semantic retrieval in the background
+        schedule_refresh()
 
-    for kw in keywords:
-        query = kw.strip() # remove spaces
-        if not query:
-            continue
-        
-        # Construct API endpoint URL with token
-        url = f"https://freesound.org/apiv2/search/text/?token={FREESOUND_API_KEY}"
-        # Set query parameters for the API request
-        params = {
-            "query": query,
-            "fields": "id,name,description,download,previews", # Request only needed fields
-            "sort": "score" # Sort results by relevance score
-        }
-
-        try:
-            # Make HTTP request to Freesound API
-            response = requests.get(url, params=params) # GET request to freesound api
-            response.raise_for_status()  # Raise exception for HTTP errors
-        except requests.exceptions.RequestException as e:
-            print(f"FreeSound error searching for '{query}': {e}")
+    # Take top N distinct results for each keyword (max_per_keyword)
+    return _keep_results(results, max_per_keyword)
+
+def _resolve_locally(queries, max_per_keyword):
+    '''
+    Answer as many queries as possible without a network call: repeat and
+    near-repeat queries from the index first, then (when enabled) semantic
+    matches computed for all remaining queries in one batch.
+    Returns {query: results}.
+    '''
+    index = get_index()
+    if index is None:
+        return {}
+
+    local = {}
+    for query in queries:
+        results = index.lookup(query)
+        if results is not None:
+            local[query] = results
+            metrics.FREESOUND_LOCAL_RESULTS.inc(source="index")
+
+    missing = [query for query in queries if query not in local]
+    if missing:
+        for query, sound_ids in semantic_search(missing, k=max_per_keyword).items():
+            local[query] = index.get_sounds(sound_ids)
+            metrics.FREESOUND_LOCAL_RESULTS.inc(source="semantic")
+
+    # Local-only mode, or FreeSound's circuit is open: don't queue searches that would be shed
+    if FREESOUND_INDEX_MODE == "local-only" or not get_governor("freesound").available():
+        source = "local-only" if FREESOUND_INDEX_MODE == "local-only" else "circuit-open"
+        for query in queries:
+            if query not in local:
+                if source == "circuit-open":
+                    mark_degraded("freesound")
+                local[query] = index.lookup(query, allow_stale=True) or index.search(query)
+                metrics.FREESOUND_LOCAL_RESULTS.inc(source=source)
+
+    return {query: _keep_results(results, max_per_keyword) for query, results in local.items()}
+
+def _fetch_search(query):
+    '''
+    Run one FreeSound text search and return the raw result list,
+    or None if the request fails.
+    '''
+    # Construct API endpoint URL with token
+    url = f"{FREESOUND_API_URL}/search/text/?token={FREESOUND_API_KEY}"
+    # Set query parameters for the API request
+    params = {
+        "query": query,
+        "fields": "id,name,description,download,previews", # Request only needed fields
+        "sort": "score", # Sort results by relevance score
+        "page_size": FREESOUND_PAGE_SIZE # Only the first few results are ever used
+    }
+
+    try:
+        # Make HTTP request to Freesound API
+        response = http_client.get("freesound", url, params=params) # GET request through the pooled session
+        response.raise_for_status()  # Raise exception for HTTP errors
+    except UpstreamUnavailable as e:
+        # Shed by the governor: answer from the local index without waiting
+        logger.info("Skipping FreeSound search for '%s': %s", query, e)
+        return None
+    except requests.exceptions.RequestException as e:
+        logger.error("FreeSound error searching for '%s': %s", query, e)
+        return None
+
+    # Parse JSON response
+    try:
+        return response.json().get("results", [])
+    except (ValueError, AttributeError) as e:
+        logger.error("FreeSound returned an unreadable response for '%s': %s", query, e)
+        return None
+
+def _add_urls(results):
+    '''Add download and preview URLs with authentication token for each result.'''
+    for result in results:
+        if 'download' in result:
+            # Append API key to download URL for authentication
+            result['download'] = f"{result['download']}?token={FREESOUND_API_KEY}"
+
+        if 'previews' in result and 'preview-hq-mp3' in result['previews']:
+            # Extract high-quality MP3 preview URL
+            result['preview_url'] = result['previews']['preview-hq-mp3']
+    return results
+
+def _keep_results(results, max_per_keyword):
+    '''
+    The top `max_per_keyword` distinct results, with URLs added. Only these
+    are handed to the preview cache and the analysis pool, so previews of
+    results that are dropped are never downloaded.
+    '''
+    kept = dedupe_sounds(_add_urls(results), limit=max_per_keyword)
+    # Point previews at the local cache (when it is served publicly)
+    cache_previews(kept)
+    # Loudness and loop points are measured in the background, once per sound
+    schedule_analysis(kept)
+    return kept
+
+def submit_searches(keywords, max_per_keyword=3):
+    '''
+    Start one FreeSound search per non-empty keyword on the shared pool, except
+    for keywords the local index or semantic retrieval can answer directly.
+    Returns a list of (query, future) pairs in keyword order.
+    '''
+    queries = [kw.strip() for kw in keywords if kw.strip()] # remove spaces
+    local = _resolve_locally(queries, max_per_keyword)
+
+    searches = []
+    for query in queries:
+        if query in local:
+            # Answered without a network call; hand back an already finished future
+            future = Future()
+            future.set_result(local[query])
+        else:
+            key = _search_key(query, max_per_keyword)
+            if key is None:
+                # Unrelated wordless queries must not get each other's results
+                future = _search_executor.submit(carry_degraded(_search_keyword), query, max_per_keyword)
+            else:
+                future = _searches.submit(key, _search_keyword, query, max_per_keyword)
+        searches.append((query, future))
+    return searches
+
+def search_results(query, future):
+    '''
+    The results of a finished search future, or an empty list if the search
+    raised: one failing keyword must not fail the whole request.
+    '''
+    try:
+        return future.result()
+    except Exception:
+        logger.exception("FreeSound search for '%s' failed", query)
+        return []
+
+def search_freesound(keywords, max_per_keyword=3, deadline=None):
+    '''
+    Perform multiple queries to FreeSound (one per keyword) concurrently.
+    Results are combined in keyword order without duplicates (the same id, or
+    another take of a sound already listed); searches still running after
+    `deadline` seconds (FREESOUND_SEARCH_DEADLINE by default) are cancelled
+    and contribute nothing.
+    '''
+    if deadline is None:
+        deadline = FREESOUND_SEARCH_DEADLINE
+
+    searches = submit_searches(keywords, max_per_keyword)
+    futures = [future for _, future in searches]
+    wait(futures, timeout=deadline)
+
+    all_results = []
+    for query, future in searches:
+        if not future.done():
+            # Cancel queued searches; a request already in flight is simply ignored
+            future.cancel()
+            logger.warning("FreeSound search for '%s' missed the %ss deadline.", query, deadline)
             continue
+        all_results.extend(search_results(query, future))
 
-        # Parse JSON response
-        data = response.json()
-        results = data.get("results", [])
-
-        # Add download and preview URLs with authentication token for each result
-        for result in results:
-            if 'download' in result:
-                # Append API key to download URL for authentication
-                result['download'] = f"{result['download']}?token={FREESOUND_API_KEY}"
-            
-            if 'previews' in result and 'preview-hq-mp3' in result['previews']:
-                # Extract high-quality MP3 preview URL
-                result['preview_url'] = result['previews']['preview-hq-mp3']
-        
-        # Take top N results for each keyword (max_per_keyword)
-        top_n = results[:max_per_keyword]
-        all_results.extend(top_n)
-        
     # Return final results as a dictionary
-    return {"results": all_results}
\ No newline at end of file
+    return {"results": dedupe_sounds(all_results)}
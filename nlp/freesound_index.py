@@ -0,0 +1,159 @@
+import re
+import json
+import time
+import sqlite3
+from sqlite_store import SQLiteStore, store_getter
+from config import settings
+
+# Where the local FreeSound metadata index lives
+FREESOUND_INDEX_PATH = settings.freesound_index_path
+# "read-through" answers repeat queries locally and fills the index from FreeSound,
+# "local-only" never calls FreeSound (tests, offline work), "off" disables the index
+FREESOUND_INDEX_MODE = settings.freesound_index_mode
+# Seconds before a stored query is refreshed from FreeSound (default: one week)
+FREESOUND_INDEX_TTL = settings.freesound_index_ttl
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def normalize_query(query: str) -> str:
+    """
+    Key used for repeat and near-repeat queries: casefolded words in any
+    script without punctuation, trailing plural "s" and word order, so
+    "Ocean waves", "ocean wave" and "waves, ocean" share one entry. A query
+    without any word (only punctuation) gives "", which callers must not
+    use as a shared key.
+    """
+    words = set()
+    for word in _WORD_RE.findall(query.casefold()):
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.add(word)
+    return " ".join(sorted(words))
+
+class FreesoundIndex(SQLiteStore):
+    """
+    SQLite index of the sounds FreeSound has returned to search_freesound.
+
+    `sounds` holds one row per FreeSound id (with an FTS5 table over name and
+    description), and `queries` remembers which ids each normalized query
+    returned, in FreeSound's ranking order, and when it was fetched.
+    """
+
+    row_factory = sqlite3.Row
+
+    def __init__(self, path=FREESOUND_INDEX_PATH, ttl=FREESOUND_INDEX_TTL):
+        super().__init__(path)
+        self.ttl = ttl
+        self._create_schema(self._connection())
+
+    @staticmethod
+    def _create_schema(conn):
+        with conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sounds (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    download TEXT,
+                    previews TEXT,
+                    updated_at REAL NOT NULL
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS sounds_fts USING fts5(name, description);
+                CREATE TABLE IF NOT EXISTS queries (
+                    query TEXT PRIMARY KEY,
+                    sound_ids TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                );
+            """)
+
+    def record(self, query: str, results):
+        """
+        Store the raw results of a FreeSound search (before any token is added
+        to their URLs) and remember them as the answer for `query`.
+        """
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            for result in results:
+                sound_id = result.get("id")
+                if sound_id is None:
+                    continue
+                name = result.get("name", "")
+                description = result.get("description", "")
+                conn.execute(
+                    "INSERT OR REPLACE INTO sounds (id, name, description, download, previews, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (sound_id, name, description, result.get("download"), json.dumps(result.get("previews", {})), now)
+                )
+                conn.execute("DELETE FROM sounds_fts WHERE rowid = ?", (sound_id,))
+                conn.execute(
+                    "INSERT INTO sounds_fts (rowid, name, description) VALUES (?, ?, ?)",
+                    (sound_id, name, description)
+                )
+            key = normalize_query(query)
+            if not key:
+                # Every wordless query would share the "" entry
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO queries (query, sound_ids, fetched_at) VALUES (?, ?, ?)",
+                (key, json.dumps([r.get("id") for r in results if r.get("id") is not None]), now)
+            )
+
+    def lookup(self, query: str, allow_stale=False):
+        """
+        Results previously returned for this (normalized) query, in their original
+        order, or None if the query is unknown or older than the TTL.
+        """
+        key = normalize_query(query)
+        if not key:
+            return None
+        row = self._connection().execute(
+            "SELECT sound_ids, fetched_at FROM queries WHERE query = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if not allow_stale and time.time() - row["fetched_at"] > self.ttl:
+            return None
+        return self.get_sounds(json.loads(row["sound_ids"]))
+
+    def get_sounds(self, sound_ids):
+        """Stored sounds for the given ids, in the same order; unknown ids are skipped."""
+        if not sound_ids:
+            return []
+        placeholders = ",".join("?" * len(sound_ids))
+        rows = self._connection().execute(
+            f"SELECT id, name, description, download, previews FROM sounds WHERE id IN ({placeholders})",
+            list(sound_ids)
+        ).fetchall()
+        by_id = {row["id"]: self._row_to_result(row) for row in rows}
+        return [by_id[sound_id] for sound_id in sound_ids if sound_id in by_id]
+
+    def list_sounds(self):
+        """(id, name, description) rows for every stored sound."""
+        return self._connection().execute("SELECT id, name, description FROM sounds").fetchall()
+
+    def search(self, query: str, limit: int = 15):
+        """Full-text search over every stored sound, best bm25 match first."""
+        words = normalize_query(query).split()
+        if not words:
+            return []
+        # Prefix-match every word so "wave" also finds "waves"
+        match = " ".join(f'"{word}"*' for word in words)
+        rows = self._connection().execute(
+            "SELECT s.id, s.name, s.description, s.download, s.previews "
+            "FROM sounds_fts JOIN sounds s ON s.id = sounds_fts.rowid "
+            "WHERE sounds_fts MATCH ? ORDER BY bm25(sounds_fts) LIMIT ?",
+            (match, limit)
+        ).fetchall()
+        return [self._row_to_result(row) for row in rows]
+
+    @staticmethod
+    def _row_to_result(row):
+        result = {"id": row["id"], "name": row["name"], "description": row["description"]}
+        if row["download"]:
+            result["download"] = row["download"]
+        result["previews"] = json.loads(row["previews"] or "{}")
+        return result
+
+# The process-wide index, or None when FREESOUND_INDEX_MODE is "off" or it cannot be opened
+get_index = store_getter(FreesoundIndex, lambda: FREESOUND_INDEX_MODE != "off", "FreeSound index")
@@ -0,0 +1,279 @@
+import time
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class UpstreamUnavailable(Exception):
+    """
+    Raised instead of calling an upstream whose circuit is open, or that has
+    no rate or concurrency capacity left within the caller's wait. Callers
+    catch it to serve a degraded answer quickly.
+    """
+
+    def __init__(self, upstream, reason):
+        super().__init__(f"{upstream} unavailable ({reason})")
+        self.upstream = upstream
+        self.reason = reason
+
+class TokenBucket:
+    """
+    Token bucket whose refill rate adapts to the upstream: it halves on a 429
+    and climbs back towards the configured rate in small steps on success.
+    """
+
+    def __init__(self, rate, burst, min_rate=None):
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 20
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout) -> bool:
+        """Take one token, waiting up to `timeout` seconds for it."""
+        expires_at = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > expires_at:
+                return False
+            time.sleep(wait)
+
+    def throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, then lets a single probe through (half-open):
+    a successful probe closes the circuit, a failed one opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def available(self) -> bool:
+        """False while the circuit is open and not yet due for a half-open probe."""
+        with self._lock:
+            return self.state != self.OPEN or time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def release_probe(self):
+        """Give the half-open probe back when the call was never made."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                if self.state != self.OPEN:
+                    self._set_state(self.OPEN)
+
+    def _set_state(self, state):
+        logger.warning("Circuit for %s is now %s", self.name, state)
+        self.state = state
+        metrics.CIRCUIT_TRANSITIONS.inc(upstream=self.name, state=state)
+
+class Governor:
+    """
+    Client-side guard for one upstream API key: an adaptive token bucket, a
+    cap on concurrent calls and a circuit breaker. Use it around every call:
+
+        with get_governor("mistral").call() as outcome:
+            response = ...
+            outcome["status"] = response.status_code
+
+    Rejections raise UpstreamUnavailable without touching the network.
+    """
+
+    def __init__(self, name, rate, burst, max_concurrency, failure_threshold, reset_timeout, max_wait):
+        self.name = name
+        self.max_wait = max_wait
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def available(self) -> bool:
+        """
+        False while the circuit is open, so optional work can be skipped up
+        front. Once `reset_timeout` has passed it is True again, so a call gets
+        through to probe the upstream.
+        """
+        return self.breaker.available()
+
+    @contextmanager
+    def call(self, max_wait=None):
+        """
+        Admit one call, waiting up to `max_wait` seconds (GOVERNOR_MAX_WAIT by
+        default) for rate and concurrency capacity. Pass max_wait=0 for optional
+        calls that should be shed immediately under load.
+
+        A call abandoned part way (a stream closed because its client went
+        away) still frees its slot: it counts as a success if the caller set
+        outcome["status"] before leaving, otherwise it only gives back a
+        half-open probe.
+        """
+        if not self.breaker.allow():
+            self._reject("circuit_open")
+        wait = self.max_wait if max_wait is None else max_wait
+        start = time.monotonic()
+        if not self.bucket.acquire(wait):
+            self.breaker.release_probe()
+            self._reject("rate_limited")
+        if not self._slots.acquire(timeout=max(0.0, wait - (time.monotonic() - start))):
+            self.breaker.release_probe()
+            self._reject("concurrency")
+
+        outcome = {"status": None}
+        try:
+            yield outcome
+        except Exception as e:
+            self._record(getattr(e, "status_code", None), failed=True)
+            raise
+        except BaseException:
+            # GeneratorExit and the like: the caller gave up, which says nothing bad about the upstream
+            if outcome["status"] is not None:
+                self._record(outcome["status"], failed=False)
+            else:
+                self.breaker.release_probe()
+            raise
+        else:
+            self._record(outcome["status"], failed=False)
+        finally:
+            self._slots.release()
+
+    def _reject(self, reason):
+        metrics.GOVERNOR_REJECTIONS.inc(upstream=self.name, reason=reason)
+        raise UpstreamUnavailable(self.name, reason)
+
+    def _record(self, status, failed):
+        status = int(status) if status else None
+        if status == 429:
+            # Throttled: slow down and count it against the circuit
+            self.bucket.throttle()
+            self.breaker.record_failure()
+        elif (status and status >= 500) or (failed and status is None):
+            # Server error, timeout or connection failure
+            self.breaker.record_failure()
+        else:
+            self.bucket.recover()
+            self.breaker.record_success()
+
+# Reasons the answer being built is degraded (a fallback was served instead of
+# an upstream result), so the response can say so
+_degraded = contextvars.ContextVar("degraded", default=None)
+
+@contextmanager
+def degraded_scope(reasons=None):
+    """
+    Collect the mark_degraded() calls made inside the block into a list,
+    which it yields. Pass an existing list to resume collecting into it (e.g.
+    on each step of a generator).
+    """
+    reasons = [] if reasons is None else reasons
+    token = _degraded.set(reasons)
+    try:
+        yield reasons
+    finally:
+        _degraded.reset(token)
+
+def degraded_reasons():
+    """The list collecting the current scope's reasons, or None outside a scope."""
+    return _degraded.get()
+
+def mark_degraded(reason):
+    """Record that a fallback was served for `reason` (e.g. "track_names")."""
+    reasons = _degraded.get()
+    if reasons is not None and reason not in reasons:
+        reasons.append(reason)
+
+def carry_degraded(fn):
+    """Bind `fn` to the caller's degraded scope, for running on another thread."""
+    reasons = _degraded.get()
+    if reasons is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        with degraded_scope(reasons):
+            return fn(*args, **kwargs)
+    return run
+
+# One API key per upstream, so one governor per upstream name
+_GOVERNOR_SETTINGS = {
+    "mistral": dict(rate=settings.mistral_rate_limit, burst=settings.mistral_burst,
+                    max_concurrency=settings.mistral_max_concurrency),
+    "freesound": dict(rate=settings.freesound_rate_limit, burst=settings.freesound_burst,
+                      max_concurrency=settings.freesound_max_concurrency),
+    "unsplash": dict(rate=settings.unsplash_rate_limit, burst=settings.unsplash_burst,
+                     max_concurrency=settings.unsplash_max_concurrency),
+}
+_DEFAULT_GOVERNOR_SETTINGS = dict(rate=10.0, burst=20, max_concurrency=settings.http_pool_maxsize)
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+def get_governor(name) -> Governor:
+    """Return the shared governor for an upstream, creating it on first use."""
+    governor = _governors.get(name)
+    if governor is not None:
+        return governor
+
+    with _governors_lock:
+        if name not in _governors:
+            _governors[name] = Governor(
+                name,
+                failure_threshold=settings.circuit_failure_threshold,
+                reset_timeout=settings.circuit_reset_timeout,
+                max_wait=settings.governor_max_wait,
+                **_GOVERNOR_SETTINGS.get(name, _DEFAULT_GOVERNOR_SETTINGS)
+            )
+        return _governors[name]
@@ -0,0 +1,85 @@
+import threading
+import requests
+import metrics
+from governor import get_governor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import settings
+
+# Connection pool sizing for each upstream session
+HTTP_POOL_CONNECTIONS = settings.http_pool_connections
+HTTP_POOL_MAXSIZE = settings.http_pool_maxsize
+# Connect and read timeouts (seconds) applied to every request
+HTTP_CONNECT_TIMEOUT = settings.http_connect_timeout
+HTTP_READ_TIMEOUT = settings.http_read_timeout
+# Retry policy for throttling and transient server errors
+HTTP_MAX_RETRIES = settings.http_max_retries
+HTTP_BACKOFF_FACTOR = settings.http_backoff_factor
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Longest wait (seconds) before a retry, whatever Retry-After asks for: the worker
+# holds a governor slot while it sleeps, and the governor throttles on the final 429
+HTTP_RETRY_AFTER_MAX = settings.http_retry_after_max
+
+DEFAULT_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+class _CappedRetry(Retry):
+    """Retry whose Retry-After and backoff sleeps never exceed HTTP_RETRY_AFTER_MAX."""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, HTTP_RETRY_AFTER_MAX)
+
+def _build_session(pool_maxsize):
+    '''
+    Create a keep-alive session whose adapter retries idempotent requests
+    with exponential backoff on 429/5xx responses and connection errors.
+    '''
+    retry = _CappedRetry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        backoff_max=HTTP_RETRY_AFTER_MAX,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+        raise_on_status=False # Hand the final response to raise_for_status()
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=pool_maxsize,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_session(name, pool_maxsize=None):
+    '''
+    Return the shared session for an upstream (e.g. "freesound", "unsplash"),
+    creating it on first use. Sessions are reused for the life of the process
+    so TCP and TLS connections are kept alive between calls.
+    '''
+    session = _sessions.get(name)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        if name not in _sessions:
+            _sessions[name] = _build_session(pool_maxsize or HTTP_POOL_MAXSIZE)
+        return _sessions[name]
+
+def get(name, url, timeout=None, **kwargs):
+    '''
+    GET through the pooled session for `name`, always with a timeout so a
+    hung upstream cannot block a worker forever. The call is admitted by the
+    upstream's governor (which raises governor.UpstreamUnavailable when it is
+    shed), then counted and timed in the upstream metrics under `name`.
+    '''
+    with get_governor(name).call() as outcome, metrics.upstream_call(name) as call:
+        response = get_session(name).get(url, timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+        outcome["status"] = response.status_code
+        call["status"] = str(response.status_code)
+    return response
@@ -0,0 +1,144 @@
+import re
+import math
+import logging
+from collections import Counter
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Knowledge base chunks sent to the LLM with each chat question
+CHAT_TOP_K = settings.chat_top_k
+# Term overlap (0-1) a question needs with a FAQ entry to be answered from it
+# directly (on top of using no content word the entry lacks); set above 1 to
+# always ask the LLM
+CHAT_FAQ_MIN_SCORE = settings.chat_faq_min_score
+
+# BM25 parameters (the usual defaults)
+_K1 = 1.5
+_B = 0.75
+
+_HEADING_RE = re.compile(r"^([A-Z][\w ]*):$")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+    a an and are as at be by can could do does for from have how i if in is it its me my
+    of on or our should so that the their there them they this to we what when where which
+    who why will with would you your please tell about
+""".split())
+
+def tokenize(text: str) -> list:
+    """Lowercase content words of `text`, with plural "s" stripped so "sounds" matches "sound"."""
+    terms = []
+    for word in _WORD_RE.findall(text.lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+def split_chunks(text: str) -> list:
+    """
+    Split the knowledge base into retrievable chunks: one per blank-line
+    separated block, tagged with its section heading. Blocks of the form
+    "Q: ...\\nA: ..." also carry their question and answer.
+    """
+    chunks, section, block = [], "", []
+
+    def flush():
+        if not block:
+            return
+        body = "\n".join(block)
+        chunk = {"section": section, "text": f"{section}:\n{body}" if section else body}
+        if block[0].startswith("Q:") and len(block) > 1 and block[1].startswith("A:"):
+            chunk["question"] = block[0][2:].strip()
+            chunk["answer"] = " ".join(line.strip() for line in block[1:])[2:].strip()
+        chunks.append(chunk)
+        block.clear()
+
+    for line in text.strip().splitlines():
+        line = line.strip()
+        heading = _HEADING_RE.match(line)
+        if heading:
+            flush()
+            section = heading.group(1)
+        elif not line:
+            flush()
+        else:
+            block.append(line)
+    flush()
+    # The title line on its own says nothing
+    return [chunk for chunk in chunks if chunk["section"]]
+
+class KnowledgeIndex:
+    """
+    BM25 index over the chat knowledge base, built once in memory.
+
+    search() ranks chunks for a question; faq_answer() returns a FAQ answer
+    verbatim when the question is essentially one of the FAQ questions, so the
+    most common chat traffic needs no LLM call at all.
+    """
+
+    def __init__(self, text, faq_min_score=CHAT_FAQ_MIN_SCORE):
+        self.chunks = split_chunks(text)
+        self.faq_min_score = faq_min_score
+        self._terms = [Counter(tokenize(chunk["text"])) for chunk in self.chunks]
+        self._lengths = [sum(terms.values()) for terms in self._terms]
+        self._avg_length = sum(self._lengths) / max(1, len(self._lengths))
+        document_frequency = Counter(term for terms in self._terms for term in terms)
+        n = len(self.chunks)
+        self._idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+        self._faqs = [
+            (set(tokenize(chunk["question"])), chunk)
+            for chunk in self.chunks if "question" in chunk
+        ]
+        logger.info("Knowledge index built: %d chunks, %d FAQ entries", n, len(self._faqs))
+
+    def search(self, query: str, k: int = CHAT_TOP_K) -> list:
+        """The `k` best matching chunks for `query`, best first (fewer if fewer match)."""
+        query_terms = set(tokenize(query))
+        scored = []
+        for i, terms in enumerate(self._terms):
+            score = 0.0
+            norm = _K1 * (1 - _B + _B * self._lengths[i] / self._avg_length)
+            for term in query_terms:
+                tf = terms.get(term)
+                if tf:
+                    score += self._idf[term] * tf * (_K1 + 1) / (tf + norm)
+            if score > 0:
+                scored.append((score, i))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [self.chunks[i] for _, i in scored[:k]]
+
+    def context(self, query: str, k: int = CHAT_TOP_K) -> str:
+        """
+        Knowledge base text to send with `query`: its top-k chunks in knowledge
+        base order, or the overview when nothing matches.
+        """
+        chunks = self.search(query, k) or self.chunks[:1]
+        ordered = sorted(chunks, key=self.chunks.index)
+        return "\n\n".join(chunk["text"] for chunk in ordered)
+
+    def faq_answer(self, query: str):
+        """
+        The stored answer when `query` matches a FAQ question closely enough,
+        else None: every content word of `query` must be in the FAQ question
+        (so "save to Dropbox" is not answered as "save"), and the F1 of their
+        content words must be at least faq_min_score.
+        """
+        query_terms = set(tokenize(query))
+        if not query_terms:
+            return None
+        best_score, best = 0.0, None
+        for question_terms, chunk in self._faqs:
+            if not query_terms <= question_terms:
+                continue
+            common = len(query_terms)
+            score = 2 * common / (len(query_terms) + len(question_terms))
+            if score > best_score:
+                best_score, best = score, chunk
+        if best is None or best_score < self.faq_min_score:
+            return None
+        return best["answer"]
@@ -0,0 +1,143 @@
+import time
+import hashlib
+import logging
+import threading
+import metrics
+from collections import OrderedDict
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Size and lifetime of the in-process tier
+LLM_CACHE_MAXSIZE = settings.llm_cache_maxsize
+LLM_CACHE_TTL = settings.llm_cache_ttl
+# Set LLM_CACHE_ENABLED=0 to always call the model
+LLM_CACHE_ENABLED = settings.llm_cache_enabled
+# Optional shared tier, e.g. redis://redis:6379/0
+REDIS_URL = settings.redis_url
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace and case so trivially different prompts share an entry."""
+    return " ".join(prompt.split()).lower()
+
+def cache_key(model: str, prompt: str) -> str:
+    """Content address for a (model, normalized prompt) pair."""
+    digest = hashlib.sha256(f"{model}\n{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+    return f"llm:{digest}"
+
+_redis_clients = {}
+_redis_clients_lock = threading.Lock()
+
+def connect_redis(redis_url):
+    """
+    Shared Redis client for `redis_url`, or None when the redis package is not
+    installed. Clients are created once per URL so every user shares one pool.
+    """
+    with _redis_clients_lock:
+        if redis_url not in _redis_clients:
+            try:
+                import redis
+            except ImportError:
+                logger.warning("REDIS_URL is set but the redis package is not installed; using in-process state only.")
+                _redis_clients[redis_url] = None
+            else:
+                _redis_clients[redis_url] = redis.Redis.from_url(
+                    redis_url, socket_timeout=0.5, socket_connect_timeout=0.5
+                )
+        return _redis_clients[redis_url]
+
+class LLMCache:
+    """
+    Two-tier cache for raw LLM completions.
+
+    The first tier is an in-process LRU with a TTL. The second, optional tier is
+    Redis, shared by every worker; it is only used when a Redis URL is given and
+    the redis package is installed, and any Redis error degrades to a miss.
+    """
+
+    def __init__(self, maxsize=LLM_CACHE_MAXSIZE, ttl=LLM_CACHE_TTL, redis_url=REDIS_URL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, text)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self._redis = connect_redis(redis_url) if redis_url else None
+
+    def get(self, model: str, prompt: str):
+        """Return the cached completion text, or None on a miss."""
+        key = cache_key(model, prompt)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, text = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    metrics.LLM_CACHE_LOOKUPS.inc(result="hit")
+                    return text
+                del self._entries[key]
+
+        if self._redis is not None:
+            try:
+                value = self._redis.get(key)
+            except Exception as e:
+                logger.warning("Redis LLM cache read failed: %s", e)
+                value = None
+            if value is not None:
+                text = value.decode("utf-8")
+                self._store_local(key, text, now)
+                with self._lock:
+                    self.redis_hits += 1
+                metrics.LLM_CACHE_LOOKUPS.inc(result="redis_hit")
+                return text
+
+        with self._lock:
+            self.misses += 1
+        metrics.LLM_CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    def set(self, model: str, prompt: str, text: str):
+        """Store a completion in both tiers."""
+        key = cache_key(model, prompt)
+        self._store_local(key, text, time.monotonic())
+
+        if self._redis is not None:
+            try:
+                self._redis.set(key, text.encode("utf-8"), ex=self.ttl)
+            except Exception as e:
+                logger.warning("Redis LLM cache write failed: %s", e)
+
+    def _store_local(self, key, text, now):
+        with self._lock:
+            self._entries[key] = (now + self.ttl, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every local entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.redis_hits = self.misses = 0
+
+    def stats(self) -> dict:
+        """Hit/miss counters for diagnostics."""
+        with self._lock:
+            lookups = self.hits + self.redis_hits + self.misses
+            return {
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.redis_hits) / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "redis": self._redis is not None,
+            }
+
+# Process-wide cache used by nlp_model
+llm_cache = LLMCache()
+
+metrics.Gauge("nlp_llm_cache_entries", "Entries in the in-process LLM cache.", lambda: llm_cache.stats()["size"])
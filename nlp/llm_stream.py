@@ -0,0 +1,143 @@
+import re
+import json
+from structured_output import parse_json, StructuredOutputError
+
+# Characters of prose without an opening brace after which an answer is
+# treated as plain text rather than a preamble to the JSON object
+_PLAIN_TEXT_AFTER = 200
+
+class JsonFieldStreamer:
+    """
+    Incremental parser for a streamed LLM answer of the form {"<field>": "..."}.
+
+    feed() takes raw text deltas as they arrive and returns whatever new text of
+    the field's string value can be decoded so far, so callers can forward it
+    token by token. Code fences, whitespace and a short preamble ("Sure, here
+    it is:") before the object are tolerated; if the model answers in plain
+    text instead of JSON, the text itself is forwarded. flush() returns any text
+    still held back when the stream ends, and result() the complete value.
+    """
+
+    def __init__(self, field, task="default"):
+        self.field = field
+        self.task = task
+        self.buffer = ""
+        self.mode = "detect"  # detect -> json | plain
+        self._key_pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._value_pos = None  # index in buffer of the next undecoded value character
+        self._value_done = False
+        self._value = []
+
+    def feed(self, chunk: str) -> str:
+        """Add a text delta and return the newly decoded part of the field value."""
+        if not chunk:
+            return ""
+        self.buffer += chunk
+
+        if self.mode == "detect":
+            # Skip whitespace and ```json fences before deciding what the model is doing
+            head = self.buffer.lstrip()
+            if "```".startswith(head):
+                return ""
+            if head.startswith("```"):
+                newline = head.find("\n")
+                if newline == -1:
+                    return ""
+                head = head[newline + 1:].lstrip()
+            if not head:
+                return ""
+            if "{" in head:
+                self.mode = "json"
+            elif len(head) >= _PLAIN_TEXT_AFTER:
+                self.mode = "plain"
+                return self.buffer.lstrip()
+            else:
+                # Could still be a preamble to the JSON object
+                return ""
+
+        if self.mode == "plain":
+            return chunk
+
+        return self._decode_value()
+
+    def flush(self) -> str:
+        """At the end of the stream, the short plain-text answer held back while detecting."""
+        if self.mode != "detect" or "{" in self.buffer:
+            return ""
+        self.mode = "plain"
+        return self.buffer.strip()
+
+    def _decode_value(self) -> str:
+        if self._value_done:
+            return ""
+        if self._value_pos is None:
+            match = self._key_pattern.search(self.buffer)
+            if not match:
+                return ""
+            self._value_pos = match.end()
+
+        decoded = []
+        pos = self._value_pos
+        while pos < len(self.buffer):
+            char = self.buffer[pos]
+            if char == '"':
+                self._value_done = True
+                pos += 1
+                break
+            if char == "\\":
+                # Wait for the whole escape sequence before decoding it
+                escape_len = 6 if self.buffer[pos + 1:pos + 2] == "u" else 2
+                if pos + escape_len > len(self.buffer):
+                    break
+                try:
+                    decoded.append(json.loads('"%s"' % self.buffer[pos:pos + escape_len]))
+                except json.JSONDecodeError:
+                    decoded.append(self.buffer[pos + 1:pos + escape_len])
+                pos += escape_len
+                continue
+            decoded.append(char)
+            pos += 1
+
+        self._value_pos = pos
+        text = "".join(decoded)
+        self._value.append(text)
+        return text
+
+    def result(self):
+        """
+        The final field value after the stream has ended: parsed from the full
+        buffer (repaired if the stream was cut short), otherwise the
+        incrementally decoded value. Returns None if the model answered with
+        JSON that has no such field.
+        """
+        raw_text = self.buffer.strip()
+        if self.mode == "plain":
+            return raw_text
+
+        try:
+            data = parse_json(raw_text, {"type": "object"}, task=self.task)
+        except StructuredOutputError:
+            return "".join(self._value) if self._value_pos is not None else raw_text
+        return data.get(self.field)
+
+def iter_field_events(deltas, field, task="default"):
+    """
+    Turn a stream of raw LLM text deltas into API events:
+    {"event": "token", "text": ...} per decoded piece of `field`, then
+    {"event": "done", field: <final value or None>}.
+    """
+    streamer = JsonFieldStreamer(field, task)
+    try:
+        for delta in deltas:
+            text = streamer.feed(delta)
+            if text:
+                yield {"event": "token", "text": text}
+    finally:
+        # Closed early (client gone): close the upstream stream now rather than at garbage collection
+        close = getattr(deltas, "close", None)
+        if close is not None:
+            close()
+    text = streamer.flush()
+    if text:
+        yield {"event": "token", "text": text}
+    yield {"event": "done", field: streamer.result()}
@@ -0,0 +1,319 @@
+"""
+In-process metrics for the NLP service, served in the Prometheus text format
+by GET /metrics.
+
+Counters and histograms are plain dicts behind a lock, so recording a sample
+costs a few microseconds and instrumentation can stay on in production. Each
+worker process keeps its own values, and a scrape only reaches one worker
+behind the shared port. With METRICS_MULTIPROC_DIR set, every worker also
+writes its counters and histograms to its own file in that directory (at most
+every METRICS_FLUSH_INTERVAL seconds) and /metrics reports their sum over all
+files, including those of workers that have exited, so counters never go
+backwards. Gauges are read from the scraped worker only. Empty the directory
+before the workers start.
+"""
+import os
+import copy
+import json
+import time
+import uuid
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+MULTIPROC_DIR = settings.metrics_multiproc_dir
+FLUSH_INTERVAL = settings.metrics_flush_interval
+
+# Latency buckets (seconds) shared by every histogram
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self, values=None):
+        """Exposition lines for this process's values, or for `values` summed over workers."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        lines.extend(self._render_samples(sorted(values.items())))
+        return lines
+
+    def snapshot(self):
+        """JSON-serializable copy of the values: [[label values, value], ...]."""
+        with self._lock:
+            return [[list(key), copy.deepcopy(value)] for key, value in self._values.items()]
+
+class Counter(_Metric):
+    """Monotonic count, e.g. upstream calls or tokens."""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        _changed()
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    @staticmethod
+    def merge(total, value):
+        return value if total is None else total + value
+
+    def _render_samples(self, items):
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+class Histogram(_Metric):
+    """Distribution of durations in seconds, with cumulative buckets."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last slot is +Inf), sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+        _changed()
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return value
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1]]
+
+    def _render_samples(self, items):
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+class Gauge(_Metric):
+    """Value read from a callback at scrape time, e.g. a cache size."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, callback):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def render(self, values=None):
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", f"{self.name} {value}"]
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    merged = _read_workers() if MULTIPROC_DIR else {}
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render(merged.get(metric.name) if MULTIPROC_DIR else None))
+    return "\n".join(lines) + "\n"
+
+# Multi-process mode: this worker's sample file, rewritten by a flusher thread
+# when something changed. Checked against the pid so a forked worker gets its own.
+_worker = {"pid": None, "path": None, "dirty": False}
+_worker_lock = threading.Lock()
+
+def _changed():
+    if not MULTIPROC_DIR:
+        return
+    _worker["dirty"] = True
+    if _worker["pid"] != os.getpid():
+        _start_flusher()
+
+def _start_flusher():
+    with _worker_lock:
+        if _worker["pid"] == os.getpid():
+            return
+        _worker["pid"] = os.getpid()
+        # Unique per process start, so a reused pid never overwrites an exited worker's totals
+        _worker["path"] = os.path.join(MULTIPROC_DIR, f"worker_{os.getpid()}_{uuid.uuid4().hex}.json")
+    threading.Thread(target=_flush_forever, name="metrics-flush", daemon=True).start()
+
+def _flush_forever():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        if _worker["dirty"]:
+            _flush()
+
+def _flush():
+    """Write this worker's counters and histograms to its file in MULTIPROC_DIR."""
+    _worker["dirty"] = False
+    samples = {metric.name: metric.snapshot() for metric in _registry if metric.kind != "gauge"}
+    path = _worker["path"]
+    try:
+        os.makedirs(MULTIPROC_DIR, exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(samples, f)
+        # Readers never see a half-written file
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logger.warning("Could not write metrics to %s: %s", path, e)
+
+def _read_workers():
+    """{metric name: {label values: value}} summed over every worker's file."""
+    if _worker["pid"] == os.getpid():
+        # Include what this worker recorded since its last flush
+        _flush()
+    kinds = {metric.name: type(metric) for metric in _registry}
+    merged = {}
+    try:
+        names = [name for name in os.listdir(MULTIPROC_DIR) if name.endswith(".json")]
+    except OSError:
+        names = []
+    for name in names:
+        try:
+            with open(os.path.join(MULTIPROC_DIR, name)) as f:
+                samples = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric_name, items in samples.items():
+            kind = kinds.get(metric_name)
+            if kind is None:
+                continue
+            values = merged.setdefault(metric_name, {})
+            for key, value in items:
+                values[tuple(key)] = kind.merge(values.get(tuple(key)), value)
+    return merged
+
+# HTTP requests served by this process
+HTTP_REQUESTS = Counter("nlp_http_requests_total", "HTTP requests served.", ("route", "method", "status"))
+HTTP_LATENCY = Histogram("nlp_http_request_seconds", "Time to produce the response headers.", ("route",))
+
+# Pipeline stages (keywords, search, track_names, image)
+STAGE_LATENCY = Histogram("nlp_stage_seconds", "Duration of each pipeline stage.", ("stage",))
+
+# Calls to Mistral, FreeSound and Unsplash; status is the HTTP code or "error"
+UPSTREAM_REQUESTS = Counter("nlp_upstream_requests_total", "Calls to upstream APIs.", ("upstream", "status"))
+UPSTREAM_LATENCY = Histogram("nlp_upstream_request_seconds", "Upstream call latency.", ("upstream",))
+
+# Mistral token usage as reported in the API response, and estimated prompt sizes before sending
+LLM_TOKENS = Counter("nlp_llm_tokens_total", "LLM tokens used.", ("model", "task", "type"))
+PROMPT_TOKENS = Histogram(
+    "nlp_llm_prompt_tokens", "Estimated prompt tokens per LLM call.", ("task",),
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192)
+)
+LLM_BUDGET_EXCEEDED = Counter("nlp_llm_budget_exceeded_total", "Prompts refused for exceeding their task's token budget.", ("task",))
+
+# Structured LLM outputs: parsed as sent, repaired after truncation, or unusable
+LLM_PARSE_RESULTS = Counter("nlp_llm_parse_total", "Structured LLM outputs by parse result.", ("task", "result"))
+
+# Cache and local index effectiveness
+LLM_CACHE_LOOKUPS = Counter("nlp_llm_cache_lookups_total", "LLM cache lookups by result.", ("result",))
+TRACK_NAME_LOOKUPS = Counter(
+    "nlp_track_name_lookups_total", "Sounds named from the store (hit) or by Mistral (miss).", ("result",)
+)
+SOUND_DUPLICATES = Counter("nlp_sound_duplicates_total", "Search results dropped as duplicates.", ("kind",))
+FREESOUND_LOCAL_RESULTS = Counter(
+    "nlp_freesound_local_results_total", "FreeSound queries answered without a search call.", ("source",)
+)
+
+# Client-side governor: calls shed before reaching an upstream, circuit breaker state changes
+GOVERNOR_REJECTIONS = Counter("nlp_governor_rejections_total", "Upstream calls rejected locally.", ("upstream", "reason"))
+CIRCUIT_TRANSITIONS = Counter("nlp_circuit_transitions_total", "Circuit breaker state changes.", ("upstream", "state"))
+
+# Precomputed auto-keywords catalog
+CATALOG_POPS = Counter("nlp_catalog_pops_total", "Auto-keywords requests by catalog result.", ("result",))
+
+# Chat answers served straight from the FAQ index vs generated by the LLM
+CHAT_ANSWERS = Counter("nlp_chat_answers_total", "Chat answers by source.", ("source",))
+
+# FreeSound preview cache
+PREVIEW_CACHE_LOOKUPS = Counter(
+    "nlp_preview_cache_lookups_total", "Preview requests served from disk (hit) or downloaded first (miss).", ("result",)
+)
+PREVIEW_CACHE_BYTES_FETCHED = Counter("nlp_preview_cache_fetched_bytes_total", "Bytes of preview audio downloaded.")
+PREVIEW_CACHE_EVICTIONS = Counter("nlp_preview_cache_evictions_total", "Previews evicted from the disk cache.")
+
+# Sound analysis
+SOUND_ANALYSES = Counter(
+    "nlp_sound_analyses_total", "Preview analyses completed (ok), failed, or skipped with the queue full.", ("result",)
+)
+
+# Server-side mixdown
+MIX_SECONDS_RENDERED = Counter("nlp_mix_seconds_total", "Seconds of audio rendered by /api/mix.")
+
+# Single-flight coalescing: leaders do the work, followers share their result
+SINGLEFLIGHT_CALLS = Counter("nlp_singleflight_calls_total", "Coalesced calls by role.", ("name", "role"))
+
+@contextmanager
+def upstream_call(upstream):
+    """
+    Time one upstream call and count it by outcome. The block may set
+    `call["status"]` (e.g. to the HTTP status code); an exception counts as
+    the exception's status_code, or "error".
+    """
+    call = {"status": "200"}
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        call["status"] = str(getattr(e, "status_code", None) or "error")
+        raise
+    finally:
+        UPSTREAM_LATENCY.observe(time.perf_counter() - start, upstream=upstream)
+        UPSTREAM_REQUESTS.inc(upstream=upstream, status=call["status"])
+
+def record_usage(model, usage, task=""):
+    """Add the prompt and completion token counts from a Mistral `usage` object."""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+    completion_tokens = getattr(usage, "completion_tokens", None) or 0
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, model=model, task=task, type="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, model=model, task=task, type="completion")
@@ -0,0 +1,305 @@
+"""
+Server-side soundscape rendering: decode up to MIX_MAX_TRACKS sounds, apply
+each track's volume and pan, sum them and stream the encoded mix.
+
+ffmpeg does the decoding and encoding in subprocesses; the mixing itself is
+NumPy on fixed-size chunks of float32 samples, so memory stays at a few
+chunks per track however long the mix is, and encoded audio is sent while
+the rest is still being rendered. Volume and pan follow the Express
+mixer: volume in dB clamped to [-30, 0], pan in [-1, 1] scaling the left
+channel by (1 - pan) / 2 and the right by (1 + pan) / 2.
+"""
+import shutil
+import logging
+import threading
+import subprocess
+from urllib.parse import urlparse
+from collections import namedtuple
+import metrics
+from preview_cache import cached_sound_id, resolve_preview
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# ffmpeg binary used to decode the tracks and encode the mix
+FFMPEG_PATH = settings.ffmpeg_path
+MIX_SAMPLE_RATE = 44100
+MIX_CHANNELS = 2
+# Frames rendered per step; bounds memory (about 0.5 MB per track) and output latency
+MIX_CHUNK_FRAMES = 32768
+MIX_MAX_TRACKS = settings.mix_max_tracks
+MIX_DEFAULT_DURATION = settings.mix_default_duration
+MIX_MAX_DURATION = settings.mix_max_duration
+MIX_BITRATE = settings.mix_bitrate
+# Mixes rendered at once by this process; further requests are turned away
+MIX_MAX_CONCURRENCY = settings.mix_max_concurrency
+# Hosts track URLs may point at; the service must not fetch arbitrary addresses
+MIX_ALLOWED_HOSTS = settings.mix_allowed_hosts
+# Applied to the sum of the tracks, like the Express mixer's amix (1/n) plus volume=3.0
+MIX_HEADROOM = 3.0
+
+_BYTES_PER_FRAME = MIX_CHANNELS * 4
+_READ_SIZE = 64 * 1024
+
+MixTrack = namedtuple("MixTrack", ["source", "volume", "pan"])
+
+class MixError(Exception):
+    """A mix that cannot be rendered: bad tracks, no ffmpeg, or undecodable audio."""
+
+class MixBusy(MixError):
+    """MIX_MAX_CONCURRENCY mixes are already being rendered."""
+
+_mix_slots = threading.BoundedSemaphore(MIX_MAX_CONCURRENCY)
+
+def mix_available() -> bool:
+    """True when the ffmpeg binary is installed."""
+    return shutil.which(FFMPEG_PATH) is not None
+
+def parse_tracks(items):
+    """
+    MixTrack list from request items {"url", "volume" (dB), "pan"}.
+    Raises MixError for a missing, disallowed or malformed track.
+    """
+    if not isinstance(items, list) or not items:
+        raise MixError("'tracks' must be a non-empty list.")
+    if len(items) > MIX_MAX_TRACKS:
+        raise MixError(f"Too many tracks: at most {MIX_MAX_TRACKS} per mix.")
+
+    tracks = []
+    for index, item in enumerate(items, start=1):
+        if not isinstance(item, dict) or not isinstance(item.get("url"), str):
+            raise MixError(f"Track {index} needs a 'url'.")
+        url = urlparse(item["url"])
+        host = (url.hostname or "").lower()
+        allowed_host = any(host == allowed or host.endswith("." + allowed) for allowed in MIX_ALLOWED_HOSTS)
+        # Previews from this service's own cache are always allowed
+        if cached_sound_id(item["url"]) is None and (url.scheme not in ("http", "https") or not allowed_host):
+            raise MixError(f"Track {index} URL is not an allowed sound source.")
+        try:
+            volume = min(0.0, max(-30.0, float(item.get("volume", 0.0))))
+            pan = min(1.0, max(-1.0, float(item.get("pan", 0.0))))
+        except (TypeError, ValueError):
+            raise MixError(f"Track {index} has a non-numeric volume or pan.")
+        tracks.append(MixTrack(item["url"], volume, pan))
+    return tracks
+
+def track_weights(tracks):
+    """(tracks, 2) matrix of per-channel gains: linear volume times the pan law, with headroom."""
+    import numpy as np
+    volume = np.array([10 ** (track.volume / 20) for track in tracks], dtype=np.float32)
+    pan = np.array([track.pan for track in tracks], dtype=np.float32)
+    weights = np.stack([(1 - pan) / 2, (1 + pan) / 2], axis=1) * volume[:, None]
+    return weights * np.float32(MIX_HEADROOM / len(tracks))
+
+def _local_source(source):
+    """
+    Cached preview URLs (absolute or relative) are read from disk, fetched once
+    if need be, instead of over HTTP. Raises MixError for a preview the cache
+    has never seen.
+    """
+    sound_id = cached_sound_id(source)
+    if sound_id is None:
+        return source
+    path, fallback = resolve_preview(sound_id)
+    if path is None and fallback is None:
+        raise MixError(f"Unknown preview: {source}")
+    return path or fallback
+
+def _decoder(source, loop, sample_rate=MIX_SAMPLE_RATE, max_seconds=None):
+    """ffmpeg process writing `source` as interleaved float32 stereo to stdout (endlessly when looping)."""
+    command = [FFMPEG_PATH, "-nostdin", "-v", "error"]
+    if loop:
+        command += ["-stream_loop", "-1"]
+    command += ["-protocol_whitelist", "file,http,https,tcp,tls,crypto", "-i", source]
+    if max_seconds is not None:
+        command += ["-t", str(max_seconds)]
+    command += ["-f", "f32le", "-ac", str(MIX_CHANNELS), "-ar", str(sample_rate), "pipe:1"]
+    return subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+def decode_audio(source, sample_rate=MIX_SAMPLE_RATE, max_seconds=None):
+    """
+    Whole `source` (at most `max_seconds` of it) as a float32 array of shape
+    (frames, 2). Raises MixError if ffmpeg is missing or nothing decodes.
+    """
+    import numpy as np
+    if not mix_available():
+        raise MixError("Audio decoding is not available (ffmpeg not found).")
+    decoder = _decoder(source, loop=False, sample_rate=sample_rate, max_seconds=max_seconds)
+    try:
+        data = decoder.stdout.read()
+    finally:
+        _stop(decoder)
+    frames = len(data) // _BYTES_PER_FRAME
+    if not frames:
+        raise MixError("The sound could not be decoded.")
+    return np.frombuffer(data, dtype=np.float32, count=frames * MIX_CHANNELS).reshape(frames, MIX_CHANNELS)
+
+def _encoder():
+    command = [
+        FFMPEG_PATH, "-nostdin", "-v", "error",
+        "-f", "f32le", "-ac", str(MIX_CHANNELS), "-ar", str(MIX_SAMPLE_RATE), "-i", "pipe:0",
+        "-c:a", "libmp3lame", "-b:a", MIX_BITRATE, "-f", "mp3", "pipe:1",
+    ]
+    return subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+def _stop(process):
+    if process.poll() is None:
+        process.kill()
+    process.wait()
+    for stream in (process.stdin, process.stdout):
+        if stream is not None:
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+def _read_frames(decoder, frames, out):
+    """Fill `out` (frames x channels) from the decoder; returns the frames read (fewer at the end)."""
+    view = memoryview(out).cast("B")
+    wanted = frames * _BYTES_PER_FRAME
+    got = 0
+    while got < wanted:
+        n = decoder.stdout.readinto(view[got:wanted])
+        if not n:
+            break
+        got += n
+    # A trailing partial frame is dropped
+    return got // _BYTES_PER_FRAME
+
+def render_mix(tracks, duration, loop=True, chunk_frames=MIX_CHUNK_FRAMES):
+    """
+    Yield the mix as float32 arrays of shape (frames, 2), chunk by chunk, for
+    `duration` seconds. Tracks loop to fill the duration when `loop` is set;
+    otherwise each plays once and the mix ends with the longest one (or at
+    `duration`, whichever comes first).
+
+    Raises MixError before the first chunk if ffmpeg is missing or no track
+    produces any audio.
+    """
+    import numpy as np
+    if not mix_available():
+        raise MixError("Audio mixing is not available (ffmpeg not found).")
+
+    weights = track_weights(tracks)
+    total_frames = int(duration * MIX_SAMPLE_RATE)
+    # Resolved before any decoder starts, so an unknown preview leaves no process behind
+    sources = [_local_source(track.source) for track in tracks]
+    decoders = [_decoder(source, loop) for source in sources]
+    # One reusable buffer for every track's chunk: (tracks, frames, channels)
+    block = np.zeros((len(tracks), chunk_frames, MIX_CHANNELS), dtype=np.float32)
+    live = [True] * len(tracks)
+    rendered = 0
+    try:
+        while rendered < total_frames:
+            frames = min(chunk_frames, total_frames - rendered)
+            longest = 0
+            for i, decoder in enumerate(decoders):
+                read = _read_frames(decoder, frames, block[i, :frames]) if live[i] else 0
+                if read < frames:
+                    # Ended (or failed): silent from here on
+                    block[i, read:frames] = 0
+                    live[i] = False
+                longest = max(longest, read)
+
+            if rendered == 0 and longest == 0:
+                raise MixError("None of the tracks could be decoded.")
+            if longest == 0:
+                break
+
+            # Gain and pan for every track and channel, summed over tracks
+            mix = np.einsum("tfc,tc->fc", block[:, :longest], weights)
+            np.clip(mix, -1.0, 1.0, out=mix)
+            rendered += longest
+            yield mix
+            if not any(live):
+                break
+    finally:
+        for decoder in decoders:
+            _stop(decoder)
+        metrics.MIX_SECONDS_RENDERED.inc(rendered / MIX_SAMPLE_RATE)
+
+def stream_mix(tracks, duration=MIX_DEFAULT_DURATION, loop=True):
+    """
+    Render and MP3-encode a mix, returning an iterator of encoded bytes as
+    they are produced. The first chunk is rendered before this returns, so
+    MixError is raised here rather than after the response has started.
+
+    The mix holds one of MIX_MAX_CONCURRENCY slots until the iterator is
+    exhausted or closed; MixBusy is raised when none is free.
+    """
+    if not _mix_slots.acquire(blocking=False):
+        raise MixBusy("Too many mixes are being rendered; try again shortly.")
+    try:
+        duration = min(float(duration), MIX_MAX_DURATION)
+        chunks = render_mix(tracks, duration, loop)
+        first = next(chunks, None)
+        if first is None:
+            raise MixError("The mix is empty.")
+    except BaseException:
+        _mix_slots.release()
+        raise
+    return _MixStream(_encode(first, chunks))
+
+class _MixStream:
+    """
+    Encoded bytes of a mix, releasing its slot once exhausted or closed. A
+    generator closed before it started would skip its cleanup, and a response
+    can be dropped before its first chunk is sent.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._lock = threading.Lock()
+        self._held = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        self._chunks.close()
+        with self._lock:
+            held, self._held = self._held, False
+        if held:
+            _mix_slots.release()
+
+    __del__ = close
+
+def _encode(first, chunks):
+    encoder = _encoder()
+
+    def pump():
+        # Feed the encoder on its own thread so its output can be read as it comes
+        try:
+            encoder.stdin.write(first.tobytes())
+            for chunk in chunks:
+                encoder.stdin.write(chunk.tobytes())
+        except (BrokenPipeError, ValueError, OSError):
+            # The encoder was stopped (e.g. the client went away)
+            pass
+        except Exception:
+            logger.exception("Mix rendering failed")
+        finally:
+            chunks.close()
+            try:
+                encoder.stdin.close()
+            except OSError:
+                pass
+
+    writer = threading.Thread(target=pump, name="mix-render", daemon=True)
+    writer.start()
+    try:
+        while True:
+            data = encoder.stdout.read1(_READ_SIZE)
+            if not data:
+                break
+            yield data
+    finally:
+        _stop(encoder)
+        writer.join()
@@ -1,27 +1,259 @@
-import os
 import re
 import json
-from mistralai import Mistral
-
-# Get API key from environment variables
-API_KEY = os.getenv("MISTRAL_API_KEY")
-if not API_KEY:
-    raise ValueError("MISTRAL_API_KEY environment variable is not set")
-
-# Format API key with "Bearer" prefix if needed
-if not API_KEY.startswith("Bearer "):
-    API_KEY = f"Bearer {API_KEY}"
+import logging
+import threading
+import metrics
+from config import settings
+from llm_cache import llm_cache, normalize_prompt, LLM_CACHE_ENABLED
+from llm_stream import iter_field_events
+from singleflight import coalesce
+from governor import get_governor, UpstreamUnavailable, mark_degraded
+from token_budget import prepare as prepare_prompt, model_for, clean_description
+from structured_output import parse_json, StructuredOutputError
+from track_name_store import get_track_name_store, source_digest
+
+logger = logging.getLogger(__name__)
 
 # Specify which Mistral model to use
-MODEL_NAME = "mistral-large-latest"
+MODEL_NAME = settings.mistral_model
+
+# "single" validates and extracts keywords in one call; "two_call" keeps the
+# separate validator round trip so the two modes can be compared
+KEYWORDS_MODE = settings.keywords_mode
+
+# Request Mistral's JSON mode for prompts whose answer is a JSON object. JSON
+# mode always produces an object, so array prompts are parsed tolerantly instead.
+JSON_MODE = settings.mistral_json_mode
+
+# Expected shapes of the structured answers (see structured_output.validate)
+KEYWORD_LIST_SCHEMA = {"type": "array", "items": {"type": "string", "minLength": 1}}
+KEYWORDS_RESULT_SCHEMA = {
+    "type": "object",
+    "properties": {"is_valid": {"type": "boolean"}, "keywords": KEYWORD_LIST_SCHEMA},
+}
+KEYWORDS_BATCH_SCHEMA = {"type": "array", "items": KEYWORDS_RESULT_SCHEMA, "invalidItems": "null"}
+VALIDATION_SCHEMA = {"type": "object", "required": ["is_valid"], "properties": {"is_valid": {"type": "boolean"}}}
+TRACK_NAMES_SCHEMA = {"type": "array", "items": {"type": "string", "minLength": 1}, "invalidItems": "null"}
+DESCRIPTION_SCHEMA = {
+    "type": "object", "required": ["description"], "properties": {"description": {"type": "string", "minLength": 1}}
+}
+
+# The Mistral client is built on first use, so importing this module is cheap
+# and the service can start (and answer /health) before the key is checked
+_mistral_client = None
+_mistral_client_lock = threading.Lock()
+
+def get_mistral_client():
+    """Return the shared Mistral client, creating it on first use."""
+    global _mistral_client
+    if _mistral_client is None:
+        with _mistral_client_lock:
+            if _mistral_client is None:
+                # Get API key from the service settings
+                api_key = settings.mistral_api_key
+                if not api_key:
+                    raise ValueError("MISTRAL_API_KEY environment variable is not set")
+
+                # Format API key with "Bearer" prefix if needed
+                if not api_key.startswith("Bearer "):
+                    api_key = f"Bearer {api_key}"
+
+                # Imported here: the SDK's models are slow to import
+                from mistralai import Mistral
+                _mistral_client = Mistral(api_key=api_key, server_url=settings.mistral_server_url)
+    return _mistral_client
+
+def _request_options(json_mode: bool) -> dict:
+    """Extra chat request arguments: JSON mode when asked for and enabled."""
+    if json_mode and JSON_MODE:
+        return {"response_format": {"type": "json_object"}}
+    return {}
+
+def complete(prompt: str, task: str = "default", max_wait: float = None, use_cache: bool = True,
+             max_tokens: int = None, json_mode: bool = False) -> str:
+    """
+    Send a single-message prompt to Mistral and return the stripped response text.
+    Identical prompts are answered from the LLM cache instead of the API, unless
+    `use_cache` is False (for prompts whose answer should vary between calls).
+
+    `task` selects the model (the small one where it is good enough) and the
+    token budget: the prompt is compacted and counted (a prompt over budget
+    raises token_budget.PromptOverBudget without calling Mistral), and the
+    completion is capped at the task's max_tokens unless `max_tokens` is given.
+
+    The call goes through the Mistral governor, which raises UpstreamUnavailable
+    if it is shed; `max_wait` bounds how long it may wait for capacity (0 for
+    optional calls). `json_mode` requests a JSON object answer (parse it with
+    structured_output.parse_json).
+    """
+    model = model_for(task, MODEL_NAME)
+    prompt, max_tokens = prepare_prompt(task, prompt, max_tokens)
+
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    if use_cache:
+        cached = llm_cache.get(model, prompt)
+        if cached is not None:
+            return cached
+
+    with get_governor("mistral").call(max_wait), metrics.upstream_call("mistral"):
+        response = get_mistral_client().chat.complete(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            **_request_options(json_mode)
+        )
+    metrics.record_usage(model, response.usage, task)
+    text = response.choices[0].message.content.strip()
 
-# Initialize Mistral client with API key
-mistral_client = Mistral(api_key=API_KEY)
+    if use_cache:
+        llm_cache.set(model, prompt, text)
+    return text
 
-def get_keywords(user_text: str, min_keywords: int = 6):
+def stream_complete(prompt: str, use_cache: bool = True, task: str = "default", json_mode: bool = False):
+    """
+    Streaming counterpart of complete: yields the response text in deltas as
+    Mistral produces them. A cached answer is yielded in one piece, and a
+    finished stream is stored in the cache.
+    """
+    model = model_for(task, MODEL_NAME)
+    prompt, max_tokens = prepare_prompt(task, prompt)
+
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    if use_cache:
+        cached = llm_cache.get(model, prompt)
+        if cached is not None:
+            yield cached
+            return
+
+    parts = []
+    # Leaving early (the client disconnected) closes this generator; the
+    # governor then frees the slot and settles a half-open probe
+    with get_governor("mistral").call() as outcome, metrics.upstream_call("mistral"):
+        stream = get_mistral_client().chat.stream(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            **_request_options(json_mode)
+        )
+        for event in stream:
+            # Mistral is answering: an abandoned stream still counts as a success
+            outcome["status"] = 200
+            # The final chunk carries the token usage for the whole response
+            metrics.record_usage(model, getattr(event.data, "usage", None), task)
+            content = event.data.choices[0].delta.content
+            if isinstance(content, str) and content:
+                parts.append(content)
+                yield content
+
+    if use_cache:
+        llm_cache.set(model, prompt, "".join(parts).strip())
+
+def _invalid_input_result():
+    """Error payload returned by get_keywords when the input is not about sound."""
+    return {
+        "error": True,
+        "message": "Your input does not seem to describe a soundscape.",
+        "suggestions": [
+            "forest with birds and a stream",
+            "busy cafe with people talking",
+            "thunderstorm at night",
+            "ocean waves on a beach",
+            "spaceship engine room humming"
+        ]
+    }
+
+def _fallback_keywords(user_text: str, min_keywords: int = 6):
+    """
+    Keywords taken straight from the user's text, used when Mistral cannot be
+    reached: the whole phrase without filler words, then word pairs, then words.
+    """
+    mark_degraded("keywords")
+    words = [w for w in re.findall(r"[a-z']+", str(user_text).lower()) if len(w) > 2 and w not in _FILLER_WORDS]
+    candidates = [" ".join(words)] + [" ".join(pair) for pair in zip(words, words[1:])] + words
+    keywords = []
+    for keyword in candidates:
+        if keyword and keyword not in keywords:
+            keywords.append(keyword)
+    return keywords[:min_keywords]
+
+_FILLER_WORDS = {
+    "the", "and", "for", "with", "that", "this", "from", "into", "onto", "some", "like", "want", "would",
+    "could", "should", "give", "make", "create", "generate", "please", "hear", "listen", "sound", "sounds",
+    "soundscape", "track", "music", "of", "about", "are", "was", "were", "its", "it's", "i'd", "i'm"
+}
+
+# Concurrent requests for the same text share one keyword generation
+@coalesce("keywords", lambda user_text, min_keywords=6, mode=None: (
+    normalize_prompt(str(user_text)), min_keywords, mode or KEYWORDS_MODE
+))
+def get_keywords(user_text: str, min_keywords: int = 6, mode: str = None):
     """
     Calls Mistral to 'expand' or 'extrapolate' a list of relevant keywords for the user text.
     Returns a Python list of keywords (strings) or a dictionary with an error if input is invalid.
+    If Mistral is unavailable or fails, the input is not validated and keywords
+    are taken from the text itself (see _fallback_keywords).
+
+    Args:
+        mode (str): "single" validates and extracts keywords in one Mistral call,
+            "two_call" uses the separate validator prompt. Defaults to KEYWORDS_MODE.
+    """
+    if (mode or KEYWORDS_MODE) == "two_call":
+        return _get_keywords_two_call(user_text, min_keywords)
+    return _get_keywords_single_call(user_text, min_keywords)
+
+def _get_keywords_single_call(user_text: str, min_keywords: int = 6):
+    """
+    Validate the input and generate keywords with one structured Mistral response
+    of the form {"is_valid": bool, "keywords": [...]}.
+    """
+    prompt_str = f"""
+    You are a sound design keyword generator. You will be given a sentence or description that may be short, long, or creatively written about what the user wants to hear.
+
+    Description: "{user_text}"
+
+    Step 1 - Validate. Decide if the description is even remotely about sound, an audio environment, or could reasonably describe or inspire one.
+    Be extremely lenient: accept vague or short inputs like "river", "library", "give me soundscape for ocean", "sounds of wind", "rain", and
+    sensory, emotional, or imaginative experiences such as "floating in space", "dreaming underwater" or "walking through a forest".
+    Reject only clearly irrelevant inputs like "what is the capital of France", "solve this equation", "write an essay on the Cold War",
+    "I have two siblings", "1333647##//0", or "how to code in Python".
+
+    Step 2 - If valid, generate exactly {min_keywords} sound effect keywords that could be used to search a sound library.
+    Understand the context and intent, whether literal ("birds chirping") or imaginative ("a peaceful morning in the forest").
+    Focus on the things that make sounds (people, animals, environments, weather, instruments, machines) and descriptive modifiers
+    of how they sound (softly, distant, echoing). Ignore pronouns, filler phrases and requests like "I would like to hear".
+    If the description is a single word, expand it into related sound keywords, e.g. for "river":
+    ["flowing water", "river current", "stream bubbling", "water splash", "gentle brook", "river ambience"]
+
+    Respond with ONLY a JSON object with two fields:
+    {{"is_valid": true, "keywords": ["spaceship hum", "engine rumble", "space atmosphere", "control panel beeps", "airlock sound", "cosmic radiation"]}}
+    If the input is clearly unrelated to sound, respond with {{"is_valid": false, "keywords": []}}
+
+    Important: Return ONLY the JSON object, no other text or explanation.
+    """.strip()
+
+    try:
+        # Call Mistral API once for both the verdict and the keywords
+        raw_text = complete(prompt_str, task="keywords", json_mode=True)
+        result = parse_json(raw_text, KEYWORDS_RESULT_SCHEMA, task="keywords")
+
+        if not result.get("is_valid", True):
+            return _invalid_input_result()
+        return result.get("keywords") or _fallback_keywords(user_text, min_keywords)
+
+    except UpstreamUnavailable as e:
+        logger.info("Using keywords from the input text: %s", e)
+        return _fallback_keywords(user_text, min_keywords)
+    except StructuredOutputError as e:
+        logger.warning("%s; using keywords from the input text", e)
+        return _fallback_keywords(user_text, min_keywords)
+    except Exception as e:
+        logger.error("Error calling Mistral: %s", e)
+        return _fallback_keywords(user_text, min_keywords)
+
+def _get_keywords_two_call(user_text: str, min_keywords: int = 6):
+    """
+    Original two-step flow: a validator prompt, then the keyword generator prompt.
+    Kept so its quality can be compared with the single-call mode.
     """
     # First validate if the user input is about sound/soundscapes
     validation_prompt = f"""
@@ -45,39 +277,25 @@ def get_keywords(user_text: str, min_keywords: int = 6):
     """.strip()
 
     try:
-        # Call Mistral API to validate the input
-        validation_response = mistral_client.chat.complete(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": validation_prompt}],
-        )
-
-        validation_text = validation_response.choices[0].message.content.strip()
-
-        # debug line 
-        print("VALIDATION RESPONSE FROM MISTRAL:", validation_text)
-
-        # Clean up response if it's wrapped in code blocks
-        if "```" in validation_text:
-            validation_text = validation_text.split("```")[-1].strip()
-
         try:
-            # Parse validation response
-            validation_result = json.loads(validation_text)
-            if not validation_result.get("is_valid", True):
-                # Return error with suggestions if input is not valid
-                return {
-                    "error": True,
-                    "message": "Your input does not seem to describe a soundscape.",
-                    "suggestions": [
-                        "forest with birds and a stream",
-                        "busy cafe with people talking",
-                        "thunderstorm at night",
-                        "ocean waves on a beach",
-                        "spaceship engine room humming"
-                    ]
-                }
-        except json.JSONDecodeError:
-            print("Validation response could not be parsed; proceeding anyway.")
+            # Call Mistral API to validate the input; validation is optional and shed first under load
+            validation_text = complete(validation_prompt, task="validation", max_wait=0, json_mode=True)
+        except UpstreamUnavailable as e:
+            logger.info("Skipping input validation: %s", e)
+            mark_degraded("validation")
+            validation_text = None
+
+        if validation_text is not None:
+            logger.debug("Validation response from Mistral: %s", validation_text)
+
+            try:
+                # Parse validation response
+                validation_result = parse_json(validation_text, VALIDATION_SCHEMA, task="validation")
+                if not validation_result["is_valid"]:
+                    # Return error with suggestions if input is not valid
+                    return _invalid_input_result()
+            except StructuredOutputError:
+                logger.warning("Validation response could not be parsed; proceeding anyway.")
 
         # Create prompt for keyword extraction
         prompt_str = f"""
@@ -106,45 +324,95 @@ def get_keywords(user_text: str, min_keywords: int = 6):
         """.strip()
 
         # Call Mistral API to generate keywords
-        response = mistral_client.chat.complete(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt_str}],
-        )
+        raw_text = complete(prompt_str, task="keywords")
+
+        # Parse the response as a JSON array of keywords
+        expansions = parse_json(raw_text, KEYWORD_LIST_SCHEMA, task="keywords")
+        logger.debug("Parsed expansions: %s", expansions)
+        return expansions or _fallback_keywords(user_text, min_keywords)
+
+    except UpstreamUnavailable as e:
+        logger.info("Using keywords from the input text: %s", e)
+        return _fallback_keywords(user_text, min_keywords)
+    except StructuredOutputError as e:
+        logger.warning("%s; using keywords from the input text", e)
+        return _fallback_keywords(user_text, min_keywords)
+    except Exception as e:
+        logger.error("Error calling Mistral: %s", e)
+        return _fallback_keywords(user_text, min_keywords)
 
-        # Extract and clean the response text
-        raw_text = response.choices[0].message.content.strip()
-        if "```json" in raw_text:
-            raw_text = raw_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in raw_text:
-            raw_text = raw_text.split("```")[-1].strip()
+def get_keywords_batch(user_texts, min_keywords: int = 6):
+    """
+    Validate several descriptions and generate their keywords with one Mistral
+    call. Returns one entry per input, in order, each shaped like a get_keywords
+    result (a keyword list, or the invalid-input dict). Entries the batched
+    response does not cover are answered by get_keywords one at a time.
+    """
+    if not user_texts:
+        return []
 
-        try:
-            # Parse the response as JSON
-            expansions = json.loads(raw_text)
-            # debug *
-            print("Parsed expansions:", expansions)
-            if not isinstance(expansions, list):
-                return []
-
-            # Clean up keywords and return them
-            expansions = [k.strip() for k in expansions if k.strip()]
-            return expansions
-
-        except json.JSONDecodeError:
-            # Fallback: try to extract keywords from quoted strings if JSON parsing fails
-            fallback_keywords = re.findall(r'"([^"]+)"', raw_text)
-            print("Fallback extracted:", fallback_keywords) # debug
-            if fallback_keywords and len(fallback_keywords) >= 3:
-                return fallback_keywords[:min_keywords]
-            return []
+    descriptions = "\n".join(f'    {i + 1}. "{text}"' for i, text in enumerate(user_texts))
+    prompt_str = f"""
+    You are a sound design keyword generator. You will be given a numbered list of descriptions, each of which may be short, long, or creatively written about what a user wants to hear.
+
+    Descriptions:
+{descriptions}
+
+    For EACH description, independently:
+    Step 1 - Validate. Decide if the description is even remotely about sound, an audio environment, or could reasonably describe or inspire one.
+    Be extremely lenient: accept vague or short inputs like "river", "library", "give me soundscape for ocean", "sounds of wind", "rain", and
+    sensory, emotional, or imaginative experiences such as "floating in space", "dreaming underwater" or "walking through a forest".
+    Reject only clearly irrelevant inputs like "what is the capital of France", "solve this equation", "write an essay on the Cold War",
+    "I have two siblings", "1333647##//0", or "how to code in Python".
+
+    Step 2 - If valid, generate exactly {min_keywords} sound effect keywords that could be used to search a sound library.
+    Understand the context and intent, whether literal ("birds chirping") or imaginative ("a peaceful morning in the forest").
+    Focus on the things that make sounds (people, animals, environments, weather, instruments, machines) and descriptive modifiers
+    of how they sound (softly, distant, echoing). Ignore pronouns, filler phrases and requests like "I would like to hear".
+    If the description is a single word, expand it into related sound keywords, e.g. for "river":
+    ["flowing water", "river current", "stream bubbling", "water splash", "gentle brook", "river ambience"]
 
+    Respond with ONLY a JSON array containing exactly {len(user_texts)} objects, one per description and in the same order:
+    [{{"is_valid": true, "keywords": ["spaceship hum", "engine rumble", "space atmosphere", "control panel beeps", "airlock sound", "cosmic radiation"]}},
+     {{"is_valid": false, "keywords": []}}]
+
+    Important: Return ONLY the JSON array, no other text or explanation.
+    """.strip()
+
+    results = [None] * len(user_texts)
+    try:
+        raw_text = complete(prompt_str, task="keywords_batch",
+                             max_tokens=30 + len(user_texts) * (min_keywords * 8 + 15))
+
+        # Entries that do not parse come back as None, keeping the rest in place
+        entries = parse_json(raw_text, KEYWORDS_BATCH_SCHEMA, task="keywords_batch")
+        for i, entry in enumerate(entries[:len(user_texts)]):
+            if entry is None:
+                continue
+            if not entry.get("is_valid", True):
+                results[i] = _invalid_input_result()
+            elif len(entry.get("keywords", [])) >= min(3, min_keywords):
+                # Fewer keywords than that means the entry was cut short
+                results[i] = entry["keywords"]
+    except UpstreamUnavailable as e:
+        logger.info("Using keywords from the input texts: %s", e)
+        return [_fallback_keywords(text, min_keywords) for text in user_texts]
     except Exception as e:
-        print("Error calling Mistral:", e)
-        return []
+        logger.error("Error calling Mistral for batched keywords: %s", e)
+
+    # Anything the batch did not answer gets its own call
+    for i, text in enumerate(user_texts):
+        if results[i] is None:
+            results[i] = get_keywords(text, min_keywords=min_keywords)
+    return results
 
 def generate_track_names(sounds_info):
     """
     Generate better, more descriptive track names for the sounds.
+
+    Names generated before are taken from the track name store, so only sounds
+    without one are sent to Mistral (in one prompt), and the new names are
+    stored for next time. Names are unique within the returned list.
     
     Args:
         sounds_info (list): List of dictionaries containing sound information
@@ -154,14 +422,91 @@ def generate_track_names(sounds_info):
     """
     if not sounds_info:
         return []
+    renamed = rename_tracks(sounds_info)
+    # Return original sounds if nothing could be named
+    return unique_track_names(renamed) if renamed is not None else sounds_info
 
+@coalesce("track_names", lambda sounds_info: sounds_info)
+def rename_tracks(sounds_info):
+    """
+    generate_track_names without making the names unique across the list,
+    for callers that name several soundscapes' sounds together. Returns the
+    renamed copies, or None if no sound could be named.
+    """
+
+    store = get_track_name_store()
+    sound_ids = [_sound_id(sound) for sound in sounds_info]
+    sources = {
+        sound_id: source_digest(sound.get("name", ""), sound.get("description", ""))
+        for sound_id, sound in zip(sound_ids, sounds_info) if sound_id is not None
+    }
+    stored = _stored_track_names(store, sources)
+
+    unseen = [sound for sound_id, sound in zip(sound_ids, sounds_info) if sound_id not in stored]
+    metrics.TRACK_NAME_LOOKUPS.inc(len(sounds_info) - len(unseen), result="hit")
+    metrics.TRACK_NAME_LOOKUPS.inc(len(unseen), result="miss")
+    generated = iter(_name_sounds(unseen, taken=list(stored.values())) if unseen else [])
+
+    track_names, new_entries = [], []
+    for sound_id in sound_ids:
+        if sound_id in stored:
+            track_names.append(stored[sound_id])
+            continue
+        name = next(generated)
+        track_names.append(name)
+        if name and sound_id is not None:
+            new_entries.append((sound_id, sources[sound_id], name))
+
+    if store is not None and new_entries:
+        try:
+            store.set_many(new_entries)
+        except Exception as e:
+            logger.warning("Could not store track names: %s", e)
+
+    if not any(track_names):
+        return None
+
+    # Create result with new track names
+    result = []
+    for sound, track_name in zip(sounds_info, track_names):
+        sound_copy = dict(sound)
+        original_name = sound.get("name", "Unnamed Sound")
+        sound_copy["freesound_name"] = original_name  # Keep original name
+        sound_copy["name"] = track_name or original_name  # Set new name
+        result.append(sound_copy)
+    return result
+
+def _sound_id(sound):
+    """
+    The sound's FreeSound id as the int the track name store keys on, or None
+    when it has none or it is not a number (such sounds are named every time).
+    """
+    try:
+        return int(sound.get("freesound_id"))
+    except (TypeError, ValueError):
+        return None
+
+def _stored_track_names(store, sources):
+    """Stored names for {freesound_id: source digest}; empty when the store is off or fails."""
+    if store is None or not sources:
+        return {}
+    try:
+        return store.get_many(sources)
+    except Exception as e:
+        logger.warning("Track name store lookup failed: %s", e)
+        return {}
+
+def _name_sounds(sounds_info, taken=()):
+    """
+    Ask Mistral for one name per sound, avoiding the names in `taken`.
+    Returns a list aligned with `sounds_info` holding None where no name was produced.
+    """
     # Prepare prompt parts for each sound
     prompt_parts = []
     for idx, sound in enumerate(sounds_info):
         sound_name = sound.get("name", "Unnamed Sound")
-        sound_description = sound.get("description", "No description")
-        if len(sound_description) > 300:
-            sound_description = sound_description[:300] + "..."  # Truncate long descriptions
+        # Strip URLs, license boilerplate and repeats, and cap the length
+        sound_description = clean_description(sound.get("description", "")) or "No description"
 
         prompt_parts.append(f"""Sound {idx+1}:
 Name: "{sound_name}"
@@ -170,6 +515,7 @@ Description: "{sound_description}"
 
     # Combine all sound details into one string
     sounds_data = "\n\n".join(prompt_parts)
+    taken_note = f"These names are already used and must not be repeated: {json.dumps(list(taken))}\n" if taken else ""
 
     # Create prompt for generating better track names
     prompt = f"""You are a sound naming expert. Give each sound below a short, descriptive name (2-4 words) that clearly describes what the sound is.
@@ -178,7 +524,7 @@ The names should be concise, descriptive, and focused on what the sound actually
 Ignore any irrelevant details in the description. Focus on creating practical, useful names that accurately describe the sound content.
 
 Make sure each name is unique even if the sounds have similar descriptions.
-
+{taken_note}
 {sounds_data}
 
 Format your response as a JSON array of strings containing ONLY the new names in the same order as the sounds above.
@@ -188,68 +534,43 @@ IMPORTANT: Return ONLY the JSON array, no other text or explanation.
 """
 
     try:
-        # Call Mistral API to generate track names
-        response = mistral_client.chat.complete(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-        )
-
-        # Extract and clean response text
-        raw_text = response.choices[0].message.content.strip()
-        if "```json" in raw_text:
-            raw_text = raw_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in raw_text:
-            raw_text = raw_text.split("```")[-1].strip()
-
-        try:
-            # Parse response as JSON
-            track_names = json.loads(raw_text)
-            if not isinstance(track_names, list):
-                return sounds_info
-
-            # Ensure we have the right number of names
-            if len(track_names) != len(sounds_info):
-                if len(track_names) < len(sounds_info):
-                    # If too few names, use original names for the rest
-                    track_names.extend([s.get("name", f"Sound {i+1+len(track_names)}") 
-                                       for i, s in enumerate(sounds_info[len(track_names):])])
-                else:
-                    # If too many names, truncate
-                    track_names = track_names[:len(sounds_info)]
-
-            # Create result with new track names
-            result = []
-            for i, sound in enumerate(sounds_info):
-                sound_copy = dict(sound)
-                sound_copy["freesound_name"] = sound.get("name", "Unnamed Sound")  # Keep original name
-                sound_copy["name"] = track_names[i]  # Set new name
-                result.append(sound_copy)
-
-            return result
-
-        except json.JSONDecodeError:
-            # Return original sounds if JSON parsing fails
-            return sounds_info
-
+        # Call Mistral API to generate track names. Naming is optional: under load
+        # it is shed at once and the FreeSound names are returned instead.
+        raw_text = complete(prompt, task="track_names", max_wait=0, max_tokens=20 + 12 * len(sounds_info))
+
+        # Parse response as a JSON array; unusable entries come back as None.
+        # A truncated answer keeps the names it completed.
+        track_names = parse_json(raw_text, TRACK_NAMES_SCHEMA, task="track_names")[:len(sounds_info)]
+        # Sounds left without a name keep their FreeSound name
+        return track_names + [None] * (len(sounds_info) - len(track_names))
+
+    except StructuredOutputError as e:
+        # No usable names in the response
+        logger.warning("%s", e)
+    except UpstreamUnavailable as e:
+        logger.info("Skipping track naming: %s", e)
     except Exception as e:
-        print("Error calling Mistral for track names:", e)
-        return sounds_info
-
-# Generate descriptive paragraph about a soundscape based on user input
-def generate_description(user_text: str) -> str:
-    """
-    Use Mistral to generate a descriptive paragraph of 3-4 sentences
-    about how a sound might sound, based on a list of track names
-    
-    Args:
-        user_text (str): Input text containing track names separated by commas
-        
-    Returns:
-        str: A descriptive paragraph about the soundscape
-    """
-
-    # Create prompt for generating description
-    prompt_str = f"""
+        logger.error("Error calling Mistral for track names: %s", e)
+    # The sounds keep their FreeSound names
+    mark_degraded("track_names")
+    return [None] * len(sounds_info)
+
+def unique_track_names(sounds):
+    """Number repeated names ("Rain on Roof", "Rain on Roof 2") so every sound's name is distinct."""
+    seen = set()
+    for sound in sounds:
+        name = sound.get("name", "")
+        candidate, number = name, 1
+        while candidate.lower() in seen:
+            number += 1
+            candidate = f"{name} {number}"
+        seen.add(candidate.lower())
+        sound["name"] = candidate
+    return sounds
+
+def _description_prompt(user_text: str) -> str:
+    """Prompt asking Mistral for a {"description": ...} paragraph about the given track names."""
+    return f"""
     You are a specialized description generator. The user input has provided the sentence
     that includes all track names that sepeareted by comma:"{user_text}"
 
@@ -274,47 +595,66 @@ def generate_description(user_text: str) -> str:
     Return ONLY valid JSON, with no extra text, code fences, or disclaimers.
     """.strip()
 
-    try:
-        # Call Mistral API to generate description
-        response = mistral_client.chat.complete(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt_str}],
-        )
+# Generate descriptive paragraph about a soundscape based on user input
+def generate_description(user_text: str) -> str:
+    """
+    Use Mistral to generate a descriptive paragraph of 3-4 sentences
+    about how a sound might sound, based on a list of track names
+    
+    Args:
+        user_text (str): Input text containing track names separated by commas
+        
+    Returns:
+        str: A descriptive paragraph about the soundscape
+    """
 
-        # Extract and clean response text
-        raw_text = response.choices[0].message.content.strip()
-        if "```" in raw_text:
-            raw_text = raw_text.split("```")[-1].strip()
+    # Create prompt for generating description
+    prompt_str = _description_prompt(user_text)
 
-        # Parse response as JSON
-        data = json.loads(raw_text)
-        if not isinstance(data, dict) or "description" not in data:
-            raise ValueError("Missing 'description' in Mistral response.")
+    try:
+        # Call Mistral API to generate description
+        raw_text = complete(prompt_str, task="description", json_mode=True)
 
-        return data["description"]
+        # Parse response as JSON; raises StructuredOutputError without a description
+        return parse_json(raw_text, DESCRIPTION_SCHEMA, task="description")["description"]
 
+    except UpstreamUnavailable as e:
+        logger.info("Skipping description: %s", e)
+        mark_degraded("description")
+        return ""
     except Exception as e:
-        print("Error generating description with Mistral:", e)
+        logger.error("Error generating description with Mistral: %s", e)
         return ""  # fallback: return an empty string or handle as needed
 
+def stream_description(user_text: str):
+    """
+    Token-streaming variant of generate_description.
+
+    Yields {"event": "token", "text": ...} as the description is generated and a
+    final {"event": "done", "description": ...} with the complete paragraph.
+    """
+    deltas = stream_complete(_description_prompt(user_text), task="description", json_mode=True)
+    return iter_field_events(deltas, "description", task="description")
+
 import random
 
-def auto_generate_keywords(min_keywords: int = 6):
+# Styles /api/auto-keywords picks from
+AUTO_STYLES = [
+    "lo-fi", "jazzy", "cinematic", "upbeat", "classical", "ambient",
+    "melancholic piano", "folk acoustic", "grunge", "funky",
+    "orchestral", "violin", "angelic", "serene", "uplifting", "forest sounds",
+    "sunset vibes", "midnight jazz"
+]
+
+def auto_generate_keywords(min_keywords: int = 6, style: str = None):
     """
-    Randomly selects a style/mood and uses Mistral to generate
-    6 creative, sound-relevant keywords in that style.
+    Uses Mistral to generate 6 creative, sound-relevant keywords in the given
+    style/mood, or in a randomly selected one from AUTO_STYLES.
 
     Returns:
-        dict: { "style": str, "keywords": List[str] }
+        list: the keywords (strings)
     """
-    styles = [
-        "lo-fi", "jazzy", "cinematic", "upbeat", "classical", "ambient",
-        "melancholic piano", "folk acoustic", "grunge", "funky",
-        "orchestral", "violin", "angelic", "serene", "uplifting", "forest sounds",
-        "sunset vibes", "midnight jazz"
-    ]
-
-    selected_style = random.choice(styles)
+    selected_style = style or random.choice(AUTO_STYLES)
 
     prompt_str = f"""
     You are a creative sound designer. The selected style is "{selected_style}".
@@ -331,33 +671,12 @@ def auto_generate_keywords(min_keywords: int = 6):
     """.strip()
 
     try:
-        response = mistral_client.chat.complete(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt_str}],
-        )
-
-        raw_text = response.choices[0].message.content.strip()
-        if "```json" in raw_text:
-            raw_text = raw_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in raw_text:
-            raw_text = raw_text.split("```")[-1].strip()
-
-        try:
-            keywords = json.loads(raw_text)
-            if not isinstance(keywords, list):
-                return []
-
-            keywords = [k.strip() for k in keywords if k.strip()]
-            return keywords[:min_keywords]
-
-        except json.JSONDecodeError:
-            # Fallback: Try regex if JSON fails
-            fallback_keywords = re.findall(r'"([^"]+)"', raw_text)
-            if fallback_keywords and len(fallback_keywords) >= 3:
-                return fallback_keywords[:min_keywords]
-
-            return []
+        # Not cached: each call should give a different set for the same style
+        raw_text = complete(prompt_str, task="auto_keywords", use_cache=False)
+        keywords = parse_json(raw_text, KEYWORD_LIST_SCHEMA, task="auto_keywords")
+        return keywords[:min_keywords] or _fallback_keywords(selected_style, min_keywords)
 
     except Exception as e:
-        print("Error auto-generating keywords with Mistral:", e)
-        return []
\ No newline at end of file
+        logger.error("Error auto-generating keywords with Mistral: %s", e)
+        # Search for the style itself rather than returning nothing
+        return _fallback_keywords(selected_style, min_keywords)
\ No newline at end of file
@@ -0,0 +1,381 @@
+import time
+import logging
+import metrics
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+from config import settings
+from governor import degraded_scope, degraded_reasons, carry_degraded
+from llm_cache import normalize_prompt
+from freesound_index import normalize_query
+from nlp_model import get_keywords, get_keywords_batch, generate_track_names, rename_tracks, unique_track_names
+from freesound import submit_searches, search_results, FREESOUND_SEARCH_DEADLINE
+from sound_selection import select_sounds, keywords_needed
+from sound_analysis import lookup_analyses
+from unsplash_image import get_unsplash_image
+
+logger = logging.getLogger(__name__)
+
+# Number of sounds returned for a generated soundscape
+TOP_SOUNDS = 6
+# Results kept from each keyword search (submit_searches' default)
+SOUNDS_PER_KEYWORD = 3
+
+# Batch API sizing (see run_keywords_batch)
+BATCH_MAX_PROMPTS = settings.batch_max_prompts
+KEYWORDS_BATCH_SIZE = settings.keywords_batch_size
+TRACK_NAMES_BATCH_SIZE = settings.track_names_batch_size
+BATCH_MAX_CONCURRENCY = settings.batch_max_concurrency
+
+# Side tasks that run next to the main pipeline (e.g. the Unsplash image)
+_side_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pipeline-side")
+# Keyword and naming calls of batch jobs; kept apart so a large batch cannot
+# starve the image fetches and streaming naming of interactive requests
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_CONCURRENCY, thread_name_prefix="pipeline-batch")
+
+class StageTimer:
+    """
+    Records wall-clock duration (ms) of each named pipeline stage for the
+    request's Server-Timing header, and in the stage latency metric.
+    """
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        self.timings[name] = round(seconds * 1000, 1)
+        metrics.STAGE_LATENCY.observe(seconds, stage=name)
+
+    def server_timing(self) -> str:
+        """Format the timings as a Server-Timing header value."""
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.timings.items())
+
+def format_sounds(sounds):
+    """Shape raw FreeSound results into the sound objects returned by the API."""
+    sounds_info = []
+    analyses = lookup_analyses([sound.get("id") for sound in sounds])
+    for index, sound in enumerate(sounds, start=1):
+        sounds_info.append({
+            "sound_number": f"Sound {index}",
+            "name": sound.get("name", "Unknown"),
+            "description": sound.get("description", "No description available"),
+            "sound_url": sound.get("download", "No URL provided"),
+            "preview_url": sound.get("preview_url", ""),
+            "freesound_id": sound.get("id"),
+            "analysis": analyses.get(sound.get("id"))
+        })
+    return sounds_info
+
+def collect_top_sounds(keywords, limit=TOP_SOUNDS, deadline=None):
+    """
+    Search every keyword concurrently and pick `limit` distinct sounds spread
+    over the keywords (see sound_selection.select_sounds). Returns as soon as
+    the searches done so far decide the selection, cancelling searches that
+    are no longer needed.
+    """
+    if deadline is None:
+        deadline = FREESOUND_SEARCH_DEADLINE
+    expires_at = time.monotonic() + deadline
+
+    searches = submit_searches(keywords)
+    results_by_keyword = []
+    for query, future in searches:
+        if len(select_sounds(results_by_keyword, limit, final=False)) >= limit:
+            # Enough sounds already; the remaining searches cannot change the result
+            future.cancel()
+            continue
+        try:
+            results_by_keyword.append(future.result(timeout=max(0.0, expires_at - time.monotonic())))
+        except FutureTimeoutError:
+            future.cancel()
+            results_by_keyword.append([])
+            logger.warning("FreeSound search for '%s' missed the %ss deadline.", query, deadline)
+        except Exception:
+            results_by_keyword.append([])
+            logger.exception("FreeSound search for '%s' failed", query)
+
+    return select_sounds(results_by_keyword, limit)
+
+def run_keywords_pipeline(input_str, keywords=None, with_image=False, timer=None):
+    """
+    Staged executor behind /api/keywords and /api/auto-keywords.
+
+    Stages: keyword generation (skipped when `keywords` is given), FreeSound
+    search, and track naming, which starts as soon as the top sounds are known
+    instead of after every search. The Unsplash image for `input_str` is fetched
+    in parallel when `with_image` is set.
+
+    Returns:
+        dict: {"keywords": list, "sounds": list, "invalid": dict or None,
+               "image_url": str (only with_image), "degraded": bool (a fallback
+               was served for some stage, see governor.mark_degraded)}
+    """
+    # Joins the caller's degraded scope when it has one
+    with degraded_scope(degraded_reasons()) as degraded:
+        result = _run_stages(input_str, keywords, with_image, timer or StageTimer())
+    result["degraded"] = bool(degraded)
+    return result
+
+def _run_stages(input_str, keywords, with_image, timer):
+    result = {"keywords": [], "sounds": [], "invalid": None}
+
+    image_future = None
+    if with_image:
+        image_future = _side_executor.submit(carry_degraded(_timed_image), input_str, timer)
+
+    if keywords is None:
+        with timer.stage("keywords"):
+            keywords = get_keywords(input_str, min_keywords=6)
+        # Non-soundscape input: hand the validator's payload back to the caller
+        if isinstance(keywords, dict) and keywords.get('error'):
+            result["invalid"] = keywords
+            return _attach_image(result, image_future)
+
+    result["keywords"] = keywords
+    if keywords:
+        with timer.stage("search"):
+            top_sounds = collect_top_sounds(keywords)
+
+        with timer.stage("track_names"):
+            result["sounds"] = generate_track_names(format_sounds(top_sounds))
+
+    return _attach_image(result, image_future)
+
+def iter_keywords_pipeline(input_str, timer=None):
+    """
+    Streaming variant of run_keywords_pipeline that yields an event dict as each
+    stage completes:
+
+        {"event": "validation", "is_valid": bool, ...}
+        {"event": "keywords", "keywords": [...]}
+        {"event": "sound", "keyword": str, "keyword_index": int, "sound": {...}}  (one per result, as searches return)
+        {"event": "tracks", "sounds": [...]}  (the renamed top sounds, same as /api/keywords)
+        {"event": "done", "timings": {...}, "degraded": true (only when a fallback was served)}
+
+    Track naming starts in the background as soon as the top sounds in keyword
+    order are known, while later searches are still being streamed.
+    """
+    degraded = []
+    events = _iter_stages(input_str, timer or StageTimer())
+    while True:
+        # Each step may run on a different thread (ASGI), so re-enter the scope every time
+        with degraded_scope(degraded):
+            event = next(events, None)
+        if event is None:
+            return
+        if event["event"] == "done" and degraded:
+            event["degraded"] = True
+        yield event
+
+def _iter_stages(input_str, timer):
+    with timer.stage("keywords"):
+        keywords = get_keywords(input_str, min_keywords=6)
+
+    if isinstance(keywords, dict) and keywords.get('error'):
+        yield {
+            "event": "validation",
+            "is_valid": False,
+            "message": keywords.get('message', "Your input does not appear to be related to a soundscape."),
+            "suggestions": keywords.get('suggestions', [])
+        }
+        yield {"event": "done", "timings": timer.timings}
+        return
+
+    yield {"event": "validation", "is_valid": True}
+    yield {"event": "keywords", "keywords": keywords}
+
+    if keywords:
+        search_start = time.perf_counter()
+        searches = submit_searches(keywords)
+        positions = {future: (index, query) for index, (query, future) in enumerate(searches)}
+        results_by_index = {}
+        naming_future = None
+
+        try:
+            for future in as_completed(positions, timeout=FREESOUND_SEARCH_DEADLINE):
+                index, query = positions[future]
+                results_by_index[index] = search_results(query, future)
+                for sound in format_sounds(results_by_index[index]):
+                    yield {"event": "sound", "keyword": query, "keyword_index": index, "sound": sound}
+
+                # Start naming once the selected sounds can no longer change
+                top_sounds = _ordered_prefix(results_by_index, len(searches))
+                if naming_future is None and top_sounds is not None:
+                    naming_future = _side_executor.submit(carry_degraded(_timed_track_names), top_sounds, timer)
+        except FutureTimeoutError:
+            for future, (index, query) in positions.items():
+                if not future.done():
+                    future.cancel()
+                    results_by_index[index] = []
+                    logger.warning("FreeSound search for '%s' missed the %ss deadline.", query, FREESOUND_SEARCH_DEADLINE)
+        timer.record("search", time.perf_counter() - search_start)
+
+        if naming_future is None:
+            naming_future = _side_executor.submit(
+                carry_degraded(_timed_track_names), _ordered_prefix(results_by_index, len(searches)) or [], timer
+            )
+        yield {"event": "tracks", "sounds": naming_future.result()}
+    else:
+        yield {"event": "tracks", "sounds": []}
+
+    yield {"event": "done", "timings": timer.timings}
+
+def run_keywords_batch(input_strs, timer=None):
+    """
+    Batch form of run_keywords_pipeline for pre-generation jobs.
+
+    Identical prompts are generated once, and validation plus keyword
+    extraction are packed KEYWORDS_BATCH_SIZE prompts per Mistral call. Each
+    distinct keyword across the whole batch is searched once. Every resulting
+    sound is named once, TRACK_NAMES_BATCH_SIZE sounds per Mistral call.
+
+    Returns:
+        list: one {"keywords", "sounds", "invalid", "degraded"} dict per input,
+              in order; "degraded" is set on all of them when any fallback was
+              served, as the calls are shared
+    """
+    with degraded_scope(degraded_reasons()) as degraded:
+        results = _run_batch_stages(input_strs, timer or StageTimer())
+    for result in results:
+        result["degraded"] = bool(degraded)
+    return results
+
+def _run_batch_stages(input_strs, timer):
+
+    # Keyword generation for each distinct prompt, several prompts per call
+    unique_texts = {}
+    for input_str in input_strs:
+        unique_texts.setdefault(normalize_prompt(input_str), input_str)
+    texts = list(unique_texts.values())
+    with timer.stage("keywords"):
+        chunks = [texts[i:i + KEYWORDS_BATCH_SIZE] for i in range(0, len(texts), KEYWORDS_BATCH_SIZE)]
+        generated = [keywords for chunk in _batch_executor.map(carry_degraded(get_keywords_batch), chunks) for keywords in chunk]
+    keywords_by_text = dict(zip(unique_texts, generated))
+
+    results = []
+    for input_str in input_strs:
+        keywords = keywords_by_text[normalize_prompt(input_str)]
+        if isinstance(keywords, dict) and keywords.get('error'):
+            results.append({"keywords": [], "sounds": [], "invalid": keywords})
+        else:
+            results.append({"keywords": keywords or [], "sounds": [], "invalid": None})
+
+    # One search per distinct keyword across the batch, in rounds that only go
+    # as far down each keyword list as its top sounds need
+    found = {}
+    expires_at = time.monotonic() + FREESOUND_SEARCH_DEADLINE
+    with timer.stage("search"):
+        while True:
+            wanted = [k for result in results for k in _top_sounds(result["keywords"], found)[1]]
+            if not wanted:
+                break
+            found.update(_search_once(wanted, expires_at))
+
+    top_sounds = [format_sounds(_top_sounds(result["keywords"], found)[0]) for result in results]
+
+    with timer.stage("track_names"):
+        for result, sounds in zip(results, _name_tracks_batch(top_sounds)):
+            result["sounds"] = sounds
+
+    return results
+
+def _top_sounds(keywords, found):
+    """
+    The TOP_SOUNDS sounds selected from the searches in `found`, and the
+    keywords that still have to be searched to complete them.
+    """
+    results_by_keyword = []
+    for index, keyword in enumerate(keywords):
+        key = normalize_query(keyword)
+        if key not in found:
+            sounds = select_sounds(results_by_keyword, TOP_SOUNDS, final=False)
+            if len(sounds) >= TOP_SOUNDS:
+                return sounds, []
+            return sounds, keywords[index:index + keywords_needed(len(sounds), TOP_SOUNDS)]
+        results_by_keyword.append(found[key])
+    return select_sounds(results_by_keyword, TOP_SOUNDS), []
+
+def _search_once(keywords, expires_at):
+    """
+    Search each distinct keyword once; returns {normalize_query(keyword): results}.
+    Searches that miss the deadline count as empty.
+    """
+    unique = {}
+    for keyword in keywords:
+        unique.setdefault(normalize_query(keyword), keyword)
+
+    found = {}
+    for query, future in submit_searches(list(unique.values()), SOUNDS_PER_KEYWORD):
+        try:
+            found[normalize_query(query)] = future.result(timeout=max(0.0, expires_at - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            found[normalize_query(query)] = []
+            logger.warning("FreeSound search for '%s' missed the %ss deadline.", query, FREESOUND_SEARCH_DEADLINE)
+        except Exception:
+            found[normalize_query(query)] = []
+            logger.exception("FreeSound search for '%s' failed", query)
+    # Keywords submit_searches skips (blank ones) have nothing to wait for
+    for key in unique:
+        found.setdefault(key, [])
+    return found
+
+def _name_tracks_batch(groups):
+    """
+    Rename the sounds of several soundscapes, naming each distinct sound once
+    and packing TRACK_NAMES_BATCH_SIZE sounds into each Mistral call.
+    """
+    def sound_key(sound):
+        return sound.get("freesound_id") or sound.get("name")
+
+    unique = {}
+    for group in groups:
+        for sound in group:
+            unique.setdefault(sound_key(sound), sound)
+    sounds = list(unique.values())
+    chunks = [sounds[i:i + TRACK_NAMES_BATCH_SIZE] for i in range(0, len(sounds), TRACK_NAMES_BATCH_SIZE)]
+
+    renamed = {}
+    # Chunks mix several soundscapes, so names are only made unique per soundscape below
+    for chunk, named in zip(chunks, _batch_executor.map(carry_degraded(rename_tracks), chunks)):
+        for original, sound in zip(chunk, named or chunk):
+            renamed[sound_key(original)] = sound
+
+    # Keep each soundscape's own numbering, and its names distinct
+    return [
+        unique_track_names([dict(renamed[sound_key(sound)], sound_number=sound["sound_number"]) for sound in group])
+        for group in groups
+    ]
+
+def _ordered_prefix(results_by_index, search_count, limit=TOP_SOUNDS):
+    """
+    The `limit` sounds selected from the searches in keyword order, or None
+    while a search that could still change the selection has not returned.
+    """
+    prefix = []
+    for index in range(search_count):
+        if index not in results_by_index:
+            sounds = select_sounds(prefix, limit, final=False)
+            return sounds if len(sounds) >= limit else None
+        prefix.append(results_by_index[index])
+    return select_sounds(prefix, limit)
+
+def _timed_track_names(top_sounds, timer):
+    with timer.stage("track_names"):
+        return generate_track_names(format_sounds(top_sounds))
+
+def _timed_image(query, timer):
+    with timer.stage("image"):
+        return get_unsplash_image(query)
+
+def _attach_image(result, image_future):
+    if image_future is not None:
+        result["image_url"] = image_future.result().get("image_url", "")
+    return result
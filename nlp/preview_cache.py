@@ -0,0 +1,221 @@
+"""
+Local disk cache of FreeSound preview audio, keyed by FreeSound id.
+
+search_freesound registers the preview URL of every sound it returns and
+hands out this service's /api/preview/<id> instead (under
+PREVIEW_CACHE_BASE_URL, or as a relative URL when it is empty). The first
+request for a preview downloads it once; later requests (and /api/mix) read
+the local file, which Flask and Starlette serve with Range support. Files are
+evicted least recently used first once the cache holds more than
+PREVIEW_CACHE_MAX_MB.
+"""
+import os
+import re
+import time
+import sqlite3
+import logging
+import tempfile
+import requests
+import http_client
+import metrics
+from governor import UpstreamUnavailable
+from singleflight import coalesce
+from sqlite_store import SQLiteStore, store_getter
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Set PREVIEW_CACHE_ENABLED=0 to always play previews straight from FreeSound
+PREVIEW_CACHE_ENABLED = settings.preview_cache_enabled
+# Directory holding the cached files and their SQLite index (shared by the workers on a host)
+PREVIEW_CACHE_DIR = settings.preview_cache_dir
+PREVIEW_CACHE_MAX_BYTES = settings.preview_cache_max_mb * 1024 * 1024
+# Public address of this service prefixed to cached preview URLs; empty for relative ones
+PREVIEW_CACHE_BASE_URL = settings.preview_cache_base_url.rstrip("/")
+PREVIEW_ROUTE = "/api/preview/"
+
+# Seconds between last-used updates for one file; spares a write per hit
+_TOUCH_INTERVAL = 60
+_CHUNK_SIZE = 64 * 1024
+_PREVIEW_PATH_RE = re.compile(r"^/api/preview/(\d+)$")
+
+class PreviewCache(SQLiteStore):
+    """
+    Preview files on disk plus a SQLite index of FreeSound id -> source URL,
+    size and last use. A row without a size is a known preview that is not
+    (or no longer) on disk.
+    """
+
+    def __init__(self, directory=PREVIEW_CACHE_DIR, max_bytes=PREVIEW_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        super().__init__(os.path.join(directory, "previews.db"))
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS previews (
+                    id INTEGER PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    size INTEGER,
+                    last_used REAL NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS previews_last_used ON previews (last_used) WHERE size IS NOT NULL")
+
+    def file_path(self, sound_id) -> str:
+        return os.path.join(self.directory, f"{int(sound_id)}.mp3")
+
+    def register(self, previews):
+        """
+        Remember (freesound_id, preview URL) pairs so their previews can be
+        fetched later. A sound whose preview URL changed is fetched again.
+        """
+        if not previews:
+            return
+        with self._connection() as conn:
+            conn.executemany("""
+                INSERT INTO previews (id, source) VALUES (?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    size = CASE WHEN source = excluded.source THEN size END,
+                    source = excluded.source
+            """, previews)
+
+    def source(self, sound_id):
+        """The FreeSound preview URL registered for `sound_id`, or None."""
+        row = self._connection().execute("SELECT source FROM previews WHERE id = ?", (sound_id,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, sound_id):
+        """
+        Local path of the preview for `sound_id`, downloading it on first use.
+        Returns None for an id that was never registered; raises
+        requests.RequestException or UpstreamUnavailable if the download fails.
+        """
+        row = self._connection().execute(
+            "SELECT source, size, last_used FROM previews WHERE id = ?", (sound_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        source, size, last_used = row
+        path = self.file_path(sound_id)
+        if size is not None and os.path.exists(path):
+            metrics.PREVIEW_CACHE_LOOKUPS.inc(result="hit")
+            now = time.time()
+            if now - last_used > _TOUCH_INTERVAL:
+                with self._connection() as conn:
+                    conn.execute("UPDATE previews SET last_used = ? WHERE id = ?", (now, sound_id))
+            return path
+
+        metrics.PREVIEW_CACHE_LOOKUPS.inc(result="miss")
+        _download(self, sound_id, source)
+        return path
+
+    def store(self, sound_id, response):
+        """Write a streamed download to disk (atomically, so readers never see half a file), then evict."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in response.iter_content(_CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, self.file_path(sound_id))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._connection() as conn:
+            conn.execute("UPDATE previews SET size = ?, last_used = ? WHERE id = ?", (size, time.time(), sound_id))
+        metrics.PREVIEW_CACHE_BYTES_FETCHED.inc(size)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used files until the cache fits in max_bytes."""
+        conn = self._connection()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM previews WHERE size IS NOT NULL").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute(
+            "SELECT id, size FROM previews WHERE size IS NOT NULL ORDER BY last_used"
+        ).fetchall()
+        evicted = []
+        for sound_id, size in rows:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(self.file_path(sound_id))
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted.append((sound_id,))
+        with conn:
+            conn.executemany("UPDATE previews SET size = NULL WHERE id = ?", evicted)
+        metrics.PREVIEW_CACHE_EVICTIONS.inc(len(evicted))
+
+    def size_bytes(self) -> int:
+        return self._connection().execute(
+            "SELECT COALESCE(SUM(size), 0) FROM previews WHERE size IS NOT NULL"
+        ).fetchone()[0]
+
+# Concurrent requests for a preview that is not on disk yet share one download
+@coalesce("preview_download", lambda cache, sound_id, source: sound_id)
+def _download(cache, sound_id, source):
+    response = http_client.get("freesound_preview", source, stream=True)
+    with response:
+        response.raise_for_status()
+        cache.store(sound_id, response)
+
+def public_url(sound_id) -> str:
+    """This service's URL for the cached preview of `sound_id` (relative without PREVIEW_CACHE_BASE_URL)."""
+    return f"{PREVIEW_CACHE_BASE_URL}{PREVIEW_ROUTE}{int(sound_id)}"
+
+def cached_sound_id(url):
+    """
+    The FreeSound id when `url` points at this service's cached copy of a
+    preview, either under PREVIEW_CACHE_BASE_URL or as the relative
+    /api/preview/<id>, else None.
+    """
+    if not isinstance(url, str):
+        return None
+    if PREVIEW_CACHE_BASE_URL and url.startswith(PREVIEW_CACHE_BASE_URL + "/"):
+        url = url[len(PREVIEW_CACHE_BASE_URL):]
+    match = _PREVIEW_PATH_RE.match(url)
+    return int(match.group(1)) if match else None
+
+def cache_previews(results):
+    """
+    Register the preview of every search result and point its preview_url
+    at the cached copy (the FreeSound URL stays in preview_source_url).
+    """
+    cache = get_preview_cache()
+    if cache is None:
+        return results
+    previews = [(result["id"], result["preview_url"]) for result in results if result.get("id") and result.get("preview_url")]
+    try:
+        cache.register(previews)
+    except sqlite3.Error as e:
+        logger.warning("Could not register previews: %s", e)
+        return results
+    for result in results:
+        if result.get("id") and result.get("preview_url"):
+            result["preview_source_url"] = result["preview_url"]
+            result["preview_url"] = public_url(result["id"])
+    return results
+
+def resolve_preview(sound_id):
+    """
+    (local path, None) for a preview on disk (downloaded now if need be), or
+    (None, FreeSound URL) when it cannot be fetched right now, or (None, None)
+    for an id the cache has never seen.
+    """
+    cache = get_preview_cache()
+    if cache is None:
+        return None, None
+    try:
+        return cache.get(sound_id), None
+    except (requests.exceptions.RequestException, UpstreamUnavailable, OSError) as e:
+        logger.warning("Could not cache the preview of sound %s: %s", sound_id, e)
+        return None, cache.source(sound_id)
+
+# The process-wide cache, or None when it is disabled or cannot be opened
+get_preview_cache = store_getter(PreviewCache, lambda: PREVIEW_CACHE_ENABLED, "Preview cache")
+
+metrics.Gauge("nlp_preview_cache_bytes", "Bytes of preview audio on disk.", lambda: get_preview_cache().size_bytes())
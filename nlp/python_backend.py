@@ -1,9 +1,21 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context, send_file, redirect, g
 from flask_cors import CORS
-from nlp_model import get_keywords, generate_track_names, generate_description, auto_generate_keywords, mistral_client, MODEL_NAME
+from nlp_model import generate_track_names, generate_description, stream_description, complete, stream_complete, auto_generate_keywords
+from llm_stream import iter_field_events
+from token_budget import truncate_tokens, CHAT_MESSAGE_MAX_TOKENS
+from structured_output import parse_json, StructuredOutputError
 from freesound import search_freesound
 from unsplash_image import get_unsplash_image
+from catalog import pop_soundscape, start_refill
+from mixdown import parse_tracks, stream_mix, mix_available, MixError, MixBusy, MIX_DEFAULT_DURATION, MIX_MAX_DURATION
+from preview_cache import resolve_preview
+from sound_analysis import lookup_analyses
+from knowledge_index import KnowledgeIndex
+from governor import degraded_scope
+from pipeline import run_keywords_pipeline, run_keywords_batch, iter_keywords_pipeline, StageTimer, BATCH_MAX_PROMPTS
 import json
+import time
+import metrics
 
 import logging
 logging.basicConfig(level=logging.INFO)
@@ -14,6 +26,20 @@ app = Flask(__name__)
 # Enable Cross-Origin Resource Sharing for API access from different domains
 CORS(app)
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Count every response and time it up to the headers (streams keep running after this)"""
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    start = g.get("request_start")
+    if start is not None:
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - start, route=route)
+    metrics.HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    return response
+
 # Knowledge base for the chatbot functionality
 # Contains information about SoundscapeGen features and capabilities
 SOUNDSCAPEGEN_KNOWLEDGE = """
@@ -78,75 +104,204 @@ Best Practices:
 5. Save your work regularly
 """
 
+# Chunked and indexed once at startup; chat prompts only carry the relevant chunks
+knowledge_index = KnowledgeIndex(SOUNDSCAPEGEN_KNOWLEDGE)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint to verify API is running"""
     return jsonify({"status": "healthy"}), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics for this worker process"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# Each route's request checks, work and response body live in a *_result
+# function returning (payload, status, headers), shared with the async routes
+# in asgi_backend; the route functions only adapt it to Flask.
+
+def error_result(status, message):
+    """(payload, status, headers) of a failed request."""
+    return {"success": False, "message": message}, status, {}
+
+def json_response(result):
+    """Flask response for a (payload, status, headers) result."""
+    payload, status, headers = result
+    response = jsonify(payload)
+    response.headers.update(headers)
+    return response, status
+
+def keywords_result(data):
+    """Body of /api/keywords for a parsed request body."""
+    if not data or 'str' not in data:
+        return error_result(400, "Missing 'str' parameter in the request.")
+
+    input_str = data['str']
+    with_image = bool(data.get('with_image', False))
+    timer = StageTimer()
+
+    try:
+        # Run keyword generation, FreeSound search and track naming as a staged pipeline
+        result = run_keywords_pipeline(input_str, with_image=with_image, timer=timer)
+        logger.info("/api/keywords stage timings (ms): %s", timer.timings)
+    except Exception as e:
+        logger.exception("Exception in /api/keywords")
+        return error_result(500, str(e))
+
+    headers = {"Server-Timing": timer.server_timing()}
+    # Check if the result indicates an invalid input (non-soundscape)
+    if result["invalid"]:
+        return invalid_input_payload(result["invalid"]), 200, headers
+
+    payload = {"success": True, "keywords": result["keywords"], "sounds": result["sounds"]}
+    # Return empty response if no keywords found
+    if not result["keywords"]:
+        payload = {"success": True, "message": "No keywords found, returning fallback.", "keywords": [], "sounds": []}
+    if with_image:
+        payload["image_url"] = result["image_url"]
+    return flag_degraded(payload, result["degraded"]), 200, headers
+
+def flag_degraded(payload, degraded):
+    """
+    Mark an answer that includes a fallback (FreeSound names instead of new
+    track names, keywords from the input text, a skipped image...) with
+    "degraded": true, so clients and benchmarks can tell it apart.
+    """
+    if degraded:
+        payload["degraded"] = True
+    return payload
+
+def invalid_input_payload(invalid):
+    """Response fields for input the validator rejected as not about a soundscape."""
+    return {
+        "success": False,
+        "message": invalid.get('message', "Your input does not appear to be related to a soundscape."),
+        "is_valid_input": False,
+        "suggestions": invalid.get('suggestions', [])
+    }
+
 @app.route('/api/keywords', methods=['POST'])
 def keywords():
     """
     Extract keywords from user input and find matching sounds
     
-    Expected request body: { "str": "user text description" }
-    Returns keywords and matching sounds
+    Expected request body: { "str": "user text description", "with_image": optional bool }
+    Returns keywords and matching sounds (plus "image_url" when with_image is set)
     """
-    data = request.get_json()
-    
-    # Validate request data
+    return json_response(keywords_result(request.get_json(silent=True)))
+
+def keywords_batch_result(data):
+    """Body of /api/keywords/batch for a parsed request body."""
+    prompts, error = parse_batch_prompts(data)
+    if error:
+        return error_result(400, error)
+
+    timer = StageTimer()
+    try:
+        results = run_keywords_batch(prompts, timer=timer)
+        logger.info("/api/keywords/batch of %d stage timings (ms): %s", len(prompts), timer.timings)
+    except Exception as e:
+        logger.exception("Exception in /api/keywords/batch")
+        return error_result(500, str(e))
+    payload = {"success": True, "results": [batch_item(p, r) for p, r in zip(prompts, results)]}
+    return flag_degraded(payload, any(result["degraded"] for result in results)), 200, {"Server-Timing": timer.server_timing()}
+
+@app.route('/api/keywords/batch', methods=['POST'])
+def keywords_batch():
+    """
+    Batch variant of /api/keywords for pre-generation jobs
+
+    Expected request body: { "prompts": ["user text description", ...] }
+    Returns one /api/keywords-shaped result per prompt, in order, under "results"
+    """
+    return json_response(keywords_batch_result(request.get_json(silent=True)))
+
+def parse_batch_prompts(data):
+    """Return (prompts, None) for a valid batch request body, or (None, error message)."""
+    prompts = data.get('prompts') if isinstance(data, dict) else None
+    if not isinstance(prompts, list) or not prompts or not all(isinstance(p, str) for p in prompts):
+        return None, "Missing 'prompts' parameter: expected a non-empty list of strings."
+    if len(prompts) > BATCH_MAX_PROMPTS:
+        return None, f"Too many prompts: at most {BATCH_MAX_PROMPTS} per batch."
+    return prompts, None
+
+def batch_item(prompt, result):
+    """One entry of a batch response, with the same fields /api/keywords returns for that prompt."""
+    if result["invalid"]:
+        return {"str": prompt, **invalid_input_payload(result["invalid"])}
+    return {"str": prompt, "success": True, "keywords": result["keywords"], "sounds": result["sounds"]}
+
+def keywords_stream_events(data):
+    """(events, None) for /api/keywords/stream, or (None, error result) for a bad request body."""
     if not data or 'str' not in data:
-        return jsonify(success=False, message="Missing 'str' parameter in the request."), 400
+        return None, error_result(400, "Missing 'str' parameter in the request.")
+    return iter_keywords_pipeline(data['str']), None
 
-    input_str = data['str']
-    
+@app.route('/api/keywords/stream', methods=['POST'])
+def keywords_stream():
+    """
+    Streaming variant of /api/keywords that emits an event as each stage completes
+    (validation, keywords, each sound as its search returns, renamed tracks, done)
+
+    Expected request body: { "str": "user text description" }
+    Returns newline-delimited JSON, or Server-Sent Events when the client accepts text/event-stream
+    """
+    return stream_response(keywords_stream_events(request.get_json(silent=True)), "/api/keywords/stream")
+
+def stream_response(stream, route):
+    """Stream the events of an (events, error) pair as NDJSON or Server-Sent Events, or answer the error."""
+    events, error = stream
+    if error:
+        return json_response(error)
+    sse = wants_event_stream(request.headers.get("Accept", ""))
+    return Response(
+        stream_with_context(format_stream_events(events, sse, route)),
+        mimetype=stream_media_type(sse),
+        headers=STREAM_HEADERS
+    )
+
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def wants_event_stream(accept_header):
+    """True when the client asked for Server-Sent Events instead of NDJSON."""
+    return "text/event-stream" in accept_header
+
+def stream_media_type(sse):
+    return "text/event-stream" if sse else "application/x-ndjson"
+
+def format_stream_events(events, sse, route):
+    """
+    Serialize pipeline events as SSE frames or NDJSON lines. An exception
+    mid-stream is reported as a final "error" event, since the status code
+    has already been sent.
+    """
     try:
-        # Extract keywords using Mistral-based NLP function
-        keywords_result = get_keywords(input_str, min_keywords=6)
-        # Check if the result indicates an invalid input (non-soundscape)
-        if isinstance(keywords_result, dict) and keywords_result.get('error'):
-            return jsonify(
-                success=False,
-                message=keywords_result.get('message', "Your input does not appear to be related to a soundscape."),
-                is_valid_input=False,
-                suggestions=keywords_result.get('suggestions', [])
-            ), 200
-
-        # Return empty response if no keywords found
-        if not keywords_result:
-            return jsonify(
-                success=True,
-                message="No keywords found, returning fallback.",
-                keywords=[],
-                sounds=[]
-            ), 200
-
-        # Fetch sounds from FreeSound API using the extracted keywords
-        freesound_results = search_freesound(keywords_result)
-        if not freesound_results or 'results' not in freesound_results:
-            return jsonify(success=False, message="No sounds found.", keywords=keywords_result), 404
-
-        # Limit to top 6 sounds for the response
-        top_sounds = freesound_results["results"][:6]
-
-        # Format sound data for the response
-        sounds_info = []
-        for index, sound in enumerate(top_sounds, start=1):
-            sounds_info.append({
-                "sound_number": f"Sound {index}",
-                "name": sound.get("name", "Unknown"),
-                "description": sound.get("description", "No description available"),
-                "sound_url": sound.get("download", "No URL provided"),
-                "preview_url": sound.get("preview_url", ""),
-                "freesound_id": sound.get("id")
-            })
-            
-        # Generate more descriptive track names using Mistral
-        sounds_with_better_names = generate_track_names(sounds_info)
-        return jsonify(success=True, keywords=keywords_result, sounds=sounds_with_better_names), 200
+        for event in events:
+            yield _format_stream_event(event, sse)
+    except Exception as e:
+        logger.exception("Exception in %s", route)
+        yield _format_stream_event({"event": "error", "message": str(e)}, sse)
 
+def _format_stream_event(event, sse):
+    payload = json.dumps(event)
+    if sse:
+        return f"event: {event['event']}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+def track_names_result(data):
+    """Body of /api/track-names for a parsed request body."""
+    if not data or 'sounds' not in data:
+        return error_result(400, "Missing 'sounds' parameter in the request.")
+
+    try:
+        with degraded_scope() as degraded:
+            # Generate better track names using Mistral
+            sounds_with_better_names = generate_track_names(data['sounds'])
     except Exception as e:
-        print("Exception in /api/keywords:", e)
-        return jsonify(success=False, message=str(e)), 500
+        logger.exception("Exception in /api/track-names")
+        return error_result(500, str(e))
+    return flag_degraded({"success": True, "sounds": sounds_with_better_names}, degraded), 200, {}
 
 @app.route('/api/track-names', methods=['POST'])
 def track_names():
@@ -156,23 +311,23 @@ def track_names():
     Expected request body: { "sounds": [sound objects] }
     Returns sounds with improved names
     """
-    data = request.get_json()
-    
-    # Validate request data
-    if not data or 'sounds' not in data:
-        return jsonify(success=False, message="Missing 'sounds' parameter in the request."), 400
+    return json_response(track_names_result(request.get_json(silent=True)))
 
-    sounds_info = data['sounds']
-    
+def search_sound_result(data):
+    """Body of /api/sound/search for a parsed request body."""
+    if not data or 'query' not in data:
+        return error_result(400, "Missing 'query' parameter in the request.")
+
+    query = data['query']
     try:
-        # Generate better track names using Mistral
-        sounds_with_better_names = generate_track_names(sounds_info)
-        
-        return jsonify(success=True, sounds=sounds_with_better_names), 200
-        
+        with degraded_scope() as degraded:
+            sound_info = find_sound(query)
     except Exception as e:
-        print("Exception in /api/track-names:", e)
-        return jsonify(success=False, message=str(e)), 500
+        logger.exception("Exception in /api/sound/search")
+        return error_result(500, str(e))
+    if sound_info is None:
+        return error_result(404, f"No sound found for '{query}'.")
+    return flag_degraded({"success": True, "sound": sound_info}, degraded), 200, {}
 
 @app.route('/api/sound/search', methods=['POST'])
 def search_sound():
@@ -182,49 +337,63 @@ def search_sound():
     Expected request body: { "query": "search term" }
     Returns a single matching sound
     """
-    data = request.get_json()
-    
-    # Validate request data
-    if not data or 'query' not in data:
-        return jsonify(success=False, message="Missing 'query' parameter in the request."), 400
+    return json_response(search_sound_result(request.get_json(silent=True)))
 
-    query = data['query']
-    
+def find_sound(query):
+    """
+    Find the best FreeSound match for a query and give it a better track name.
+    Returns the formatted sound, or None if nothing matched.
+    """
+    # Use the query directly as a keyword
+    keywords = [query]
+
+    # Fetch a single sound from FreeSound API
+    freesound_results = search_freesound(keywords, max_per_keyword=1)
+    if not freesound_results or 'results' not in freesound_results or not freesound_results["results"]:
+        return None
+
+    # Get the first result
+    sound = freesound_results["results"][0]
+
+    # Format the sound data
+    sound_info = {
+        "sound_number": "Sound 1",
+        "name": sound.get("name", "Unknown"),
+        "description": sound.get("description", "No description available").strip(),
+        "sound_url": sound.get("download", "No URL provided"),
+        "preview_url": sound.get("preview_url", ""),
+        "freesound_id": sound.get("id"),
+        "analysis": lookup_analyses([sound.get("id")]).get(sound.get("id"))
+    }
+
+    # Generate a better track name using Mistral
     try:
-        # Use the query directly as a keyword
-        keywords = [query]
-        
-        # Fetch a single sound from FreeSound API
-        freesound_results = search_freesound(keywords, max_per_keyword=1)
-        if not freesound_results or 'results' not in freesound_results or not freesound_results["results"]:
-            return jsonify(success=False, message=f"No sound found for '{query}'."), 404
-
-        # Get the first result
-        sound = freesound_results["results"][0]
-        
-        # Format the sound data
-        sound_info = {
-            "sound_number": "Sound 1",
-            "name": sound.get("name", "Unknown"),
-            "description": sound.get("description", "No description available").strip(),
-            "sound_url": sound.get("download", "No URL provided"),
-            "preview_url": sound.get("preview_url", ""),
-            "freesound_id": sound.get("id")
-        }
-        
-        # Generate a better track name using Mistral
-        try:
-            sounds_with_better_names = generate_track_names([sound_info])
-            return jsonify(success=True, sound=sounds_with_better_names[0]), 200
-        except Exception as e:
-            # If track name generation fails, return the original sound info
-            print("Error generating better track name:", e)
-            return jsonify(success=True, sound=sound_info), 200
+        return generate_track_names([sound_info])[0]
+    except Exception:
+        # If track name generation fails, return the original sound info
+        logger.exception("Error generating better track name")
+        return sound_info
+
+def description_result(data):
+    """Body of /api/description for a parsed request body."""
+    data = data or {}
+    if 'str' not in data:
+        return error_result(400, "Missing 'str' parameter")
 
+    try:
+        with degraded_scope() as degraded:
+            # Generate description using Mistral
+            desc = generate_description(data['str'])
     except Exception as e:
-        print("Exception in /api/sound/search:", e)
-        return jsonify(success=False, message=str(e)), 500
-    
+        logger.exception("Error in /api/description route")
+        return error_result(500, str(e))
+    if not desc and degraded:
+        # Shed under load: worth retrying shortly, unlike a failed generation
+        return error_result(503, "Description service is busy, please retry.")
+    if not desc:
+        return error_result(500, "Failed to generate description.")
+    return {"success": True, "description": desc}, 200, {}
+
 @app.route('/api/description', methods=['POST'])
 def get_description():
     """
@@ -233,24 +402,38 @@ def get_description():
     Expected request body: { "str": "comma-separated track names" }
     Returns a descriptive paragraph
     """
-    try:
-        data = request.get_json() or {}
-        # Validate request data
-        if 'str' not in data:
-            return jsonify(success=False, message="Missing 'str' parameter"), 400
+    return json_response(description_result(request.get_json(silent=True)))
 
-        # Generate description using Mistral
-        desc = generate_description(data['str'])
-        if not desc:
-            return jsonify(success=False, message="Failed to generate description."), 500
+def description_stream_events(data):
+    """(events, None) for /api/description/stream, or (None, error result) for a bad request body."""
+    data = data or {}
+    if 'str' not in data:
+        return None, error_result(400, "Missing 'str' parameter")
+    return require_field(stream_description(data['str']), "description", "Failed to generate description."), None
 
-        # Return a JSON with success = true, description = ...
-        return jsonify(success=True, description=desc), 200
+@app.route('/api/description/stream', methods=['POST'])
+def get_description_stream():
+    """
+    Token-streaming variant of /api/description
 
-    except Exception as e:
-        print("Error in /api/description route:", e)
-        return jsonify(success=False, message=str(e)), 500
-    
+    Expected request body: { "str": "comma-separated track names" }
+    Streams {"event": "token", "text": ...} events, then {"event": "done", "description": ...}
+    """
+    return stream_response(description_stream_events(request.get_json(silent=True)), "/api/description/stream")
+
+def image_result(data):
+    """Body of /api/get-image for a parsed request body."""
+    if not data or "str" not in data:
+        return error_result(400, "Missing 'str' parameter.")
+
+    with degraded_scope() as degraded:
+        # Call Unsplash API to get an image matching the input
+        result = get_unsplash_image(data["str"])
+    if result.get("image_url"):
+        return {"success": True, **result}, 200, {}
+    if degraded:
+        return error_result(503, "Image search is busy, please retry.")
+    return error_result(404, "No image found.")
 
 @app.route("/api/get-image", methods=["POST"])
 def get_image():
@@ -260,18 +443,83 @@ def get_image():
     Expected request body: { "str": "image search term" }
     Returns image URL and attribution information
     """
-    data = request.get_json()
-    # Validate request data
-    if not data or "str" not in data:
-        return jsonify(success=False, message="Missing 'str' parameter."), 400
+    return json_response(image_result(request.get_json(silent=True)))
 
-    user_input = data["str"]
-    # Call Unsplash API to get an image matching the input
-    result = get_unsplash_image(user_input)
-    if result.get("image_url"):
-        return jsonify(success=True, **result), 200
-    else:
-        return jsonify(success=False, message="No image found."), 404
+# Previews never change, so clients may keep them for a day
+PREVIEW_MAX_AGE = 24 * 60 * 60
+
+@app.route('/api/preview/<int:sound_id>', methods=['GET'])
+def get_preview(sound_id):
+    """
+    Serve a FreeSound preview from the local cache, downloading it on first use.
+    Range requests are answered with partial content; if the preview cannot be
+    fetched the client is redirected to FreeSound.
+    """
+    path, source = resolve_preview(sound_id)
+    if path is not None:
+        return send_file(path, mimetype="audio/mpeg", conditional=True, max_age=PREVIEW_MAX_AGE)
+    if source is not None:
+        return redirect(source)
+    return json_response(error_result(404, "Unknown preview."))
+
+def mix_audio(data):
+    """
+    (encoded audio chunks, None) for /api/mix, or (None, error result). The
+    first chunk is rendered here, so decoding errors still get a JSON answer.
+    """
+    mix_request, error = parse_mix_request(data)
+    if error:
+        return None, error_result(400, error)
+    if not mix_available():
+        return None, error_result(503, "Audio mixing is not available on this server.")
+
+    try:
+        return stream_mix(*mix_request), None
+    except MixBusy as e:
+        return None, error_result(503, str(e))
+    except MixError as e:
+        return None, error_result(422, str(e))
+
+@app.route('/api/mix', methods=['POST'])
+def mix():
+    """
+    Render a soundscape to one MP3 on the server
+
+    Expected request body: { "tracks": [{"url": preview URL, "volume": dB from -30 to 0, "pan": -1 to 1}],
+                             "duration": optional seconds (default 90), "loop": optional bool (default true) }
+    Streams the encoded mix (audio/mpeg) while it is being rendered
+    """
+    audio, error = mix_audio(request.get_json(silent=True))
+    if error:
+        return json_response(error)
+    return Response(stream_with_context(audio), mimetype="audio/mpeg", headers=MIX_RESPONSE_HEADERS)
+
+MIX_RESPONSE_HEADERS = {"Content-Disposition": 'attachment; filename="soundscape.mp3"', "X-Accel-Buffering": "no"}
+
+def parse_mix_request(data):
+    """Return ((tracks, duration, loop), None) for a valid mix request body, or (None, error message)."""
+    if not isinstance(data, dict):
+        return None, "Missing 'tracks' parameter in the request."
+    try:
+        tracks = parse_tracks(data.get('tracks'))
+    except MixError as e:
+        return None, str(e)
+
+    duration = data.get('duration', MIX_DEFAULT_DURATION)
+    if isinstance(duration, bool) or not isinstance(duration, (int, float)) or not 0 < duration <= MIX_MAX_DURATION:
+        return None, f"'duration' must be a number of seconds between 0 and {MIX_MAX_DURATION:g}."
+    return (tracks, float(duration), bool(data.get('loop', True))), None
+
+def chat_result(data):
+    """Body of /api/chat for a parsed request body."""
+    if not data or 'message' not in data:
+        return error_result(400, "Missing 'message' parameter")
+
+    try:
+        return {"success": True, "response": generate_chat_response(data['message'])}, 200, {}
+    except Exception as e:
+        logger.exception("Error in chat endpoint")
+        return error_result(500, str(e))
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
@@ -281,111 +529,135 @@ def chat():
     Expected request body: { "message": "user question" }
     Returns an AI-generated response about SoundscapeGen
     """
+    return json_response(chat_result(request.get_json(silent=True)))
+
+def build_chat_prompt(user_message):
+    """
+    Prompt that answers a user question as {"response": ...} from the
+    knowledge base chunks most relevant to it.
+    """
+    user_message = truncate_tokens(user_message, CHAT_MESSAGE_MAX_TOKENS)
+    return f"""
+    You are a helpful assistant for SoundscapeGen, a soundscape creation platform. 
+    Use the following knowledge base to answer the user's question. If the answer 
+    isn't in the knowledge base, say you don't know and suggest more applicable questions.
+
+    Remove any markdown formatting from the response.
+
+    Knowledge Base:
+    {knowledge_index.context(user_message)}
+
+    User Question: {user_message}
+
+    Provide a clear, concise, and helpful response based on the knowledge base.
+    If the question is about something not covered in the knowledge base, politely 
+    say you don't have that information but you can help with SoundscapeGen-related 
+    questions.
+
+    Return your response in a JSON format with a single field 'response'.
+    """
+
+CHAT_RESPONSE_SCHEMA = {"type": "object", "required": ["response"], "properties": {"response": {"type": "string"}}}
+
+def generate_chat_response(user_message):
+    """
+    Answer a user question about SoundscapeGen: straight from the FAQ when it
+    matches one, otherwise from the knowledge base using Mistral.
+    Raises ValueError if Mistral returns JSON without a 'response' field.
+    """
+    answer = knowledge_index.faq_answer(user_message)
+    if answer is not None:
+        metrics.CHAT_ANSWERS.inc(source="faq")
+        return answer
+    metrics.CHAT_ANSWERS.inc(source="llm")
+
+    # Create a prompt for Mistral with knowledge base context
+    prompt = build_chat_prompt(user_message)
+
+    # Call Mistral API to generate a response
+    raw_text = complete(prompt, task="chat", use_cache=False, json_mode=True)
+
     try:
-        data = request.get_json()
-        # Validate request data
-        if not data or 'message' not in data:
-            return jsonify(success=False, message="Missing 'message' parameter"), 400
-
-        user_message = data['message']
-        
-        # Create a prompt for Mistral with knowledge base context
-        prompt = f"""
-        You are a helpful assistant for SoundscapeGen, a soundscape creation platform. 
-        Use the following knowledge base to answer the user's question. If the answer 
-        isn't in the knowledge base, say you don't know and suggest more applicable questions.
-
-        Remove any markdown formatting from the response.
-
-        Knowledge Base:
-        {SOUNDSCAPEGEN_KNOWLEDGE}
-
-        User Question: {user_message}
-
-        Provide a clear, concise, and helpful response based on the knowledge base.
-        If the question is about something not covered in the knowledge base, politely 
-        say you don't have that information but you can help with SoundscapeGen-related 
-        questions.
-
-        Return your response in a JSON format with a single field 'response'.
-        """
-
-        # Call Mistral API to generate a response
-        response = mistral_client.chat.complete(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-        )
-
-        # Extract the response text
-        raw_text = response.choices[0].message.content.strip()
-        
-        # Clean up response if wrapped in code blocks
-        if "```json" in raw_text:
-            raw_text = raw_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in raw_text:
-            raw_text = raw_text.split("```")[1].strip()
-
-        try:
-            # Parse the JSON response
-            data = json.loads(raw_text)
-            if not isinstance(data, dict) or "response" not in data:
-                raise ValueError("Missing 'response' in Mistral response")
-
-            return jsonify(success=True, response=data["response"]), 200
-
-        except json.JSONDecodeError as e:
-            # Fallback: if parsing fails, return the raw text as the response
-            return jsonify(success=True, response=raw_text), 200
+        # Parse the JSON response
+        data = parse_json(raw_text, CHAT_RESPONSE_SCHEMA, task="chat")
+    except StructuredOutputError as e:
+        if e.reason == "no_json":
+            # Fallback: if the model answered in plain text, return it as the response
+            return raw_text
+        raise ValueError("Missing 'response' in Mistral response")
+    return data["response"]
+
+def chat_stream_events(data):
+    """(events, None) for /api/chat/stream, or (None, error result) for a bad request body."""
+    if not data or 'message' not in data:
+        return None, error_result(400, "Missing 'message' parameter")
+    return stream_chat_response(data['message']), None
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Token-streaming variant of /api/chat
 
+    Expected request body: { "message": "user question" }
+    Streams {"event": "token", "text": ...} events, then {"event": "done", "response": ...}
+    """
+    return stream_response(chat_stream_events(request.get_json(silent=True)), "/api/chat/stream")
+
+def stream_chat_response(user_message):
+    """Token-streaming variant of generate_chat_response; yields llm_stream events."""
+    answer = knowledge_index.faq_answer(user_message)
+    if answer is not None:
+        metrics.CHAT_ANSWERS.inc(source="faq")
+        return iter([{"event": "token", "text": answer}, {"event": "done", "response": answer}])
+    metrics.CHAT_ANSWERS.inc(source="llm")
+    deltas = stream_complete(build_chat_prompt(user_message), use_cache=False, task="chat", json_mode=True)
+    events = iter_field_events(deltas, "response", task="chat")
+    return require_field(events, "response", "Missing 'response' in Mistral response")
+
+
+def require_field(events, field, error_message):
+    """Replace a final "done" event without a usable `field` by an "error" event."""
+    for event in events:
+        if event["event"] == "done" and not event.get(field):
+            yield {"event": "error", "message": error_message}
+        else:
+            yield event
+
+def auto_keywords_result():
+    """Body of /api/auto-keywords."""
+    try:
+        # Serve a ready-made soundscape when one is available
+        entry = pop_soundscape()
+        if entry is not None:
+            return {"success": True, "keywords": entry["keywords"], "sounds": entry["sounds"]}, 200, {}
+
+        with degraded_scope() as degraded:
+            # Use Mistral to generate keywords
+            keywords_result = auto_generate_keywords(min_keywords=6)
+
+            # Return fallback if no keywords
+            if not keywords_result:
+                return {"success": True, "message": "No keywords generated, returning fallback.", "keywords": [], "sounds": []}, 200, {}
+
+            # Search FreeSound and rename the top sounds
+            result = run_keywords_pipeline(None, keywords=keywords_result)
     except Exception as e:
-        print(f"Error in chat endpoint: {str(e)}")
-        return jsonify(success=False, message=str(e)), 500
+        logger.exception("Exception in /api/auto-keywords")
+        return error_result(500, str(e))
+    payload = {"success": True, "keywords": keywords_result, "sounds": result["sounds"]}
+    return flag_degraded(payload, degraded), 200, {}
 
 @app.route('/api/auto-keywords', methods=['GET']) 
 def auto_keywords():
     """
     Auto-generates keywords using Mistral and finds matching sounds.
-    Returns keywords and matching sounds.
+    Returns keywords and matching sounds, from the precomputed catalog when it has an entry.
     """
-    try:
-        # Use Mistral to generate keywords
-        keywords_result = auto_generate_keywords(min_keywords=6)
-
-        # Return fallback if no keywords
-        if not keywords_result:
-            return jsonify(
-                success=True,
-                message="No keywords generated, returning fallback.",
-                keywords=[],
-                sounds=[]
-            ), 200
-
-        # Fetch sounds from FreeSound
-        freesound_results = search_freesound(keywords_result)
-        if not freesound_results or 'results' not in freesound_results:
-            return jsonify(success=False, message="No sounds found.", keywords=keywords_result), 404
-
-        # Format top 6 sounds
-        top_sounds = freesound_results["results"][:6]
-        sounds_info = []
-        for index, sound in enumerate(top_sounds, start=1):
-            sounds_info.append({
-                "sound_number": f"Sound {index}",
-                "name": sound.get("name", "Unknown"),
-                "description": sound.get("description", "No description available"),
-                "sound_url": sound.get("download", "No URL provided"),
-                "preview_url": sound.get("preview_url", ""),
-                "freesound_id": sound.get("id")
-            })
-
-        # Generate better names
-        sounds_with_better_names = generate_track_names(sounds_info)
-
-        return jsonify(success=True, keywords=keywords_result, sounds=sounds_with_better_names), 200
+    return json_response(auto_keywords_result())
 
-    except Exception as e:
-        print("Exception in /api/auto-keywords:", e)
-        return jsonify(success=False, message=str(e)), 500
+# Every server imports this module at startup (the ASGI app mounts it too), so the
+# catalog is filling before the first /api/auto-keywords request arrives
+start_refill()
 
 # Run the Flask application when this script is executed directly
 if __name__ == '__main__':
@@ -0,0 +1,216 @@
+import os
+import fcntl
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import settings
+from freesound_index import get_index
+
+logger = logging.getLogger(__name__)
+
+# Set SEMANTIC_SEARCH=1 to answer keywords from embeddings before calling FreeSound
+SEMANTIC_SEARCH = settings.semantic_search
+# Sentence-embedding model (Hugging Face id) used for sounds and keywords
+SEMANTIC_MODEL = settings.semantic_model
+# Cosine similarity a sound needs to count as a match for a keyword
+SEMANTIC_MIN_SCORE = settings.semantic_min_score
+# Embedding files live next to the FreeSound index
+SEMANTIC_INDEX_DIR = settings.semantic_index_dir
+
+_EMBED_BATCH_SIZE = 64
+
+class SemanticIndex:
+    """
+    Embedding matrix over the sounds stored in the FreeSound index.
+
+    Each record is a FreeSound id (int64) followed by its L2-normalized
+    float32 vector, appended to one flat file that is read back memory-mapped,
+    so a torn append shows up as a trailing partial record. Every worker on a
+    host appends to the same file, one at a time under an flock on a sidecar
+    lock file. Queries are embedded as one batch and scored with a single
+    matrix product, so every keyword of a request is answered in one pass.
+    """
+
+    def __init__(self, directory=SEMANTIC_INDEX_DIR, model_name=SEMANTIC_MODEL):
+        self.model_name = model_name
+        self.records_path = os.path.join(directory, "semantic_records.bin")
+        self.lock_path = os.path.join(directory, "semantic.lock")
+        self._tokenizer = None
+        self._model = None
+        self._dim = None
+        self._matrix = None
+        self._ids = None
+        self._known_ids = set()
+        self._lock = threading.Lock()
+        # The fast tokenizer and the model are not thread-safe ("Already borrowed"),
+        # and search() embeds on request threads while refresh() embeds in the background
+        self._model_lock = threading.Lock()
+
+    def is_ready(self) -> bool:
+        """True once the model is loaded and at least one sound is embedded."""
+        return self._model is not None and self._matrix is not None and len(self._ids) > 0
+
+    def _load_model(self):
+        if self._model is not None:
+            return
+        with self._model_lock:
+            if self._model is not None:
+                return
+            # Imported here so the service starts without paying for numpy/torch unless enabled
+            import torch
+            from transformers import AutoModel, AutoTokenizer
+
+            torch.set_grad_enabled(False)
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            model = AutoModel.from_pretrained(self.model_name).eval()
+            self._dim = model.config.hidden_size
+            self._open_files()
+            self._model = model
+
+    def embed(self, texts):
+        """Mean-pooled, L2-normalized embeddings for a list of texts, shape (len(texts), dim)."""
+        import numpy as np
+        self._load_model()
+        batches = []
+        for start in range(0, len(texts), _EMBED_BATCH_SIZE):
+            # Locked per batch, so a long refresh lets queries through between batches
+            with self._model_lock:
+                encoded = self._tokenizer(
+                    texts[start:start + _EMBED_BATCH_SIZE], padding=True, truncation=True,
+                    max_length=128, return_tensors="pt"
+                )
+                hidden = self._model(**encoded).last_hidden_state.numpy()
+            mask = encoded["attention_mask"].numpy()[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            batches.append(pooled)
+        vectors = np.concatenate(batches).astype(np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def _record_dtype(self):
+        import numpy as np
+        return np.dtype([("id", "<i8"), ("vector", "<f4", (self._dim,))])
+
+    def _open_files(self):
+        import numpy as np
+        record = self._record_dtype()
+        size = os.path.getsize(self.records_path) if os.path.exists(self.records_path) else 0
+        # A worker that died mid-append leaves a partial record at the end; ignore it
+        count = size // record.itemsize
+        if not count:
+            self._matrix, self._ids = None, np.empty(0, dtype=np.int64)
+            self._known_ids = set()
+            return
+        records = np.memmap(self.records_path, dtype=record, mode="r", shape=(count,))
+        self._ids = np.asarray(records["id"])
+        # Strided view of the mapped file: rows stay on disk until scored
+        self._matrix = records["vector"]
+        self._known_ids = set(self._ids.tolist())
+
+    def refresh(self):
+        """Embed every indexed sound that is not in the matrix yet and remap the files."""
+        index = get_index()
+        if index is None:
+            return
+        import numpy as np
+        with self._lock:
+            self._load_model()
+            os.makedirs(os.path.dirname(self.records_path) or ".", exist_ok=True)
+            with open(self.lock_path, "a") as lock_file:
+                # Other workers append to the same file; wait for their refresh
+                # and embed only what they did not already add
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._drop_partial_record()
+                self._open_files()
+                new_rows = [row for row in index.list_sounds() if row["id"] not in self._known_ids]
+                if not new_rows:
+                    return
+
+                texts = [f"{row['name']}. {row['description'][:300]}" for row in new_rows]
+                records = np.empty(len(new_rows), dtype=self._record_dtype())
+                records["id"] = [row["id"] for row in new_rows]
+                records["vector"] = self.embed(texts)
+                with open(self.records_path, "ab") as f:
+                    records.tofile(f)
+                self._open_files()
+
+    def _drop_partial_record(self):
+        """Truncate a torn record left by a worker that died mid-append (call under the file lock)."""
+        if not os.path.exists(self.records_path):
+            return
+        size = os.path.getsize(self.records_path)
+        whole = size - size % self._record_dtype().itemsize
+        if whole != size:
+            logger.warning("Dropping a partial record at the end of %s", self.records_path)
+            os.truncate(self.records_path, whole)
+
+    def search(self, queries, k=3, min_score=SEMANTIC_MIN_SCORE):
+        """
+        Top-k FreeSound ids for each query, scored by cosine similarity.
+
+        Returns:
+            list: one list of (freesound_id, score) per query, best first,
+                  containing only matches scoring at least `min_score`
+        """
+        if not queries or not self.is_ready():
+            return [[] for _ in queries]
+
+        import numpy as np
+        matrix, ids = self._matrix, self._ids
+        query_vectors = self.embed(list(queries))
+        scores = matrix @ query_vectors.T  # (N, Q)
+
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]  # unordered top-k rows per query
+        top_scores = np.take_along_axis(scores, top, axis=0)
+        order = np.argsort(-top_scores, axis=0)
+        top = np.take_along_axis(top, order, axis=0)
+        top_scores = np.take_along_axis(top_scores, order, axis=0)
+
+        results = []
+        for column in range(len(queries)):
+            matches = [
+                (int(ids[row]), float(score))
+                for row, score in zip(top[:, column], top_scores[:, column])
+                if score >= min_score
+            ]
+            results.append(matches)
+        return results
+
+semantic_index = SemanticIndex()
+
+# Embedding runs off the request path, one refresh at a time
+_refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-refresh")
+_refresh_pending = threading.Event()
+
+def schedule_refresh():
+    """Queue a background refresh unless one is already waiting to run."""
+    if not SEMANTIC_SEARCH or _refresh_pending.is_set():
+        return
+    _refresh_pending.set()
+    _refresh_executor.submit(_run_refresh)
+
+def _run_refresh():
+    _refresh_pending.clear()
+    try:
+        semantic_index.refresh()
+    except Exception as e:
+        logger.error("Semantic index refresh failed: %s", e)
+
+def semantic_search(queries, k=3):
+    """
+    Answer keywords from the embedding index. Returns {query: [sound ids]} for
+    the queries with at least `k` good matches; the rest need a FreeSound search.
+    """
+    if not SEMANTIC_SEARCH:
+        return {}
+    if not semantic_index.is_ready():
+        # Load the model and embed the catalog in the background for next time
+        schedule_refresh()
+        return {}
+
+    answered = {}
+    for query, matches in zip(queries, semantic_index.search(queries, k=k)):
+        if len(matches) >= k:
+            answered[query] = [sound_id for sound_id, _ in matches]
+    return answered
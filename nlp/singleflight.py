@@ -0,0 +1,243 @@
+import json
+import time
+import uuid
+import hashlib
+import logging
+import functools
+import threading
+from concurrent.futures import Future, CancelledError
+import metrics
+from config import settings
+from llm_cache import connect_redis
+from governor import degraded_scope, degraded_reasons, mark_degraded, carry_degraded
+
+logger = logging.getLogger(__name__)
+
+# Set SINGLEFLIGHT_ENABLED=0 to let every caller do its own upstream work
+SINGLEFLIGHT_ENABLED = settings.singleflight_enabled
+# Seconds a waiting caller trusts another worker's call before doing the work itself
+SINGLEFLIGHT_WAIT = settings.singleflight_wait
+# Seconds a finished result stays in Redis for workers that were still polling
+SINGLEFLIGHT_RESULT_TTL = settings.singleflight_result_ttl
+REDIS_URL = settings.redis_url
+
+# How often a waiting worker polls Redis for the leader's result
+_POLL_INTERVAL = 0.05
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one computation.
+
+    Within a process the first caller (the leader) runs the function and every
+    concurrent caller with the same key waits for and receives its result. With
+    Redis configured, the process leaders also coordinate across workers: one
+    takes a short-lived Redis lock and runs the function, the others poll for
+    the JSON result it publishes. Results must therefore be JSON-serializable.
+    Callers that share a result also share the leader's mark_degraded()
+    reasons. Any Redis error, or a leader that does not finish within SINGLEFLIGHT_WAIT,
+    degrades to running the function locally.
+    """
+
+    def __init__(self, name, redis_url=REDIS_URL, wait=SINGLEFLIGHT_WAIT, result_ttl=SINGLEFLIGHT_RESULT_TTL):
+        self.name = name
+        self.wait = wait
+        self.result_ttl = result_ttl
+        self._calls = {}  # key -> Future shared by the callers in this process
+        self._lock = threading.Lock()
+        self._redis = connect_redis(redis_url) if redis_url else None
+
+    def do(self, key, fn, *args, **kwargs):
+        """Return fn(*args, **kwargs), sharing one call among concurrent callers with the same key."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            metrics.SINGLEFLIGHT_CALLS.inc(name=self.name, role="follower")
+            value = call.result()
+            for reason in call.degraded:
+                mark_degraded(reason)
+            return value
+
+        try:
+            with degraded_scope() as reasons:
+                value = self._do_shared(key, fn, *args, **kwargs)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            for reason in reasons:
+                mark_degraded(reason)
+            call.degraded = reasons
+            call.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def _do_shared(self, key, fn, *args, **kwargs):
+        """Run fn once across workers via Redis, or locally when Redis is not available."""
+        if self._redis is None:
+            metrics.SINGLEFLIGHT_CALLS.inc(name=self.name, role="leader")
+            return fn(*args, **kwargs)
+
+        lock_key = f"sf:{self.name}:{key}:lock"
+        result_key = f"sf:{self.name}:{key}:result"
+        token = uuid.uuid4().hex
+        try:
+            acquired = self._redis.set(lock_key, token, nx=True, px=int(self.wait * 1000))
+        except Exception as e:
+            logger.warning("Single-flight Redis lock failed: %s", e)
+            acquired = True
+            token = None
+
+        if acquired:
+            metrics.SINGLEFLIGHT_CALLS.inc(name=self.name, role="leader")
+            try:
+                value = fn(*args, **kwargs)
+            except BaseException:
+                # Free the lock at once: followers see it gone without a result and make
+                # the call themselves instead of polling for the whole SINGLEFLIGHT_WAIT
+                if token is not None:
+                    self._release(lock_key, token)
+                raise
+            if token is not None:
+                self._publish(lock_key, result_key, token, value)
+            return value
+
+        found, published = self._await_result(lock_key, result_key)
+        if found:
+            metrics.SINGLEFLIGHT_CALLS.inc(name=self.name, role="remote_follower")
+            for reason in published["degraded"]:
+                mark_degraded(reason)
+            return published["value"]
+        metrics.SINGLEFLIGHT_CALLS.inc(name=self.name, role="leader")
+        return fn(*args, **kwargs)
+
+    def _publish(self, lock_key, result_key, token, value):
+        try:
+            published = {"value": value, "degraded": degraded_reasons() or []}
+            self._redis.set(result_key, json.dumps(published), px=int(self.result_ttl * 1000))
+        except Exception as e:
+            logger.warning("Single-flight Redis publish failed: %s", e)
+        self._release(lock_key, token)
+
+    def _release(self, lock_key, token):
+        try:
+            # Only release the lock if it is still ours (it may have expired and been retaken)
+            if self._redis.get(lock_key) == token.encode("utf-8"):
+                self._redis.delete(lock_key)
+        except Exception as e:
+            logger.warning("Single-flight Redis unlock failed: %s", e)
+
+    def _await_result(self, lock_key, result_key):
+        """Poll for another worker's result; returns (found, value)."""
+        expires_at = time.monotonic() + self.wait
+        try:
+            while time.monotonic() < expires_at:
+                raw = self._redis.get(result_key)
+                if raw is not None:
+                    return True, json.loads(raw)
+                if not self._redis.exists(lock_key):
+                    # The leader finished without publishing (or failed); check once more
+                    raw = self._redis.get(result_key)
+                    return (True, json.loads(raw)) if raw is not None else (False, None)
+                time.sleep(_POLL_INTERVAL)
+        except Exception as e:
+            logger.warning("Single-flight Redis poll failed: %s", e)
+        return False, None
+
+class CoalescingExecutor:
+    """
+    Submit-time single-flight for work queued on a thread pool. A task whose key
+    is already queued or running is not submitted again; the caller gets its own
+    view of the shared future instead. Cancelling a view only cancels the
+    shared task once every caller waiting on it has cancelled.
+    """
+
+    def __init__(self, name, executor):
+        self.name = name
+        self.executor = executor
+        self._inflight = {}  # key -> [shared future, number of live views]
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, **kwargs):
+        if not SINGLEFLIGHT_ENABLED:
+            return self.executor.submit(carry_degraded(fn), *args, **kwargs)
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is None or entry[0].cancelled():
+                reasons = []
+                shared = self.executor.submit(_collect_degraded, reasons, fn, *args, **kwargs)
+                entry = self._inflight[key] = [shared, 0, reasons]
+                role = "leader"
+            else:
+                shared, _, reasons = entry
+                role = "follower"
+            entry[1] += 1
+        metrics.SINGLEFLIGHT_CALLS.inc(name=self.name, role=role)
+
+        # Every caller sharing the task also shares its fallbacks
+        caller = degraded_reasons()
+        view = Future()
+        view.add_done_callback(lambda v: v.cancelled() and self._release(key, shared))
+        shared.add_done_callback(lambda f: self._settle(key, f, view, caller, reasons))
+        return view
+
+    def _release(self, key, shared):
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is None or entry[0] is not shared:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._inflight[key]
+        shared.cancel()
+
+    def _settle(self, key, shared, view, caller, reasons):
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry is not None and entry[0] is shared:
+                del self._inflight[key]
+        if not view.set_running_or_notify_cancel():
+            return
+        if shared.cancelled():
+            view.set_exception(CancelledError())
+        elif shared.exception() is not None:
+            view.set_exception(shared.exception())
+        else:
+            if caller is not None:
+                caller.extend(reason for reason in reasons if reason not in caller)
+            view.set_result(shared.result())
+
+def _collect_degraded(reasons, fn, *args, **kwargs):
+    with degraded_scope(reasons):
+        return fn(*args, **kwargs)
+
+def flight_key(*parts) -> str:
+    """Stable digest of JSON-serializable call arguments."""
+    encoded = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def coalesce(name, key_func):
+    """
+    Decorator that routes calls through a SingleFlight named `name`.
+    `key_func` receives the call's arguments and returns the parts that make
+    two calls identical; they are hashed with flight_key. When it returns
+    None the call runs on its own.
+    """
+    flight = SingleFlight(name)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            parts = key_func(*args, **kwargs) if SINGLEFLIGHT_ENABLED else None
+            if parts is None:
+                return fn(*args, **kwargs)
+            return flight.do(flight_key(parts), fn, *args, **kwargs)
+        wrapper.flight = flight
+        return wrapper
+    return decorator
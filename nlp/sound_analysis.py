@@ -0,0 +1,291 @@
+"""
+Loudness, peak and loop-point analysis of FreeSound previews.
+
+Every sound that appears in search results is queued once for analysis on a
+small worker pool, so responses never wait for it. The worker decodes the
+preview (from the preview cache when it is on) and measures, with NumPy over
+the whole decoded signal:
+
+- integrated loudness (ITU-R BS.1770: K-weighting applied in the frequency
+  domain, 400 ms blocks, absolute and relative gating), and the mixer volume
+  that brings the sound to SOUND_ANALYSIS_TARGET_LUFS;
+- sample peak in dBFS;
+- a loop point: the end position whose surroundings best match the start
+  (normalised cross-correlation, computed with FFTs), so looping from
+  loop_end back to loop_start does not click.
+
+Results are stored per FreeSound id and attached to the sounds returned by
+/api/keywords and /api/sound/search as "analysis" (null until available).
+"""
+import time
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from mixdown import decode_audio, mix_available
+from preview_cache import resolve_preview
+from sqlite_store import SQLiteStore, store_getter
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Set SOUND_ANALYSIS_ENABLED=0 to return sounds without analysis
+SOUND_ANALYSIS_ENABLED = settings.sound_analysis_enabled
+SOUND_ANALYSIS_PATH = settings.sound_analysis_path
+SOUND_ANALYSIS_WORKERS = settings.sound_analysis_workers
+# Sounds waiting for analysis beyond this are skipped (and queued again when they reappear)
+SOUND_ANALYSIS_MAX_PENDING = settings.sound_analysis_max_pending
+# Only the start of longer previews is analysed
+SOUND_ANALYSIS_MAX_SECONDS = settings.sound_analysis_max_seconds
+# Seconds before a sound whose analysis failed is tried again
+SOUND_ANALYSIS_RETRY_AFTER = settings.sound_analysis_retry_after
+# Loudness the suggested gain aims for (EBU R128 by default)
+SOUND_ANALYSIS_TARGET_LUFS = settings.sound_analysis_target_lufs
+
+# The K-weighting coefficients below are defined at 48 kHz
+ANALYSIS_SAMPLE_RATE = 48000
+# BS.1770 K-weighting: high shelf, then high-pass, as biquad (b, a) pairs
+_K_WEIGHTING = (
+    ((1.53512485958697, -2.69169618940638, 1.19839281085285), (1.0, -1.69065929318241, 0.73248077421585)),
+    ((1.0, -2.0, 1.0), (1.0, -1.99004745483398, 0.99007225036621)),
+)
+_BLOCK_SECONDS = 0.4
+_BLOCK_STEP_SECONDS = 0.1
+_ABSOLUTE_GATE = -70.0
+_RELATIVE_GATE = -10.0
+# Half-width of the window compared at the loop seam
+_LOOP_WINDOW_SECONDS = 0.05
+# A loop keeps at least this share of the sound
+_LOOP_MIN_SHARE = 0.5
+# Mixer volume range (dB)
+_MIN_GAIN, _MAX_GAIN = -30.0, 0.0
+
+def _k_weighting(n):
+    """Frequency response of the K-weighting filter at the rfft bins of an n-sample signal."""
+    import numpy as np
+    z_inv = np.exp(-2j * np.pi * np.fft.rfftfreq(n))
+    response = np.ones_like(z_inv)
+    for b, a in _K_WEIGHTING:
+        response *= np.polyval(b[::-1], z_inv) / np.polyval(a[::-1], z_inv)
+    return response
+
+def _block_loudness(power):
+    import numpy as np
+    return -0.691 + 10 * np.log10(power)
+
+def integrated_loudness(samples, rate=ANALYSIS_SAMPLE_RATE):
+    """Integrated loudness (LUFS) of a (frames, channels) signal at 48 kHz, or None if it is silent."""
+    import numpy as np
+    n = len(samples)
+    weighted = np.fft.irfft(np.fft.rfft(samples, axis=0) * _k_weighting(n)[:, None], n=n, axis=0)
+    block = min(n, int(_BLOCK_SECONDS * rate))
+    step = int(_BLOCK_STEP_SECONDS * rate)
+    # Mean square of every 400 ms block (75% overlap) from a running sum
+    energy = np.concatenate([np.zeros((1, samples.shape[1])), np.cumsum(weighted ** 2, axis=0)])
+    starts = np.arange(0, n - block + 1, step)
+    power = ((energy[starts + block] - energy[starts]) / block).sum(axis=1)
+
+    with np.errstate(divide="ignore"):
+        power = power[_block_loudness(power) > _ABSOLUTE_GATE]
+    if not len(power):
+        return None
+    threshold = _block_loudness(power.mean()) + _RELATIVE_GATE
+    power = power[_block_loudness(power) > threshold]
+    return float(_block_loudness(power.mean()))
+
+def peak_db(samples):
+    """Sample peak in dBFS, or None if the signal is silent."""
+    import numpy as np
+    peak = float(np.abs(samples).max())
+    return float(20 * np.log10(peak)) if peak > 0 else None
+
+def loop_points(samples, rate=ANALYSIS_SAMPLE_RATE):
+    """
+    (loop_start, loop_end, score) in seconds for a seamless loop, or None for
+    a sound too short to loop. The start sits one window into the sound; the
+    end is the position in the later part of the sound whose surrounding
+    window correlates best with the start's (score from -1 to 1).
+    """
+    import numpy as np
+    mono = samples.mean(axis=1, dtype=np.float64)
+    n = len(mono)
+    w = int(_LOOP_WINDOW_SECONDS * rate)
+    earliest = max(int(n * _LOOP_MIN_SHARE), 3 * w)
+    if n - w <= earliest:
+        return None
+
+    template = mono[:2 * w]
+    # Windows centred on every candidate end from `earliest` to n - w
+    region = mono[earliest - w:]
+    candidates = len(region) - 2 * w + 1
+    size = 1 << (len(region) + 2 * w - 1).bit_length()
+    correlation = np.fft.irfft(
+        np.fft.rfft(region, size) * np.conj(np.fft.rfft(template, size)), size
+    )[:candidates]
+    energy = np.concatenate([[0.0], np.cumsum(region ** 2)])
+    window_energy = energy[2 * w:2 * w + candidates] - energy[:candidates]
+    score = correlation / np.sqrt(np.maximum(window_energy * np.dot(template, template), 1e-12))
+
+    best = int(np.argmax(score))
+    return w / rate, (earliest + best) / rate, float(np.clip(score[best], -1.0, 1.0))
+
+def analyze_samples(samples, rate=ANALYSIS_SAMPLE_RATE) -> dict:
+    """The analysis fields for a decoded (frames, channels) signal."""
+    loudness = integrated_loudness(samples, rate)
+    peak = peak_db(samples)
+    loop = loop_points(samples, rate)
+    gain = None
+    if loudness is not None:
+        gain = min(_MAX_GAIN, max(_MIN_GAIN, SOUND_ANALYSIS_TARGET_LUFS - loudness))
+    return {
+        "loudness": _round(loudness, 1),
+        "peak": _round(peak, 1),
+        "gain": _round(gain, 1),
+        "loop_start": _round(loop and loop[0], 3),
+        "loop_end": _round(loop and loop[1], 3),
+        "loop_score": _round(loop and loop[2], 2),
+        "duration": round(len(samples) / rate, 3),
+    }
+
+def _round(value, digits):
+    return None if value is None else round(value, digits)
+
+_FIELDS = ("loudness", "peak", "gain", "loop_start", "loop_end", "loop_score", "duration")
+
+class SoundAnalysisStore(SQLiteStore):
+    """Analysis results per FreeSound id, kept in SQLite and shared by the workers on a host."""
+
+    def __init__(self, path=SOUND_ANALYSIS_PATH):
+        super().__init__(path)
+        columns = ", ".join(f"{field} REAL" for field in _FIELDS)
+        with self._connection() as conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS sound_analysis (
+                    id INTEGER PRIMARY KEY,
+                    {columns},
+                    created_at REAL NOT NULL
+                )
+            """)
+            # Sounds that could not be analysed, so they are not fetched and decoded on every appearance
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sound_analysis_failures (
+                    id INTEGER PRIMARY KEY,
+                    retry_after REAL NOT NULL
+                )
+            """)
+
+    def get_many(self, sound_ids) -> dict:
+        """Stored analyses as {freesound_id: fields}; ids not analysed yet are left out."""
+        ids = [sound_id for sound_id in sound_ids if sound_id is not None]
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        rows = self._connection().execute(
+            f"SELECT id, {', '.join(_FIELDS)} FROM sound_analysis WHERE id IN ({placeholders})", ids
+        ).fetchall()
+        return {row[0]: dict(zip(_FIELDS, row[1:])) for row in rows}
+
+    def settled(self, sound_ids) -> set:
+        """The ids among `sound_ids` that are analysed, or failed recently enough not to be retried yet."""
+        ids = [sound_id for sound_id in sound_ids if sound_id is not None]
+        if not ids:
+            return set()
+        placeholders = ",".join("?" * len(ids))
+        rows = self._connection().execute(
+            f"SELECT id FROM sound_analysis WHERE id IN ({placeholders}) "
+            f"UNION SELECT id FROM sound_analysis_failures WHERE id IN ({placeholders}) AND retry_after > ?",
+            [*ids, *ids, time.time()]
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def set(self, sound_id, analysis):
+        with self._connection() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO sound_analysis (id, {', '.join(_FIELDS)}, created_at) "
+                f"VALUES (?, {', '.join('?' * len(_FIELDS))}, ?)",
+                (sound_id, *(analysis[field] for field in _FIELDS), time.time())
+            )
+            conn.execute("DELETE FROM sound_analysis_failures WHERE id = ?", (sound_id,))
+
+    def set_failed(self, sound_id, retry_after=SOUND_ANALYSIS_RETRY_AFTER):
+        """Mark `sound_id` as not analysable for `retry_after` seconds."""
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sound_analysis_failures (id, retry_after) VALUES (?, ?)",
+                (sound_id, time.time() + retry_after)
+            )
+
+    def size(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM sound_analysis").fetchone()[0]
+
+_executor = ThreadPoolExecutor(max_workers=SOUND_ANALYSIS_WORKERS, thread_name_prefix="sound-analysis")
+_pending = set()
+_pending_lock = threading.Lock()
+
+def schedule_analysis(results):
+    """Queue the FreeSound results not analysed yet (or already queued) on the analysis pool."""
+    store = get_analysis_store()
+    if store is None or not mix_available():
+        return
+    sources = {}
+    for result in results:
+        source = result.get("preview_source_url") or result.get("preview_url")
+        if result.get("id") and source:
+            sources[result["id"]] = source
+    if not sources:
+        return
+    try:
+        done = store.settled(sources)
+    except sqlite3.Error as e:
+        logger.warning("Sound analysis lookup failed: %s", e)
+        return
+
+    queued = []
+    with _pending_lock:
+        for sound_id, source in sources.items():
+            if sound_id in done or sound_id in _pending:
+                continue
+            if len(_pending) >= SOUND_ANALYSIS_MAX_PENDING:
+                metrics.SOUND_ANALYSES.inc(result="skipped")
+                continue
+            _pending.add(sound_id)
+            queued.append((sound_id, source))
+    for sound_id, source in queued:
+        _executor.submit(_analyze, store, sound_id, source)
+
+def _analyze(store, sound_id, source):
+    try:
+        # Decoding from the preview cache also warms it for playback
+        path, _ = resolve_preview(sound_id)
+        samples = decode_audio(path or source, ANALYSIS_SAMPLE_RATE, SOUND_ANALYSIS_MAX_SECONDS)
+        store.set(sound_id, analyze_samples(samples))
+    except Exception as e:
+        metrics.SOUND_ANALYSES.inc(result="failed")
+        logger.warning("Analysis of sound %s failed: %s", sound_id, e)
+        try:
+            store.set_failed(sound_id)
+        except sqlite3.Error as e:
+            logger.warning("Could not record the failed analysis of sound %s: %s", sound_id, e)
+    else:
+        metrics.SOUND_ANALYSES.inc(result="ok")
+    finally:
+        with _pending_lock:
+            _pending.discard(sound_id)
+
+def lookup_analyses(sound_ids) -> dict:
+    """Stored analyses for `sound_ids` as {freesound_id: fields}; never waits for pending ones."""
+    store = get_analysis_store()
+    if store is None:
+        return {}
+    try:
+        return store.get_many(sound_ids)
+    except sqlite3.Error as e:
+        logger.warning("Sound analysis lookup failed: %s", e)
+        return {}
+
+# The process-wide store, or None when analysis is disabled or the store cannot be opened
+get_analysis_store = store_getter(
+    SoundAnalysisStore, lambda: SOUND_ANALYSIS_ENABLED, "Sound analysis store",
+    "nlp_sound_analysis_entries", "Sounds with a stored analysis."
+)
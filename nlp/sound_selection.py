@@ -0,0 +1,110 @@
+import re
+import metrics
+from config import settings
+
+# Sounds of one keyword a mix takes before other keywords get a turn
+MIX_SOUNDS_PER_KEYWORD = settings.mix_sounds_per_keyword
+# Word overlap (Jaccard) above which two sound names count as the same sound
+NEAR_DUPLICATE_SIMILARITY = 0.8
+
+_EXTENSION_RE = re.compile(r"\.(?:wav|mp3|flac|aiff?|ogg|m4a)$")
+_NAME_WORD_RE = re.compile(r"[a-z]+")
+# Words that tell takes of one recording apart rather than describe it
+_TAKE_WORDS = frozenset({
+    "take", "version", "ver", "var", "variation", "alt", "edit", "mono", "stereo", "loop", "part", "copy", "final",
+})
+
+def name_key(name: str) -> frozenset:
+    """
+    Words that identify what a sound is from its FreeSound name: no file
+    extension, numbers or take markers, so "Rain_01.wav", "rain 02 (take 2).wav"
+    and "RAIN" share one key.
+    """
+    name = _EXTENSION_RE.sub("", (name or "").lower())
+    return frozenset(word for word in _NAME_WORD_RE.findall(name) if word not in _TAKE_WORDS)
+
+def is_near_duplicate(key, other) -> bool:
+    if not key or not other:
+        return False
+    return key == other or len(key & other) / len(key | other) >= NEAR_DUPLICATE_SIMILARITY
+
+class _Picked:
+    """Ids and name keys of the sounds chosen so far."""
+
+    def __init__(self):
+        self.ids = set()
+        self.keys = []
+
+    def duplicate(self, sound, check_names=True):
+        """How `sound` repeats a chosen sound ("id" or "name"), or None if it does not."""
+        sound_id = sound.get("id")
+        if sound_id is not None and sound_id in self.ids:
+            return "id"
+        if check_names:
+            key = name_key(sound.get("name", ""))
+            if any(is_near_duplicate(key, other) for other in self.keys):
+                return "name"
+        return None
+
+    def add(self, sound):
+        if sound.get("id") is not None:
+            self.ids.add(sound["id"])
+        self.keys.append(name_key(sound.get("name", "")))
+
+def dedupe_sounds(sounds, limit=None):
+    """
+    `sounds` in order without repeats: the same FreeSound id, or a name that
+    is a near-duplicate of an earlier one (another take of the same recording).
+    Stops after `limit` sounds when given.
+    """
+    picked, kept = _Picked(), []
+    for sound in sounds:
+        if limit is not None and len(kept) >= limit:
+            break
+        duplicate = picked.duplicate(sound)
+        if duplicate:
+            metrics.SOUND_DUPLICATES.inc(kind=duplicate)
+            continue
+        picked.add(sound)
+        kept.append(sound)
+    return kept
+
+def select_sounds(results_by_keyword, limit, per_keyword=MIX_SOUNDS_PER_KEYWORD, final=True):
+    """
+    Choose `limit` distinct sounds from per-keyword result lists (keywords in
+    order of relevance, each list best match first).
+
+    Keywords are walked in order, taking at most `per_keyword` non-duplicate
+    sounds from each, so one keyword cannot fill the mix with takes of the same
+    recording. Only when every keyword has been walked (`final`) and the mix is
+    still short are further sounds of the same keywords, and then near-duplicate
+    names, used to fill it.
+
+    With `final` False the lists are a prefix of the keywords still being
+    searched and only the first walk is done: when it already yields `limit`
+    sounds the later keywords cannot change the selection.
+    """
+    picked, chosen = _Picked(), []
+
+    def take(check_names, cap):
+        for results in results_by_keyword:
+            taken = 0
+            for sound in results:
+                if len(chosen) >= limit or (cap is not None and taken >= cap):
+                    break
+                if picked.duplicate(sound, check_names):
+                    continue
+                picked.add(sound)
+                chosen.append(sound)
+                taken += 1
+
+    take(check_names=True, cap=per_keyword)
+    if len(chosen) >= limit or not final:
+        return chosen
+    take(check_names=True, cap=None)
+    take(check_names=False, cap=None)
+    return chosen
+
+def keywords_needed(selected_count, limit, per_keyword=MIX_SOUNDS_PER_KEYWORD) -> int:
+    """The fewest further keywords that could complete a mix holding `selected_count` of `limit` sounds."""
+    return max(1, -(-(limit - selected_count) // per_keyword))
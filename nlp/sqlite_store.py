@@ -0,0 +1,65 @@
+"""
+Plumbing shared by the SQLite stores (FreeSound index, track names, sound
+analysis, preview cache): one WAL connection per thread on a file shared by
+the workers on a host, and a lazily opened process-wide instance.
+"""
+import os
+import sqlite3
+import logging
+import threading
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class SQLiteStore:
+    """Base class holding `path` and handing out one connection per thread."""
+
+    # Set to sqlite3.Row by stores that read rows by column name
+    row_factory = None
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        # A bare filename lives in the working directory, which already exists
+        if path != ":memory:" and directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        # Stores are used from request threads and pool threads alike
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+def store_getter(factory, enabled, label, gauge_name=None, gauge_doc=None):
+    """
+    A get_*() function returning the process-wide store built by `factory`,
+    or None while `enabled()` is false or the store cannot be opened (the
+    next call tries again). With `gauge_name`, also registers a gauge of the
+    store's size().
+    """
+    state = {"store": None}
+    lock = threading.Lock()
+
+    def get_store():
+        if not enabled():
+            return None
+        if state["store"] is None:
+            with lock:
+                if state["store"] is None:
+                    try:
+                        state["store"] = factory()
+                    except (sqlite3.Error, OSError) as e:
+                        logger.warning("%s unavailable: %s", label, e)
+                        return None
+        return state["store"]
+
+    if gauge_name:
+        metrics.Gauge(gauge_name, gauge_doc, lambda: get_store().size())
+    return get_store
@@ -0,0 +1,230 @@
+"""
+Structured (JSON) output from the LLM.
+
+Models wrap JSON in code fences, add a sentence before or after it, leave a
+trailing comma, or run out of tokens half way through an array. parse_json
+finds the JSON wherever it is, repairs truncated output by closing it after
+its last complete element, and checks the result against a small schema, so
+one malformed answer costs a few lost items instead of the whole call.
+"""
+import re
+import json
+import logging
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_CLOSERS = {"{": "}", "[": "]"}
+_TRAILING_COMMA_RE = re.compile(r",\s*([\]}])")
+# Repairs tried per truncated value before giving up on it
+_MAX_REPAIRS = 8
+
+class StructuredOutputError(ValueError):
+    """
+    The LLM answer holds no JSON value matching the schema. `reason` is
+    "no_json" when it holds no JSON at all, "invalid" when what it holds does
+    not match the schema.
+    """
+
+    def __init__(self, message, reason, raw_text=""):
+        super().__init__(message)
+        self.reason = reason
+        self.raw_text = raw_text
+
+class SchemaError(ValueError):
+    """A value does not match its schema."""
+
+class JsonExtractor:
+    """
+    Incremental scanner for the JSON objects and arrays embedded in LLM text.
+
+    feed() takes text as it arrives (a whole answer or stream deltas) and
+    returns the top-level values completed by it, as raw JSON text. Anything
+    outside them (prose, code fences) is skipped. Once the text has ended,
+    repairs() proposes closed-off versions of a value that was cut short.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._start = None  # index of the open value's first bracket
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._cuts = []  # (index, open brackets) where the open value can be closed off
+
+    def feed(self, chunk: str) -> list:
+        """Add text and return the raw JSON of every top-level value it completes."""
+        self.text += chunk
+        completed = []
+        text = self.text
+        pos = self._pos
+        while pos < len(text):
+            char = text[pos]
+            pos += 1
+            if self._start is None:
+                if char in _CLOSERS:
+                    self._start = pos - 1
+                    self._stack = [char]
+                    self._cuts = [(pos, (char,))]
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in _CLOSERS:
+                self._stack.append(char)
+                self._cuts.append((pos, tuple(self._stack)))
+            elif char in "]}":
+                if _CLOSERS[self._stack[-1]] != char:
+                    # Not JSON after all (e.g. "[see above}"): rescan from the next character
+                    pos = self._start + 1
+                    self._start = None
+                    continue
+                self._stack.pop()
+                if not self._stack:
+                    completed.append(text[self._start:pos])
+                    self._start = None
+            elif char == ",":
+                self._cuts.append((pos - 1, tuple(self._stack)))
+        self._pos = pos
+        return completed
+
+    def repairs(self) -> list:
+        """
+        Raw JSON candidates for the value still open when the text ended, most
+        complete first: closed as it is, with a cut-off string value closed, then
+        closed after each earlier complete element. Each candidate is parsed in
+        turn by the caller; the first one that fits is used.
+        """
+        if self._start is None:
+            return []
+        text = self.text[self._start:].rstrip()
+        offset = self._start
+        candidates = []
+        if not self._in_string:
+            candidates.append(text.rstrip(",") + _closing(self._stack))
+        elif self._stack[-1] == "{":
+            # A cut-off string value in an object (e.g. a description) is kept as far as it goes
+            candidates.append(text + ('\\"' if self._escape else '"') + _closing(self._stack))
+        for index, stack in reversed(self._cuts[1:][-_MAX_REPAIRS:]):
+            candidates.append(self.text[offset:index] + _closing(stack))
+
+        # A stray bracket in prose may have swallowed real JSON after it
+        rest = JsonExtractor()
+        candidates.extend(rest.feed(self.text[self._start + 1:]))
+        candidates.extend(rest.repairs())
+
+        # Last resort: the empty container
+        index, stack = self._cuts[0]
+        candidates.append(self.text[offset:index] + _closing(stack))
+        return candidates
+
+def _closing(stack) -> str:
+    return "".join(_CLOSERS[bracket] for bracket in reversed(stack))
+
+def _loads(raw):
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        # Trailing commas are the most common slip; outside of that it is not JSON
+        return json.loads(_TRAILING_COMMA_RE.sub(r"\1", raw))
+
+def validate(value, schema, path="$"):
+    """
+    Check `value` against a JSON-Schema-like `schema` and return it cleaned:
+    strings stripped, booleans written as "true"/"false" accepted. Supported
+    keys: type (object, array, string, boolean), properties, required, items,
+    minItems, minLength, and invalidItems ("drop" by default, or "null" to keep
+    positions by putting None where an item does not match).
+    Raises SchemaError.
+    """
+    kind = schema.get("type")
+    if kind == "object":
+        if not isinstance(value, dict):
+            raise SchemaError(f"{path} is not an object")
+        for name in schema.get("required", ()):
+            if name not in value:
+                raise SchemaError(f"{path}.{name} is missing")
+        for name, subschema in schema.get("properties", {}).items():
+            if name in value:
+                value[name] = validate(value[name], subschema, f"{path}.{name}")
+        return value
+    if kind == "array":
+        if not isinstance(value, list):
+            raise SchemaError(f"{path} is not an array")
+        items = []
+        for i, item in enumerate(value):
+            try:
+                items.append(validate(item, schema["items"], f"{path}[{i}]") if "items" in schema else item)
+            except SchemaError as e:
+                logger.debug("Dropping LLM output item: %s", e)
+                if schema.get("invalidItems") == "null":
+                    items.append(None)
+        if sum(item is not None for item in items) < schema.get("minItems", 0):
+            raise SchemaError(f"{path} has fewer than {schema['minItems']} items")
+        return items
+    if kind == "string":
+        if not isinstance(value, str):
+            raise SchemaError(f"{path} is not a string")
+        value = value.strip()
+        if len(value) < schema.get("minLength", 0):
+            raise SchemaError(f"{path} is too short")
+        return value
+    if kind == "boolean":
+        if isinstance(value, str) and value.lower() in ("true", "false"):
+            return value.lower() == "true"
+        if not isinstance(value, bool):
+            raise SchemaError(f"{path} is not a boolean")
+        return value
+    return value
+
+def _unwrap(value, schema):
+    """Undo the usual wrappings: {"keywords": [...]} for an array, [{...}] for an object."""
+    kind = schema.get("type")
+    if kind == "array" and isinstance(value, dict):
+        lists = [v for v in value.values() if isinstance(v, list)]
+        if len(lists) == 1:
+            return lists[0]
+    if kind == "object" and isinstance(value, list) and len(value) == 1 and isinstance(value[0], dict):
+        return value[0]
+    return value
+
+def parse_json(text: str, schema: dict = None, task: str = "default"):
+    """
+    The first JSON value in an LLM answer that matches `schema` (any object or
+    array when no schema is given), repaired if the answer was cut short.
+    Outcomes are counted in nlp_llm_parse_total by task. Raises
+    StructuredOutputError if there is none.
+    """
+    extractor = JsonExtractor()
+    complete_values = extractor.feed(text or "")
+    candidates = [(raw, False) for raw in complete_values] + [(raw, True) for raw in extractor.repairs()]
+
+    found_json = False
+    for raw, repaired in candidates:
+        try:
+            value = _loads(raw)
+        except json.JSONDecodeError:
+            continue
+        found_json = True
+        if schema is not None:
+            try:
+                value = validate(_unwrap(value, schema), schema)
+            except SchemaError as e:
+                logger.debug("LLM output does not match the %s schema: %s", task, e)
+                continue
+        metrics.LLM_PARSE_RESULTS.inc(task=task, result="repaired" if repaired else "ok")
+        if repaired:
+            logger.info("Repaired truncated %s output", task)
+        return value
+
+    metrics.LLM_PARSE_RESULTS.inc(task=task, result="failed")
+    reason = "invalid" if found_json else "no_json"
+    raise StructuredOutputError(f"No usable JSON in the {task} response ({reason})", reason, text)
@@ -0,0 +1,103 @@
+import re
+import json
+import threading
+from types import SimpleNamespace
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+
+@pytest.fixture
+def http_server():
+    """
+    Local HTTP server answering from a list of (status, headers, body)
+    responses, one per request (the last one repeats). Yields
+    (base URL, responses list, received request paths).
+    """
+    responses, received = [], []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            received.append(self.path)
+            status, headers, body = responses[min(len(received), len(responses)) - 1]
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}", responses, received
+    finally:
+        server.shutdown()
+        server.server_close()
+
+class FakeMistral:
+    """
+    Stand-in for the Mistral client: `respond(prompt)` gives the answer text,
+    and every prompt sent is kept in `prompts`. Streams answer in words.
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.prompts = []
+        self.chat = self
+
+    def _answer(self, messages):
+        prompt = messages[-1]["content"]
+        self.prompts.append(prompt)
+        return self.respond(prompt)
+
+    def complete(self, model, messages, **kwargs):
+        message = SimpleNamespace(content=self._answer(messages))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    def stream(self, model, messages, **kwargs):
+        text = self._answer(messages)
+        for word in re.findall(r"\S+\s*", text):
+            delta = SimpleNamespace(content=word)
+            yield SimpleNamespace(data=SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None))
+
+@pytest.fixture
+def freesound_searches(monkeypatch):
+    """
+    Replace the FreeSound call (and the local index) with a stand-in giving
+    three distinct sounds per query. Returns (searched queries, gates): a
+    callable in gates[query] runs before that query answers (block or raise).
+    """
+    import freesound
+    calls = []
+    gates = {}
+
+    def fake_fetch(query):
+        calls.append(query)
+        gate = gates.get(query)
+        if gate is not None:
+            gate()
+        return [{"id": f"{query}/{take}", "name": f"{query} {take}"} for take in ("close", "distant", "muffled")]
+
+    monkeypatch.setattr(freesound, "get_index", lambda: None)
+    monkeypatch.setattr(freesound, "_fetch_search", fake_fetch)
+    return calls, gates
+
+@pytest.fixture
+def fake_mistral(monkeypatch):
+    """
+    Install a FakeMistral; set its `respond` to script the answers. Each test
+    also gets fresh governors, so earlier tests' calls don't shed its own.
+    """
+    import nlp_model
+    import governor
+    client = FakeMistral(lambda prompt: "")
+    monkeypatch.setattr(nlp_model, "get_mistral_client", lambda: client)
+    monkeypatch.setattr(governor, "_governors", {})
+    return client
+
+def name_tracks(prompt):
+    """FakeMistral answer to a track naming prompt: each FreeSound name plus " Track"."""
+    return json.dumps([f"{name} Track" for name in re.findall(r'^Name: "(.*)"$', prompt, re.M)])
@@ -0,0 +1,29 @@
+from bench_load import run_route
+from bench_stubs import StubUpstreams
+
+def metrics_page(rejections):
+    return (200, {}, (
+        "# TYPE nlp_governor_rejections_total counter\n"
+        f'nlp_governor_rejections_total{{upstream="mistral",reason="rate"}} {rejections}\n'
+        'nlp_governor_rejections_total{upstream="unsplash",reason="concurrency"} 1.0\n'
+        'nlp_http_requests_total{route="/api/x",method="GET",status="200"} 9.0\n'
+    ).encode())
+
+def test_route_report_counts_governor_sheds(http_server):
+    url, responses, received = http_server
+    responses += [
+        metrics_page(2.0),
+        (200, {}, b'{"success": true}'),
+        (200, {}, b'{"success": true, "degraded": true}'),
+        metrics_page(5.0),
+    ]
+    stubs = StubUpstreams()
+    try:
+        row = run_route(url, stubs, ("x", "GET", "/api/x", None), concurrency=1, total=2)
+    finally:
+        stubs.server.server_close()
+    assert received == ["/metrics", "/api/x", "/api/x", "/metrics"]
+    assert row["errors"] == 0
+    assert row["degraded"] == 1
+    assert row["shed_per_request"] == 1.5
+    assert row["upstream_calls_per_request"] == {"mistral": 0.0, "freesound": 0.0, "unsplash": 0.0}
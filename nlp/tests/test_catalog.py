@@ -0,0 +1,103 @@
+import time
+import pytest
+import catalog
+from catalog import SoundscapeCatalog, _LocalPools, _RedisPools
+
+class FakeRedis:
+    """The list commands the catalog uses, counting round trips."""
+
+    def __init__(self):
+        self.lists = {}
+        self.calls = 0
+
+    def rpush(self, key, value):
+        self.calls += 1
+        self.lists.setdefault(key, []).append(value.encode())
+
+    def lpop(self, key):
+        self.calls += 1
+        items = self.lists.get(key)
+        return items.pop(0) if items else None
+
+    def lrange(self, key, start, end):
+        self.calls += 1
+        return list(self.lists.get(key, []))
+
+    def lrem(self, key, count, value):
+        self.calls += 1
+        items = self.lists.get(key, [])
+        if value in items:
+            items.remove(value)
+            return 1
+        return 0
+
+    def llen(self, key):
+        self.calls += 1
+        return len(self.lists.get(key, []))
+
+def entry(style, n=0):
+    return {"style": style, "keywords": [f"{style} {n}"], "sounds": []}
+
+@pytest.fixture(params=["local", "redis"])
+def pools(request):
+    if request.param == "local":
+        return _LocalPools(ttl=60)
+    return _RedisPools(FakeRedis(), ttl=60)
+
+def test_pop_takes_the_oldest_entry_of_any_style(pools):
+    for item in (entry("jazzy"), entry("lo-fi"), entry("jazzy", 1)):
+        pools.push(item)
+    assert pools.counts() == {"jazzy": 2, "lo-fi": 1}
+    assert pools.pop() == entry("jazzy")
+    assert pools.pop("jazzy") == entry("jazzy", 1)
+    assert pools.pop("jazzy") is None
+    assert len(pools) == 1
+
+def test_expired_entries_are_skipped(pools):
+    pools.push(entry("ambient"))
+    pools.ttl = 0
+    assert pools.counts() == {}
+    assert pools.pop() is None
+
+def test_redis_pop_is_one_round_trip():
+    client = FakeRedis()
+    pools = _RedisPools(client, ttl=60)
+    for style in ("lo-fi", "jazzy", "cinematic"):
+        pools.push(entry(style))
+    client.calls = 0
+    assert pools.pop() == entry("lo-fi")
+    assert client.calls == 1
+
+def test_refill_tops_up_every_style(tmp_path, monkeypatch):
+    built = []
+
+    def build_entry(style):
+        built.append(style)
+        return entry(style, len(built))
+
+    monkeypatch.setattr(SoundscapeCatalog, "build_entry", staticmethod(build_entry))
+    pool = SoundscapeCatalog(styles=["rain", "wind", "fire"], pool_size=2, refill_interval=0,
+                             redis_url="", lock_path=str(tmp_path / "catalog.lock"))
+    pool.start()
+    deadline = time.monotonic() + 5
+    while pool.size() < 6 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pool.size() == 6
+    assert sorted(built) == ["fire", "fire", "rain", "rain", "wind", "wind"]
+    # Every style is refilled once before any gets a second entry
+    assert sorted(built[:3]) == ["fire", "rain", "wind"]
+
+    assert pool.pop("wind")["style"] == "wind"
+    while len(built) < 7 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert built[-1] == "wind"
+
+def test_refill_starts_with_the_app(monkeypatch):
+    started = []
+    monkeypatch.setattr(catalog.catalog, "start", lambda: started.append(True))
+    monkeypatch.setattr(catalog, "CATALOG_ENABLED", False)
+    catalog.start_refill()
+    assert started == []
+    monkeypatch.setattr(catalog, "CATALOG_ENABLED", True)
+    catalog.start_refill()
+    assert started == [True]
@@ -0,0 +1,55 @@
+import threading
+import freesound
+
+def test_keywords_are_searched_concurrently(freesound_searches):
+    calls, gates = freesound_searches
+    # Each search only returns once all three are running at the same time
+    barrier = threading.Barrier(3, timeout=5)
+    for query in ("heavy rain", "distant thunder", "old clock"):
+        gates[query] = barrier.wait
+    results = freesound.search_freesound(["heavy rain", "distant thunder", " ", "old clock"], max_per_keyword=1)
+    assert [sound["name"] for sound in results["results"]] == ["heavy rain close", "distant thunder close", "old clock close"]
+    assert sorted(calls) == ["distant thunder", "heavy rain", "old clock"]
+
+def test_failing_keyword_counts_as_empty(freesound_searches):
+    calls, gates = freesound_searches
+
+    def fail():
+        raise ValueError("unreadable response")
+
+    gates["broken radio"] = fail
+    results = freesound.search_freesound(["broken radio", "church bells"], max_per_keyword=1)
+    assert [sound["name"] for sound in results["results"]] == ["church bells close"]
+
+def test_keyword_past_the_deadline_is_dropped(freesound_searches):
+    calls, gates = freesound_searches
+    release = threading.Event()
+    gates["endless wind"] = lambda: release.wait(5)
+    try:
+        results = freesound.search_freesound(["endless wind", "seagulls"], max_per_keyword=1, deadline=0.2)
+    finally:
+        release.set()
+    assert [sound["name"] for sound in results["results"]] == ["seagulls close"]
+
+def test_concurrent_requests_share_a_search_until_all_cancel(freesound_searches):
+    calls, gates = freesound_searches
+    release = threading.Event()
+    gates["night crickets"] = lambda: release.wait(5)
+
+    (_, first), = freesound.submit_searches(["night crickets"])
+    (_, second), = freesound.submit_searches(["Night  Crickets"])
+    # One request giving up leaves the search running for the other
+    assert first.cancel()
+    release.set()
+    assert [sound["name"] for sound in second.result(5)] == [
+        "night crickets close", "night crickets distant", "night crickets muffled"
+    ]
+    assert calls == ["night crickets"]
+
+def test_wordless_keywords_are_not_coalesced(freesound_searches):
+    calls, gates = freesound_searches
+    barrier = threading.Barrier(2, timeout=5)
+    gates["?!"] = gates["..."] = barrier.wait
+    searches = freesound.submit_searches(["?!", "..."], max_per_keyword=1)
+    assert [future.result()[0]["id"] for _, future in searches] == ["?!/close", ".../close"]
+    assert sorted(calls) == ["...", "?!"]
@@ -0,0 +1,31 @@
+import pytest
+from freesound_index import FreesoundIndex, normalize_query
+
+@pytest.mark.parametrize("query, key", [
+    ("Ocean waves", "ocean wave"),
+    ("waves, OCEAN!", "ocean wave"),
+    ("glass", "glass"),
+    ("Pluie d'été", "d pluie été"),
+    ("Straße", "strasse"),
+    ("Дождь по крыше", "дождь крыше по"),
+    ("雨の音", "雨の音"),
+    ("?!  ...", ""),
+])
+def test_normalize_query(query, key):
+    assert normalize_query(query) == key
+
+def result(sound_id, name):
+    return {"id": sound_id, "name": name, "description": "", "download": None, "previews": {}}
+
+def test_near_repeat_queries_share_an_entry(tmp_path):
+    index = FreesoundIndex(str(tmp_path / "index.db"))
+    index.record("Ocean waves", [result(1, "surf"), result(2, "swell")])
+    assert [sound["id"] for sound in index.lookup("waves ocean")] == [1, 2]
+    assert index.lookup("Дождь") is None
+
+def test_wordless_queries_are_not_stored(tmp_path):
+    index = FreesoundIndex(str(tmp_path / "index.db"))
+    index.record("???", [result(1, "question")])
+    assert index.lookup("!!!") is None
+    # The sounds themselves are still kept for full-text search
+    assert [sound["id"] for sound in index.search("question")] == [1]
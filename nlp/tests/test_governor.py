@@ -0,0 +1,106 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from governor import CircuitBreaker, degraded_scope, degraded_reasons, mark_degraded, carry_degraded
+from singleflight import coalesce, CoalescingExecutor
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert not breaker.available()
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.available()
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+def test_successful_probe_closes():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=0.01)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+def test_released_probe_can_be_retried():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.allow()
+
+def test_degraded_reasons_follow_the_work_to_other_threads():
+    with degraded_scope() as reasons:
+        mark_degraded("track_names")
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pool.submit(carry_degraded(mark_degraded), "image").result()
+            # Without carry_degraded the worker thread is outside the scope
+            pool.submit(mark_degraded, "lost").result()
+        mark_degraded("track_names")
+    assert reasons == ["track_names", "image"]
+    mark_degraded("outside")
+    assert degraded_reasons() is None
+
+def test_coalesced_callers_share_the_leaders_fallbacks():
+    started, release = threading.Event(), threading.Event()
+
+    @coalesce("test_degraded", lambda value: value)
+    def name(value):
+        started.set()
+        release.wait(5)
+        mark_degraded("track_names")
+        return value
+
+    def call():
+        with degraded_scope() as reasons:
+            return name("rain"), reasons
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(call)
+        assert started.wait(5)
+        follower = pool.submit(call)
+        while metrics.SINGLEFLIGHT_CALLS.value(name="test_degraded", role="follower") < 1:
+            time.sleep(0.001)
+        release.set()
+        assert leader.result(5) == follower.result(5) == ("rain", ["track_names"])
+
+def test_shared_searches_carry_their_fallbacks_to_every_caller():
+    release = threading.Event()
+
+    def search(query):
+        release.wait(5)
+        mark_degraded("freesound")
+        return [query]
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        searches = CoalescingExecutor("test_degraded_submit", pool)
+        with degraded_scope() as first:
+            view = searches.submit("rain", search, "rain")
+        with degraded_scope() as second:
+            other = searches.submit("rain", search, "rain")
+        release.set()
+        assert view.result(5) == other.result(5) == ["rain"]
+    assert first == second == ["freesound"]
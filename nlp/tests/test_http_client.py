@@ -0,0 +1,28 @@
+import time
+import http_client
+
+def test_sessions_are_shared_per_upstream():
+    assert http_client.get_session("test_shared") is http_client.get_session("test_shared")
+    assert http_client.get_session("test_shared") is not http_client.get_session("test_other")
+
+def test_throttled_get_is_retried(http_server):
+    url, responses, received = http_server
+    responses += [(429, {}, b""), (200, {}, b"ok")]
+    response = http_client.get("test_retry", url + "/search")
+    assert response.status_code == 200 and response.text == "ok"
+    assert len(received) == 2
+
+def test_long_retry_after_is_capped(http_server):
+    url, responses, received = http_server
+    responses += [(429, {"Retry-After": "600"}, b""), (200, {}, b"ok")]
+    start = time.monotonic()
+    response = http_client.get("test_retry_after", url + "/search")
+    assert response.status_code == 200
+    assert time.monotonic() - start < http_client.HTTP_RETRY_AFTER_MAX + 1
+
+def test_final_error_is_handed_back(http_server):
+    url, responses, received = http_server
+    responses.append((503, {}, b"down"))
+    response = http_client.get("test_error", url + "/search")
+    assert response.status_code == 503
+    assert len(received) == http_client.HTTP_MAX_RETRIES + 1
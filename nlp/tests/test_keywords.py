@@ -0,0 +1,39 @@
+import json
+import nlp_model
+
+KEYWORDS = ["flowing water", "river current", "stream bubbling", "water splash", "gentle brook", "river ambience"]
+
+def test_one_call_validates_and_extracts(fake_mistral):
+    fake_mistral.respond = lambda prompt: json.dumps({"is_valid": True, "keywords": KEYWORDS})
+    assert nlp_model.get_keywords("a quiet river", mode="single") == KEYWORDS
+    assert len(fake_mistral.prompts) == 1
+    assert '"a quiet river"' in fake_mistral.prompts[0]
+
+def test_one_call_rejects_unrelated_input(fake_mistral):
+    fake_mistral.respond = lambda prompt: '{"is_valid": false, "keywords": []}'
+    result = nlp_model.get_keywords("what is the capital of France", mode="single")
+    assert result["error"] is True and result["suggestions"]
+    assert len(fake_mistral.prompts) == 1
+
+def test_two_call_mode_validates_first(fake_mistral):
+    def respond(prompt):
+        if "validator" in prompt:
+            return '{"is_valid": true}'
+        return json.dumps(KEYWORDS)
+
+    fake_mistral.respond = respond
+    assert nlp_model.get_keywords("a quiet lake", mode="two_call") == KEYWORDS
+    assert len(fake_mistral.prompts) == 2
+
+def test_unusable_answer_falls_back_to_the_input(fake_mistral):
+    fake_mistral.respond = lambda prompt: "Sorry, I can't help with that."
+    assert nlp_model.get_keywords("rain on a tin roof", mode="single") == [
+        "rain tin roof", "rain tin", "tin roof", "rain", "tin", "roof"
+    ]
+
+def test_over_budget_prompt_is_not_sent(fake_mistral):
+    fake_mistral.respond = lambda prompt: json.dumps({"is_valid": True, "keywords": KEYWORDS})
+    text = "rain " * 2000
+    result = nlp_model.get_keywords(text, mode="single")
+    assert fake_mistral.prompts == []
+    assert "rain" in result
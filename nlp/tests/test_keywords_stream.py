@@ -0,0 +1,75 @@
+import json
+import pytest
+from starlette.testclient import TestClient
+import python_backend
+import asgi_backend
+from conftest import name_tracks
+
+def keywords_reply(prompt):
+    if "keyword generator" in prompt:
+        return '{"is_valid": true, "keywords": ["wind chimes", "gravel path"]}'
+    return name_tracks(prompt)
+
+def post_stream(app, accept):
+    headers = {"Accept": accept} if accept else {}
+    body = {"str": "a garden at dusk"}
+    if app == "asgi":
+        response = TestClient(asgi_backend.app).post("/api/keywords/stream", json=body, headers=headers)
+        return response.headers["content-type"], response.text
+    response = python_backend.app.test_client().post("/api/keywords/stream", json=body, headers=headers)
+    return response.headers["Content-Type"], response.get_data(as_text=True)
+
+def parse_sse(text):
+    events = []
+    for frame in text.split("\n\n"):
+        if frame:
+            name, data = frame.split("\n")
+            event = json.loads(data.removeprefix("data: "))
+            assert name == f"event: {event['event']}"
+            events.append(event)
+    return events
+
+@pytest.mark.parametrize("app", ["flask", "asgi"])
+def test_ndjson_stream(app, freesound_searches, fake_mistral):
+    fake_mistral.respond = keywords_reply
+    content_type, text = post_stream(app, None)
+    assert content_type.startswith("application/x-ndjson")
+    events = [json.loads(line) for line in text.splitlines()]
+    kinds = [event["event"] for event in events]
+    assert kinds[:2] == ["validation", "keywords"]
+    assert kinds[-2:] == ["tracks", "done"]
+    assert kinds.count("sound") == 6
+    assert events[-2]["sounds"][0]["name"] == "wind chimes close Track"
+
+@pytest.mark.parametrize("app", ["flask", "asgi"])
+def test_event_stream_when_asked_for(app, freesound_searches, fake_mistral):
+    fake_mistral.respond = keywords_reply
+    content_type, text = post_stream(app, "text/event-stream")
+    assert content_type.startswith("text/event-stream")
+    events = parse_sse(text)
+    assert [event["event"] for event in events][-1] == "done"
+
+@pytest.mark.parametrize("app", ["flask", "asgi"])
+def test_failure_mid_stream_ends_with_an_error_event(app, monkeypatch):
+    def events(text):
+        yield {"event": "validation", "is_valid": True}
+        raise RuntimeError("search backend went away")
+
+    monkeypatch.setattr(python_backend, "iter_keywords_pipeline", events)
+    _, text = post_stream(app, None)
+    assert [json.loads(line) for line in text.splitlines()] == [
+        {"event": "validation", "is_valid": True},
+        {"event": "error", "message": "search backend went away"},
+    ]
+
+def test_fallback_is_flagged_on_the_done_event(freesound_searches, fake_mistral):
+    def respond(prompt):
+        if "keyword generator" in prompt:
+            return '{"is_valid": true, "keywords": ["wind chimes", "gravel path"]}'
+        raise RuntimeError("naming is down")
+
+    fake_mistral.respond = respond
+    _, text = post_stream("asgi", None)
+    events = [json.loads(line) for line in text.splitlines()]
+    assert events[-2]["sounds"][0]["name"] == "wind chimes close"
+    assert events[-1]["event"] == "done" and events[-1]["degraded"] is True
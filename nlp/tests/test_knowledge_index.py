@@ -0,0 +1,48 @@
+from knowledge_index import KnowledgeIndex
+
+KNOWLEDGE = """
+SoundscapeGen
+
+Overview:
+SoundscapeGen builds ambient soundscapes from a text description using FreeSound recordings.
+
+FAQ:
+Q: How do I download my soundscape?
+A: Use the download button under the mixer to save the mix as an MP3.
+
+Q: Can I change the volume of a track?
+A: Yes, every track has its own volume and pan slider.
+"""
+
+def test_faq_answer_for_a_rephrased_question():
+    index = KnowledgeIndex(KNOWLEDGE, faq_min_score=0.6)
+    assert index.faq_answer("how can I download the soundscape?") == (
+        "Use the download button under the mixer to save the mix as an MP3."
+    )
+
+def test_no_faq_answer_for_other_questions():
+    index = KnowledgeIndex(KNOWLEDGE, faq_min_score=0.6)
+    assert index.faq_answer("Which recordings does it use?") is None
+    assert index.faq_answer("???") is None
+
+def test_faq_answers_can_be_turned_off():
+    index = KnowledgeIndex(KNOWLEDGE, faq_min_score=1.1)
+    assert index.faq_answer("How do I download my soundscape?") is None
+
+def test_search_ranks_matching_chunk_first():
+    index = KnowledgeIndex(KNOWLEDGE)
+    assert "volume" in index.search("track volume", k=1)[0]["text"]
+    assert index.context("completely unrelated").startswith("Overview:")
+
+def test_no_faq_answer_for_questions_asking_more():
+    index = KnowledgeIndex(KNOWLEDGE)
+    assert index.faq_answer("How do I download my soundscape to Dropbox?") is None
+    assert index.faq_answer("How do I download a soundscape as a file?") is None
+    assert index.faq_answer("How do I download my soundscape?") is not None
+
+def test_no_faq_answer_for_save_questions_about_something_else():
+    from python_backend import SOUNDSCAPEGEN_KNOWLEDGE
+    chat_index = KnowledgeIndex(SOUNDSCAPEGEN_KNOWLEDGE)
+    assert chat_index.faq_answer("Can I save my soundscapes to Dropbox?") is None
+    assert chat_index.faq_answer("How do I save a soundscape as a file?") is None
+    assert chat_index.faq_answer("Can I save my soundscapes?") is not None
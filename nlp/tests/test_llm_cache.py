@@ -0,0 +1,48 @@
+import time
+import nlp_model
+from llm_cache import LLMCache, cache_key
+
+def test_trivially_different_prompts_share_an_entry():
+    assert cache_key("m", "Rain  on a\tRoof") == cache_key("m", " rain on a roof ")
+    assert cache_key("m", "rain") != cache_key("other", "rain")
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LLMCache(maxsize=2, ttl=60, redis_url=None)
+    cache.set("m", "a", "A")
+    cache.set("m", "b", "B")
+    assert cache.get("m", "a") == "A"
+    cache.set("m", "c", "C")
+    assert cache.get("m", "b") is None
+    assert (cache.get("m", "a"), cache.get("m", "c")) == ("A", "C")
+
+def test_entries_expire():
+    cache = LLMCache(maxsize=2, ttl=0.01, redis_url=None)
+    cache.set("m", "a", "A")
+    time.sleep(0.02)
+    assert cache.get("m", "a") is None
+    assert cache.stats()["misses"] == 1
+
+def test_redis_errors_degrade_to_misses():
+    class BrokenRedis:
+        def get(self, key):
+            raise ConnectionError("down")
+
+        def set(self, *args, **kwargs):
+            raise ConnectionError("down")
+
+    cache = LLMCache(maxsize=2, ttl=60, redis_url=None)
+    cache._redis = BrokenRedis()
+    assert cache.get("m", "a") is None
+    cache.set("m", "a", "A")
+    assert cache.get("m", "a") == "A"
+
+def test_repeated_prompt_is_answered_from_the_cache(fake_mistral, monkeypatch):
+    monkeypatch.setattr(nlp_model, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(nlp_model, "llm_cache", LLMCache(redis_url=None))
+    fake_mistral.respond = lambda prompt: "A calm answer."
+    assert nlp_model.complete("Describe the rain") == "A calm answer."
+    assert nlp_model.complete("describe  the rain") == "A calm answer."
+    assert len(fake_mistral.prompts) == 1
+    # Prompts whose answer should vary are always sent
+    nlp_model.complete("Describe the rain", use_cache=False)
+    assert len(fake_mistral.prompts) == 2
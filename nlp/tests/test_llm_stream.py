@@ -0,0 +1,47 @@
+from llm_stream import JsonFieldStreamer, iter_field_events
+
+def stream(chunks, field="reply"):
+    streamer = JsonFieldStreamer(field)
+    text = "".join(streamer.feed(chunk) for chunk in chunks) + streamer.flush()
+    return text, streamer.result()
+
+def test_field_value_streams_as_it_arrives():
+    streamer = JsonFieldStreamer("reply")
+    assert streamer.feed('{"re') == ""
+    assert streamer.feed('ply": "Hel') == "Hel"
+    assert streamer.feed('lo"}') == "lo"
+    assert streamer.result() == "Hello"
+
+def test_escapes_split_across_chunks():
+    text, result = stream(['{"reply": "Line\\', 'nTwo \\u00', 'e9 \\"q\\""}'])
+    assert text == result == 'Line\nTwo é "q"'
+
+def test_code_fence_and_preamble_are_skipped():
+    text, result = stream(["Sure:\n", "```json\n", '{"reply": "Rain"}', "\n```"])
+    assert text == result == "Rain"
+
+def test_plain_text_answer_is_forwarded():
+    text, result = stream(["Just ", "some text."])
+    assert text == result == "Just some text."
+
+def test_truncated_stream_is_repaired():
+    text, result = stream(['{"reply": "Gentle rai'])
+    assert text == result == "Gentle rai"
+
+def test_missing_field():
+    assert stream(['{"other": "x"}'])[1] is None
+
+def test_events_close_the_upstream_stream():
+    class Deltas:
+        closed = False
+
+        def __iter__(self):
+            return iter(['{"reply": ', '"Hi"}'])
+
+        def close(self):
+            self.closed = True
+
+    deltas = Deltas()
+    events = list(iter_field_events(deltas, "reply"))
+    assert events == [{"event": "token", "text": "Hi"}, {"event": "done", "reply": "Hi"}]
+    assert deltas.closed
@@ -0,0 +1,53 @@
+import json
+import pytest
+import metrics
+
+@pytest.fixture
+def multiproc_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "MULTIPROC_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "_worker", {"pid": None, "path": None, "dirty": False})
+    return tmp_path
+
+def sample(text, line_start):
+    return [line for line in text.splitlines() if line.startswith(line_start)]
+
+def test_render():
+    counter = metrics.Counter("test_render_total", "Test counter.", ("route",))
+    histogram = metrics.Histogram("test_render_seconds", "Test histogram.", buckets=(0.1, 1.0))
+    counter.inc(route="/a")
+    counter.inc(2, route="/a")
+    histogram.observe(0.5)
+    text = metrics.render()
+    assert sample(text, "test_render_total") == ['test_render_total{route="/a"} 3']
+    assert sample(text, "test_render_seconds") == [
+        'test_render_seconds_bucket{le="0.1"} 0',
+        'test_render_seconds_bucket{le="1.0"} 1',
+        'test_render_seconds_bucket{le="+Inf"} 1',
+        "test_render_seconds_sum 0.5",
+        "test_render_seconds_count 1",
+    ]
+
+def test_workers_are_summed(multiproc_dir):
+    counter = metrics.Counter("test_workers_total", "Test counter.", ("route",))
+    histogram = metrics.Histogram("test_workers_seconds", "Test histogram.", buckets=(0.1, 1.0))
+    # Another worker (possibly exited) left its samples behind
+    (multiproc_dir / "worker_1_old.json").write_text(json.dumps({
+        "test_workers_total": [[["/a"], 5], [["/b"], 1]],
+        "test_workers_seconds": [[[], [[1, 0, 0], 0.05]]],
+        "no_longer_registered_total": [[[], 7]],
+    }))
+    (multiproc_dir / "worker_2_torn.json.tmp").write_text("{")
+    counter.inc(route="/a")
+    histogram.observe(2.0)
+
+    text = metrics.render()
+    assert sample(text, "test_workers_total") == ['test_workers_total{route="/a"} 6', 'test_workers_total{route="/b"} 1']
+    assert sample(text, "test_workers_seconds_bucket") == [
+        'test_workers_seconds_bucket{le="0.1"} 1',
+        'test_workers_seconds_bucket{le="1.0"} 1',
+        'test_workers_seconds_bucket{le="+Inf"} 2',
+    ]
+    assert "no_longer_registered_total" not in text
+    # This worker's own file now holds its samples for the other workers' scrapes
+    own = json.loads(open(metrics._worker["path"]).read())
+    assert own["test_workers_total"] == [[["/a"], 1]]
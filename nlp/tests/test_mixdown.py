@@ -0,0 +1,78 @@
+import threading
+import pytest
+import mixdown
+import preview_cache
+import python_backend
+
+def mix_request(*urls):
+    return {"tracks": [{"url": url} for url in urls]}
+
+@pytest.mark.parametrize("url", [
+    "https://freesound.org/data/previews/1/1_2-hq.mp3",
+    "https://cdn.FreeSound.org/previews/1/1_2-hq.mp3",
+])
+def test_allowed_hosts_are_accepted(url):
+    (tracks, duration, loop), error = python_backend.parse_mix_request(mix_request(url))
+    assert error is None
+    assert tracks[0].source == url
+
+@pytest.mark.parametrize("url", [
+    "https://evilfreesound.org/a.mp3",
+    "https://freesound.org.example.com/a.mp3",
+    "ftp://freesound.org/a.mp3",
+    "file:///etc/passwd",
+    "http://127.0.0.1:8000/api/preview/1",
+    "/etc/passwd",
+])
+def test_other_hosts_are_rejected(url):
+    mix, error = python_backend.parse_mix_request(mix_request("https://freesound.org/ok.mp3", url))
+    assert mix is None
+    assert error == "Track 2 URL is not an allowed sound source."
+
+@pytest.mark.parametrize("url", ["https://nlp.example.com/api/preview/42", "/api/preview/42"])
+def test_cached_previews_are_accepted(monkeypatch, url):
+    monkeypatch.setattr(preview_cache, "PREVIEW_CACHE_BASE_URL", "https://nlp.example.com")
+    (tracks, _, _), error = python_backend.parse_mix_request(mix_request(url))
+    assert error is None and tracks[0].source == url
+
+def test_cached_previews_are_read_from_disk(monkeypatch):
+    monkeypatch.setattr(mixdown, "resolve_preview", lambda sound_id: ("/cache/42.mp3", None) if sound_id == 42 else (None, None))
+    assert mixdown._local_source("/api/preview/42") == "/cache/42.mp3"
+    with pytest.raises(mixdown.MixError, match="Unknown preview"):
+        mixdown._local_source("/api/preview/43")
+
+@pytest.fixture
+def fake_render(monkeypatch):
+    """One mix slot, and a mix that renders without ffmpeg: one chunk per next()."""
+    monkeypatch.setattr(mixdown, "_mix_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(mixdown, "mix_available", lambda: True)
+    monkeypatch.setattr(python_backend, "mix_available", lambda: True)
+    monkeypatch.setattr(mixdown, "render_mix", lambda tracks, duration, loop: iter([b"first", b"second"]))
+    monkeypatch.setattr(mixdown, "_encode", lambda first, chunks: (chunk for chunk in [first, *chunks]))
+
+def test_mixes_over_the_limit_are_turned_away(fake_render):
+    body = mix_request("https://freesound.org/a.mp3")
+    audio, error = python_backend.mix_audio(body)
+    assert error is None
+
+    busy, error = python_backend.mix_audio(body)
+    assert busy is None
+    assert error[1] == 503
+
+    # Exhausting the first mix frees its slot
+    assert list(audio) == [b"first", b"second"]
+    audio, error = python_backend.mix_audio(body)
+    assert error is None
+
+def test_closing_an_unstarted_mix_frees_its_slot(fake_render):
+    audio = mixdown.stream_mix([], 1.0)
+    with pytest.raises(mixdown.MixBusy):
+        mixdown.stream_mix([], 1.0)
+    audio.close()
+    mixdown.stream_mix([], 1.0).close()
+
+def test_failed_mix_frees_its_slot(fake_render, monkeypatch):
+    monkeypatch.setattr(mixdown, "render_mix", lambda tracks, duration, loop: iter([]))
+    for _ in range(2):
+        with pytest.raises(mixdown.MixError, match="empty"):
+            mixdown.stream_mix([], 1.0)
@@ -0,0 +1,72 @@
+import re
+import json
+import time
+import threading
+import pipeline
+from conftest import name_tracks
+
+def test_pipeline_names_the_top_sounds(freesound_searches, fake_mistral):
+    fake_mistral.respond = name_tracks
+    timer = pipeline.StageTimer()
+    result = pipeline.run_keywords_pipeline(None, keywords=["harbour bells", "gulls", "rope creak"], timer=timer)
+    names = [sound["name"] for sound in result["sounds"]]
+    assert names == [
+        "harbour bells close Track", "harbour bells distant Track",
+        "gulls close Track", "gulls distant Track",
+        "rope creak close Track", "rope creak distant Track",
+    ]
+    assert result["sounds"][0]["freesound_name"] == "harbour bells close"
+    assert set(timer.timings) == {"search", "track_names"}
+    assert "search;dur=" in timer.server_timing()
+
+def test_selection_does_not_wait_for_searches_it_no_longer_needs(freesound_searches):
+    calls, gates = freesound_searches
+    release = threading.Event()
+    gates["slow fog horn"] = lambda: release.wait(5)
+    start = time.monotonic()
+    try:
+        sounds = pipeline.collect_top_sounds(["owls", "wind gusts", "creaking gate", "slow fog horn"])
+    finally:
+        release.set()
+    assert time.monotonic() - start < 2
+    assert len(sounds) == pipeline.TOP_SOUNDS
+    assert not any(sound["name"].startswith("slow fog horn") for sound in sounds)
+
+def test_stream_starts_naming_before_the_last_search(freesound_searches, fake_mistral):
+    calls, gates = freesound_searches
+    naming_sent = threading.Event()
+
+    def respond(prompt):
+        if "keyword generator" in prompt:
+            return '{"is_valid": true, "keywords": ["kettle", "spoons", "radio", "late bus"]}'
+        naming_sent.set()
+        return name_tracks(prompt)
+
+    fake_mistral.respond = respond
+    # The last search only answers once the naming prompt has gone out
+    waited = []
+    gates["late bus"] = lambda: waited.append(naming_sent.wait(5))
+
+    events = list(pipeline.iter_keywords_pipeline("a kitchen in the morning"))
+    assert waited == [True]
+    kinds = [event["event"] for event in events]
+    assert kinds[:2] == ["validation", "keywords"]
+    assert kinds[-2:] == ["tracks", "done"]
+    assert len(events[-2]["sounds"]) == pipeline.TOP_SOUNDS
+    assert "late bus" in calls
+
+def test_batch_names_are_unique_per_soundscape(freesound_searches, fake_mistral):
+    def respond(prompt):
+        if "numbered list of descriptions" in prompt:
+            return json.dumps([
+                {"is_valid": True, "keywords": ["ferry horn", "mooring lines", "wave slap"]},
+                {"is_valid": True, "keywords": ["stall banter", "cart wheels", "coin drop"]},
+            ])
+        # Every sound gets the same name, in one chunk shared by both soundscapes
+        return json.dumps(["Busy Scene"] * len(re.findall(r"^Name: ", prompt, re.M)))
+
+    fake_mistral.respond = respond
+    results = pipeline.run_keywords_batch(["a harbour at dawn", "a market at noon"])
+    expected = ["Busy Scene"] + [f"Busy Scene {n}" for n in range(2, 7)]
+    assert [[sound["name"] for sound in result["sounds"]] for result in results] == [expected, expected]
+    assert not any(result["degraded"] for result in results)
@@ -0,0 +1,61 @@
+import pytest
+import preview_cache
+from preview_cache import PreviewCache, cached_sound_id, cache_previews
+
+class FakeDownload:
+    def __init__(self, size):
+        self.data = b"x" * size
+
+    def iter_content(self, chunk_size):
+        yield self.data
+
+@pytest.fixture
+def cache(tmp_path):
+    return PreviewCache(str(tmp_path), max_bytes=250)
+
+def test_least_recently_used_files_are_evicted(cache, monkeypatch, tmp_path):
+    clock = iter(range(1000, 2000, 100))
+    monkeypatch.setattr(preview_cache.time, "time", lambda: next(clock))
+    cache.register([(1, "https://freesound.org/1.mp3"), (2, "https://freesound.org/2.mp3"),
+                    (3, "https://freesound.org/3.mp3")])
+    cache.store(1, FakeDownload(100))
+    cache.store(2, FakeDownload(100))
+    # Using 1 again makes 2 the least recently used
+    assert cache.get(1) == cache.file_path(1)
+    cache.store(3, FakeDownload(100))
+
+    assert cache.size_bytes() == 200
+    assert (tmp_path / "1.mp3").exists()
+    assert not (tmp_path / "2.mp3").exists()
+    assert (tmp_path / "3.mp3").exists()
+
+def test_register_updates_a_changed_source(cache):
+    cache.register([(1, "https://freesound.org/old.mp3")])
+    cache.store(1, FakeDownload(10))
+    cache.register([(1, "https://freesound.org/old.mp3")])
+    assert cache.size_bytes() == 10
+
+    cache.register([(1, "https://freesound.org/new.mp3")])
+    assert cache.source(1) == "https://freesound.org/new.mp3"
+    # The file on disk came from the old URL, so it is fetched again
+    assert cache.size_bytes() == 0
+
+def test_previews_get_relative_urls_without_a_base_url(cache, monkeypatch):
+    monkeypatch.setattr(preview_cache, "get_preview_cache", lambda: cache)
+    monkeypatch.setattr(preview_cache, "PREVIEW_CACHE_BASE_URL", "")
+    results = cache_previews([{"id": 7, "preview_url": "https://freesound.org/7.mp3"}])
+    assert results[0]["preview_url"] == "/api/preview/7"
+    assert results[0]["preview_source_url"] == "https://freesound.org/7.mp3"
+    assert cache.source(7) == "https://freesound.org/7.mp3"
+
+@pytest.mark.parametrize("base_url, url, sound_id", [
+    ("", "/api/preview/7", 7),
+    ("https://nlp.example.com", "/api/preview/7", 7),
+    ("https://nlp.example.com", "https://nlp.example.com/api/preview/7", 7),
+    ("", "https://nlp.example.com/api/preview/7", None),
+    ("", "/api/preview/7/../../etc/passwd", None),
+    ("", None, None),
+])
+def test_cached_sound_id(monkeypatch, base_url, url, sound_id):
+    monkeypatch.setattr(preview_cache, "PREVIEW_CACHE_BASE_URL", base_url)
+    assert cached_sound_id(url) == sound_id
@@ -0,0 +1,125 @@
+import json
+import threading
+import pytest
+from starlette.testclient import TestClient
+import python_backend
+import asgi_backend
+from conftest import name_tracks
+from governor import mark_degraded
+
+class FlaskClient:
+    """Flask's test client with the same call shape as Starlette's."""
+
+    def __init__(self):
+        self.client = python_backend.app.test_client()
+
+    def post(self, path, json=None):
+        response = self.client.post(path, json=json)
+        return response.status_code, response.get_json(), response.headers
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.get_json(), response.headers
+
+class AsgiClient:
+    def __init__(self):
+        self.client = TestClient(asgi_backend.app)
+
+    def post(self, path, json=None):
+        response = self.client.post(path, json=json)
+        return response.status_code, response.json(), response.headers
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.json(), response.headers
+
+@pytest.fixture(params=["flask", "asgi"])
+def client(request):
+    return FlaskClient() if request.param == "flask" else AsgiClient()
+
+@pytest.mark.parametrize("path, body, message", [
+    ("/api/keywords", {}, "Missing 'str' parameter in the request."),
+    ("/api/keywords/batch", {"prompts": "rain"}, "Missing 'prompts' parameter: expected a non-empty list of strings."),
+    ("/api/keywords/stream", None, "Missing 'str' parameter in the request."),
+    ("/api/track-names", {"names": []}, "Missing 'sounds' parameter in the request."),
+    ("/api/sound/search", {}, "Missing 'query' parameter in the request."),
+    ("/api/description", {}, "Missing 'str' parameter"),
+    ("/api/description/stream", {}, "Missing 'str' parameter"),
+    ("/api/get-image", {}, "Missing 'str' parameter."),
+    ("/api/chat", {}, "Missing 'message' parameter"),
+    ("/api/chat/stream", {}, "Missing 'message' parameter"),
+])
+def test_bad_requests_get_the_same_answer(client, path, body, message):
+    status, payload, _ = client.post(path, json=body)
+    assert (status, payload) == (400, {"success": False, "message": message})
+
+def test_keywords(client, freesound_searches, fake_mistral):
+    def respond(prompt):
+        if "keyword generator" in prompt:
+            return '{"is_valid": true, "keywords": ["tram bell", "rain on glass", "footsteps"]}'
+        return name_tracks(prompt)
+
+    fake_mistral.respond = respond
+    status, payload, headers = client.post("/api/keywords", json={"str": "a rainy city evening"})
+    assert status == 200
+    assert payload["success"] is True
+    assert payload["keywords"] == ["tram bell", "rain on glass", "footsteps"]
+    assert payload["sounds"][0]["name"] == "tram bell close Track"
+    assert "search;dur=" in headers["Server-Timing"]
+
+def test_invalid_keywords_input(client, fake_mistral):
+    fake_mistral.respond = lambda prompt: '{"is_valid": false, "keywords": []}'
+    status, payload, _ = client.post("/api/keywords", json={"str": "solve 2x + 3 = 7"})
+    assert status == 200
+    assert payload["success"] is False and payload["is_valid_input"] is False and payload["suggestions"]
+
+def test_auto_keywords_pops_the_catalog_off_the_event_loop(client, monkeypatch):
+    threads = []
+
+    def pop_soundscape():
+        threads.append(threading.current_thread())
+        return {"keywords": ["wind"], "sounds": []}
+
+    monkeypatch.setattr(python_backend, "pop_soundscape", pop_soundscape)
+    status, payload, _ = client.get("/api/auto-keywords")
+    assert (status, payload) == (200, {"success": True, "keywords": ["wind"], "sounds": []})
+    if isinstance(client, AsgiClient):
+        assert threads[0].name.startswith("AnyIO worker thread")
+
+def test_chat_stream_events(client, monkeypatch):
+    monkeypatch.setattr(python_backend.knowledge_index, "faq_answer", lambda message: "Use the download button.")
+    if isinstance(client, AsgiClient):
+        body = client.client.post("/api/chat/stream", json={"message": "download?"}).text
+    else:
+        body = client.client.post("/api/chat/stream", json={"message": "download?"}).get_data(as_text=True)
+    events = [json.loads(line) for line in body.splitlines()]
+    assert events == [
+        {"event": "token", "text": "Use the download button."},
+        {"event": "done", "response": "Use the download button."},
+    ]
+
+def test_fallbacks_are_flagged_as_degraded(client, freesound_searches, fake_mistral):
+    def respond(prompt):
+        if "keyword generator" in prompt:
+            return '{"is_valid": true, "keywords": ["tram bell", "rain on glass", "footsteps"]}'
+        raise RuntimeError("naming is down")
+
+    fake_mistral.respond = respond
+    status, payload, _ = client.post("/api/keywords", json={"str": "a rainy city evening"})
+    assert status == 200 and payload["degraded"] is True
+    # The sounds keep their FreeSound names
+    assert payload["sounds"][0]["name"] == "tram bell close"
+
+def test_answers_without_fallbacks_are_not_flagged(client, freesound_searches, fake_mistral):
+    fake_mistral.respond = lambda prompt: name_tracks(prompt)
+    status, payload, _ = client.post("/api/sound/search", json={"query": "tram bell"})
+    assert status == 200 and "degraded" not in payload
+
+def test_shed_image_search_asks_for_a_retry(client, monkeypatch):
+    def shed(query):
+        mark_degraded("image")
+        return {"image_url": ""}
+
+    monkeypatch.setattr(python_backend, "get_unsplash_image", shed)
+    status, payload, _ = client.post("/api/get-image", json={"str": "rainy forest"})
+    assert (status, payload) == (503, {"success": False, "message": "Image search is busy, please retry."})
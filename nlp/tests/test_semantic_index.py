@@ -0,0 +1,74 @@
+import os
+import numpy as np
+import pytest
+import semantic_index
+from freesound_index import FreesoundIndex
+
+WORDS = ["rain", "thunder", "bird", "engine"]
+
+class FakeSemanticIndex(semantic_index.SemanticIndex):
+    """One dimension per known word instead of a transformer model."""
+
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.embedded = []
+
+    def _load_model(self):
+        if self._model is None:
+            self._dim = len(WORDS)
+            self._open_files()
+            self._model = object()
+
+    def embed(self, texts):
+        self.embedded.extend(texts)
+        vectors = np.array([[float(word in text.lower()) for word in WORDS] for text in texts], dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+@pytest.fixture
+def sounds(tmp_path, monkeypatch):
+    index = FreesoundIndex(str(tmp_path / "index.db"))
+    monkeypatch.setattr(semantic_index, "get_index", lambda: index)
+
+    def add(*names):
+        index.record(names[0], [
+            {"id": sound_id, "name": name, "description": "", "previews": {}}
+            for sound_id, name in enumerate(names, start=len(index.list_sounds()) + 1)
+        ])
+    return add
+
+def test_refresh_and_search(tmp_path, sounds):
+    sounds("Rain on a tin roof", "Thunder far away", "Bird song")
+    index = FakeSemanticIndex(str(tmp_path))
+    index.refresh()
+    assert index.is_ready()
+    assert [[sound_id for sound_id, _ in matches] for matches in index.search(["thunder", "bird"], k=1)] == [[2], [3]]
+
+def test_workers_share_the_file(tmp_path, sounds):
+    sounds("Rain on a tin roof", "Thunder far away")
+    first, second = FakeSemanticIndex(str(tmp_path)), FakeSemanticIndex(str(tmp_path))
+    first.refresh()
+    sounds("Engine idling")
+    # The second worker picks up the first one's records and embeds only the new sound
+    second.refresh()
+    assert second.embedded == ["Engine idling. "]
+    assert second._ids.tolist() == [1, 2, 3]
+    first.refresh()
+    assert first.embedded == ["Rain on a tin roof. ", "Thunder far away. "]
+    assert first._ids.tolist() == [1, 2, 3]
+
+def test_partial_record_is_dropped(tmp_path, sounds):
+    sounds("Rain on a tin roof", "Thunder far away")
+    FakeSemanticIndex(str(tmp_path)).refresh()
+    path = tmp_path / "semantic_records.bin"
+    # A worker died halfway through appending the next record
+    with open(path, "ab") as f:
+        f.write(b"\x07" * 10)
+
+    index = FakeSemanticIndex(str(tmp_path))
+    index._load_model()
+    assert index._ids.tolist() == [1, 2]
+    sounds("Bird song")
+    index.refresh()
+    assert index._ids.tolist() == [1, 2, 3]
+    assert os.path.getsize(path) == 3 * index._record_dtype().itemsize
+    assert [matches[0][0] for matches in index.search(["bird"], k=1)] == [3]
@@ -0,0 +1,86 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import metrics
+from singleflight import coalesce, CoalescingExecutor
+
+def test_coalesce_shares_one_call():
+    calls = []
+    started, release = threading.Event(), threading.Event()
+
+    @coalesce("test_shared", lambda value: value)
+    def slow(value):
+        calls.append(value)
+        started.set()
+        release.wait(5)
+        return value * 2
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        leader = pool.submit(slow, 21)
+        assert started.wait(5)
+        followers = [pool.submit(slow, 21) for _ in range(3)]
+        # Wait until every follower has joined the leader's call
+        while metrics.SINGLEFLIGHT_CALLS.value(name="test_shared", role="follower") < 3:
+            time.sleep(0.001)
+        release.set()
+        assert [f.result(5) for f in [leader] + followers] == [42] * 4
+    assert len(calls) == 1
+
+def test_coalesce_runs_again_after_completion():
+    calls = []
+
+    @coalesce("test_sequential", lambda value: value)
+    def double(value):
+        calls.append(value)
+        return value * 2
+
+    assert double(1) == 2
+    assert double(1) == 2
+    assert len(calls) == 2
+
+def test_coalesce_shares_exceptions():
+    @coalesce("test_errors", lambda: "key")
+    def fail():
+        raise ValueError("upstream down")
+
+    with pytest.raises(ValueError):
+        fail()
+
+def test_executor_submits_a_key_once():
+    calls = []
+    release = threading.Event()
+
+    def work(value):
+        calls.append(value)
+        release.wait(5)
+        return value
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        executor = CoalescingExecutor("test_executor", pool)
+        first = executor.submit("rain", work, "rain")
+        second = executor.submit("rain", work, "rain")
+        other = executor.submit("wind", work, "wind")
+        release.set()
+        assert (first.result(5), second.result(5), other.result(5)) == ("rain", "rain", "wind")
+    assert sorted(calls) == ["rain", "wind"]
+
+def test_executor_cancels_only_when_every_view_cancels():
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        blocker = pool.submit(release.wait, 5)
+        executor = CoalescingExecutor("test_cancel", pool)
+        first = executor.submit("rain", lambda: "done")
+        second = executor.submit("rain", lambda: "done")
+        assert first.cancel()
+        release.set()
+        assert second.result(5) == "done"
+        blocker.result(5)
+
+        release.clear()
+        blocker = pool.submit(release.wait, 5)
+        view = executor.submit("wind", lambda: "done")
+        assert view.cancel()
+        release.set()
+        # The shared task was cancelled too, so a new submission runs afresh
+        assert executor.submit("wind", lambda: "again").result(5) == "again"
@@ -0,0 +1,41 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from sound_analysis import integrated_loudness, loop_points, peak_db, ANALYSIS_SAMPLE_RATE
+
+RATE = ANALYSIS_SAMPLE_RATE
+
+def sine(frequency, seconds, amplitude, channels=2):
+    t = np.arange(int(seconds * RATE)) / RATE
+    wave = amplitude * np.sin(2 * np.pi * frequency * t)
+    return np.repeat(wave[:, None], channels, axis=1)
+
+def test_loudness_of_a_1khz_tone():
+    # BS.1770: a 0 dBFS 1 kHz sine on one channel measures -3.01 LUFS
+    assert integrated_loudness(sine(1000, 5, 1.0, channels=1)) == pytest.approx(-3.01, abs=0.1)
+
+def test_loudness_follows_level():
+    loud = integrated_loudness(sine(1000, 5, 0.5))
+    quiet = integrated_loudness(sine(1000, 5, 0.05))
+    assert loud - quiet == pytest.approx(20.0, abs=0.1)
+
+def test_silence_has_no_loudness():
+    silence = np.zeros((RATE * 2, 2))
+    assert integrated_loudness(silence) is None
+    assert peak_db(silence) is None
+
+def test_peak():
+    assert peak_db(sine(1000, 1, 0.5)) == pytest.approx(-6.02, abs=0.01)
+
+def test_loop_points_of_a_periodic_signal():
+    # 2 Hz period: the best end is a whole number of periods after the start
+    start, end, score = loop_points(sine(2, 4, 0.5))
+    assert start == pytest.approx(0.05)
+    periods = (end - start) / 0.5
+    assert periods == pytest.approx(round(periods), abs=0.01)
+    assert end >= 2.0
+    assert score > 0.99
+
+def test_too_short_to_loop():
+    assert loop_points(sine(440, 0.1, 0.5)) is None
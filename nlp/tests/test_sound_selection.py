@@ -0,0 +1,31 @@
+from sound_selection import dedupe_sounds, select_sounds, name_key
+
+def sound(sound_id, name):
+    return {"id": sound_id, "name": name}
+
+def test_name_key_ignores_takes_and_extensions():
+    assert name_key("Rain_01.wav") == name_key("rain 02 (take 2).wav") == name_key("RAIN")
+
+def test_dedupe_drops_repeated_ids_and_takes():
+    sounds = [sound(1, "Rain_01.wav"), sound(1, "Rain_01.wav"), sound(2, "rain take 2.wav"), sound(3, "Wind")]
+    assert [s["id"] for s in dedupe_sounds(sounds)] == [1, 3]
+
+def test_dedupe_limit():
+    sounds = [sound(1, "Rain"), sound(2, "Wind"), sound(3, "Birds")]
+    assert [s["id"] for s in dedupe_sounds(sounds, limit=2)] == [1, 2]
+
+def test_select_spreads_over_keywords():
+    rain = [sound(1, "Rain"), sound(2, "Rain on roof"), sound(3, "Heavy rain storm")]
+    wind = [sound(4, "Wind"), sound(5, "Wind in trees")]
+    selected = select_sounds([rain, wind], limit=4, per_keyword=2)
+    assert [s["id"] for s in selected] == [1, 2, 4, 5]
+
+def test_select_fills_from_extra_sounds_then_near_duplicates():
+    rain = [sound(1, "Rain"), sound(2, "Rain on roof"), sound(3, "Rain_02.wav")]
+    wind = [sound(4, "Wind")]
+    assert [s["id"] for s in select_sounds([rain, wind], limit=3, per_keyword=1)] == [1, 4, 2]
+    assert [s["id"] for s in select_sounds([rain, wind], limit=4, per_keyword=1)] == [1, 4, 2, 3]
+
+def test_select_partial_stops_after_first_walk():
+    rain = [sound(1, "Rain"), sound(2, "Rain on roof")]
+    assert [s["id"] for s in select_sounds([rain], limit=4, per_keyword=1, final=False)] == [1]
@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+
+NLP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHECK = """
+import sys, json
+import {module}
+app = {module}.app
+heavy = [name for name in ("numpy", "torch", "transformers", "mistralai") if name in sys.modules]
+if "{module}" == "asgi_backend":
+    from starlette.testclient import TestClient
+    status = TestClient(app).get("/health").status_code
+else:
+    status = app.test_client().get("/health").status_code
+print(json.dumps({{"heavy": heavy, "health": status}}))
+"""
+
+@pytest.mark.parametrize("module", ["asgi_backend", "python_backend"])
+def test_service_starts_without_heavy_imports_or_api_keys(module, tmp_path):
+    env = {name: value for name, value in os.environ.items() if not name.endswith("_API_KEY")}
+    env["FREESOUND_INDEX_PATH"] = str(tmp_path / "freesound_index.db")
+    # A fresh interpreter, so modules imported by other tests don't count
+    output = subprocess.run(
+        [sys.executable, "-c", CHECK.format(module=module)],
+        cwd=NLP_DIR, env=env, capture_output=True, text=True, timeout=60, check=True
+    ).stdout
+    assert json.loads(output.splitlines()[-1]) == {"heavy": [], "health": 200}
+
+def test_mistral_client_needs_its_key_only_on_first_use(monkeypatch):
+    import nlp_model
+    monkeypatch.setattr(nlp_model.settings, "mistral_api_key", None)
+    monkeypatch.setattr(nlp_model, "_mistral_client", None)
+    with pytest.raises(ValueError, match="MISTRAL_API_KEY"):
+        nlp_model.get_mistral_client()
@@ -0,0 +1,36 @@
+import pytest
+from structured_output import parse_json, StructuredOutputError
+
+KEYWORDS = {"type": "array", "items": {"type": "string", "minLength": 1}}
+RESULT = {
+    "type": "object",
+    "required": ["is_valid"],
+    "properties": {"is_valid": {"type": "boolean"}, "keywords": KEYWORDS},
+}
+
+def test_fenced_json_with_prose():
+    text = 'Sure! Here it is:\n```json\n{"is_valid": "true", "keywords": [" rain ", "wind",]}\n```\nEnjoy.'
+    assert parse_json(text, RESULT) == {"is_valid": True, "keywords": ["rain", "wind"]}
+
+def test_truncated_array_keeps_complete_items():
+    assert parse_json('["rain", "wind", "thund', KEYWORDS) == ["rain", "wind"]
+
+def test_truncated_object_is_closed():
+    text = '{"is_valid": true, "keywords": ["rain", "forest birds", "cre'
+    assert parse_json(text, RESULT) == {"is_valid": True, "keywords": ["rain", "forest birds"]}
+
+def test_cut_off_string_value_in_object_is_kept():
+    assert parse_json('{"description": "Gentle rain on a tin ro') == {"description": "Gentle rain on a tin ro"}
+
+def test_wrapped_array_is_unwrapped():
+    assert parse_json('{"keywords": ["rain"]}', KEYWORDS) == ["rain"]
+
+def test_no_json():
+    with pytest.raises(StructuredOutputError) as error:
+        parse_json("I cannot help with that.", KEYWORDS)
+    assert error.value.reason == "no_json"
+
+def test_json_not_matching_schema():
+    with pytest.raises(StructuredOutputError) as error:
+        parse_json('{"keywords": ["rain"]}', RESULT)
+    assert error.value.reason == "invalid"
@@ -0,0 +1,34 @@
+import nlp_model
+from conftest import name_tracks
+from track_name_store import TrackNameStore
+
+def test_stored_names_are_reused_by_id(fake_mistral, monkeypatch, tmp_path):
+    store = TrackNameStore(str(tmp_path / "track_names.db"))
+    monkeypatch.setattr(nlp_model, "get_track_name_store", lambda: store)
+    fake_mistral.respond = name_tracks
+    sounds = [
+        {"freesound_id": "123", "name": "Rain"},
+        {"freesound_id": 7, "name": "Wind"},
+        {"freesound_id": {"id": 8}, "name": "Birds"},
+    ]
+
+    first = nlp_model.generate_track_names(sounds)
+    assert [sound["name"] for sound in first] == ["Rain Track", "Wind Track", "Birds Track"]
+    assert store.size() == 2
+
+    # The string id hits the int key it was stored under; the dict id is named again
+    second = nlp_model.generate_track_names(sounds)
+    assert [sound["name"] for sound in second] == ["Rain Track", "Wind Track", "Birds Track"]
+    assert len(fake_mistral.prompts) == 2
+    assert 'Name: "Birds"' in fake_mistral.prompts[1]
+    assert 'Name: "Rain"' not in fake_mistral.prompts[1]
+
+def test_changed_metadata_misses_the_store(fake_mistral, monkeypatch, tmp_path):
+    store = TrackNameStore(str(tmp_path / "track_names.db"))
+    monkeypatch.setattr(nlp_model, "get_track_name_store", lambda: store)
+    fake_mistral.respond = name_tracks
+
+    nlp_model.generate_track_names([{"freesound_id": 5, "name": "Rain"}])
+    renamed = nlp_model.generate_track_names([{"freesound_id": 5, "name": "Thunder"}])
+    assert renamed[0]["name"] == "Thunder Track"
+    assert len(fake_mistral.prompts) == 2
@@ -0,0 +1,118 @@
+import re
+import math
+import logging
+import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Per-task limits: (prompt tokens, completion max_tokens). A prompt over its
+# budget is not sent (see prepare); callers with compressible input (sound
+# descriptions, chat messages) trim to fit first.
+TASK_BUDGETS = {
+    "keywords": (1000, 200),
+    "keywords_batch": (2500, 1600),
+    "validation": (600, 20),
+    "track_names": (1500, 400),
+    "description": (700, 300),
+    "chat": (2000, 500),
+    "auto_keywords": (400, 150),
+}
+DEFAULT_BUDGET = (2000, 500)
+
+# Tokens of description kept per sound when naming tracks
+DESCRIPTION_MAX_TOKENS = 40
+# Tokens of the user's message kept in a chat prompt
+CHAT_MESSAGE_MAX_TOKENS = 300
+
+# Smaller, faster model for tasks that do not need the large one (empty to disable)
+MISTRAL_SMALL_MODEL = settings.mistral_small_model
+MISTRAL_SMALL_MODEL_TASKS = settings.mistral_small_model_tasks
+
+class PromptOverBudget(ValueError):
+    """A prompt is estimated to cost more tokens than its task allows."""
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate the tokens `text` costs without loading a tokenizer: about four
+    characters per word piece, one per punctuation mark. Close enough (within
+    roughly 15% on English prose) for budgeting.
+    """
+    count = 0
+    for piece in _TOKEN_RE.findall(text):
+        count += math.ceil(len(piece) / 4) if piece[0].isalnum() or piece[0] == "_" else 1
+    return count
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` at a word boundary so it fits in `max_tokens`."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    kept, used = [], 0
+    for word in text.split():
+        cost = count_tokens(word)
+        if used + cost > max_tokens:
+            break
+        kept.append(word)
+        used += cost
+    return " ".join(kept) + "..."
+
+def compact_prompt(prompt: str) -> str:
+    """Drop the source-code indentation and blank-line runs our triple-quoted prompts carry."""
+    lines = [line.strip() for line in prompt.strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+_URL_RE = re.compile(r"(?:https?://|www\.)\S+", re.IGNORECASE)
+_TAG_RE = re.compile(r"<[^>]+>")
+_LICENSE_RE = re.compile(
+    r"[^.!?\n]*(?:licen[cs]e|creative commons|\bcc[ -]?(?:by|0)\b|attribution|public domain|copyright|"
+    r"©|all rights reserved|please credit|credit me|royalty[- ]free)[^.!?\n]*[.!?]?",
+    re.IGNORECASE
+)
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+def clean_description(text: str, max_tokens: int = DESCRIPTION_MAX_TOKENS) -> str:
+    """
+    Shrink a FreeSound description to what helps name the sound: no HTML,
+    URLs or license/credit boilerplate, no repeated sentences, and at most
+    `max_tokens` tokens.
+    """
+    text = _TAG_RE.sub(" ", text or "")
+    text = _URL_RE.sub("", text)
+    text = _LICENSE_RE.sub(" ", text)
+
+    kept, seen = [], set()
+    for sentence in _SENTENCE_SPLIT_RE.split(text):
+        sentence = " ".join(sentence.split()).strip(" -*•|:")
+        if len(sentence) < 3 or sentence.lower() in seen:
+            continue
+        seen.add(sentence.lower())
+        kept.append(sentence)
+    return truncate_tokens(" ".join(kept), max_tokens)
+
+def model_for(task: str, default_model: str) -> str:
+    """The small model for tasks listed in MISTRAL_SMALL_MODEL_TASKS, else `default_model`."""
+    if MISTRAL_SMALL_MODEL and task in MISTRAL_SMALL_MODEL_TASKS:
+        return MISTRAL_SMALL_MODEL
+    return default_model
+
+def prepare(task: str, prompt: str, max_tokens: int = None):
+    """
+    Compact `prompt`, count its tokens against the task budget and return
+    (prompt, max_tokens for the completion). `max_tokens` overrides the task's
+    completion limit for callers whose output size varies (e.g. per sound).
+
+    Raises PromptOverBudget if the estimate is over the task's prompt budget:
+    the call is refused rather than sent, and callers fall back as they do
+    when Mistral fails.
+    """
+    prompt = compact_prompt(prompt)
+    prompt_budget, default_max_tokens = TASK_BUDGETS.get(task, DEFAULT_BUDGET)
+    max_tokens = max_tokens or default_max_tokens
+    tokens = count_tokens(prompt)
+    metrics.PROMPT_TOKENS.observe(tokens, task=task)
+    if tokens > prompt_budget:
+        metrics.LLM_BUDGET_EXCEEDED.inc(task=task)
+        raise PromptOverBudget(f"{task} prompt is ~{tokens} tokens, over its {prompt_budget} token budget")
+    return prompt, max_tokens
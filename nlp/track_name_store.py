@@ -0,0 +1,66 @@
+import time
+import hashlib
+from sqlite_store import SQLiteStore, store_getter
+from config import settings
+
+# Set TRACK_NAME_STORE_ENABLED=0 to have Mistral name every sound on every request
+TRACK_NAME_STORE_ENABLED = settings.track_name_store_enabled
+# SQLite file holding the generated names (shared by the workers on a host)
+TRACK_NAME_STORE_PATH = settings.track_name_store_path
+
+def source_digest(name: str, description: str) -> str:
+    """
+    Digest of the FreeSound name and description a track name was generated
+    from. A stored name is only reused for the same input, so a client posting
+    made-up metadata for a real id cannot change the name others get.
+    """
+    return hashlib.sha256(f"{name}\0{description}".encode("utf-8")).hexdigest()[:16]
+
+class TrackNameStore(SQLiteStore):
+    """
+    Persistent map from FreeSound id to the track name Mistral generated for
+    it, so a sound is named once and every later response reuses the name.
+    """
+
+    def __init__(self, path=TRACK_NAME_STORE_PATH):
+        super().__init__(path)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS track_names (
+                    id INTEGER PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+
+    def get_many(self, sources) -> dict:
+        """Stored names for {freesound_id: source_digest}, as {freesound_id: name}; misses are left out."""
+        if not sources:
+            return {}
+        ids = list(sources)
+        placeholders = ",".join("?" * len(ids))
+        rows = self._connection().execute(
+            f"SELECT id, source, name FROM track_names WHERE id IN ({placeholders})", ids
+        ).fetchall()
+        return {sound_id: name for sound_id, source, name in rows if sources.get(sound_id) == source}
+
+    def set_many(self, entries):
+        """Store (freesound_id, source_digest, name) entries, replacing older names for those ids."""
+        if not entries:
+            return
+        now = time.time()
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO track_names (id, source, name, created_at) VALUES (?, ?, ?, ?)",
+                [(sound_id, source, name, now) for sound_id, source, name in entries]
+            )
+
+    def size(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM track_names").fetchone()[0]
+
+# The process-wide store, or None when it is disabled or cannot be opened
+get_track_name_store = store_getter(
+    TrackNameStore, lambda: TRACK_NAME_STORE_ENABLED, "Track name store",
+    "nlp_track_name_store_entries", "Track names in the store."
+)
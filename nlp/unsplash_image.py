@@ -1,15 +1,17 @@
-import os
+import logging
 import requests
+import http_client
 from urllib.parse import quote_plus
-from dotenv import load_dotenv
+from config import settings
+from governor import UpstreamUnavailable, mark_degraded
 
-# Load env variable from .env file
-load_dotenv()
-UNSPLASH_API_KEY = os.environ.get("UNSPLASH_API_KEY")
-UNSPLASH_API_URL = "https://api.unsplash.com/search/photos"
+logger = logging.getLogger(__name__)
+
+UNSPLASH_API_KEY = settings.unsplash_api_key
+UNSPLASH_API_URL = settings.unsplash_api_url
 
 if not UNSPLASH_API_KEY:
-    print("Error: Unsplash API key is not loaded.")
+    logger.error("Unsplash API key is not loaded.")
 
 def get_unsplash_image(query: str) -> dict:
     '''
@@ -23,10 +25,14 @@ def get_unsplash_image(query: str) -> dict:
 
     # Make the request to the Unsplash API
     try:
-        response = requests.get(request_url)
+        response = http_client.get("unsplash", request_url)
         response.raise_for_status()
-    except requests.exceptions.RequestException as e: # If the request fails, print an error message
-        print(f"Unsplash API error searching for '{query}': {e}")
+    except UpstreamUnavailable as e: # Shed by the governor; the image is optional
+        logger.info("Skipping Unsplash search for '%s': %s", query, e)
+        mark_degraded("image")
+        return {"image_url": ""}
+    except requests.exceptions.RequestException as e: # If the request fails, log an error message
+        logger.error("Unsplash API error searching for '%s': %s", query, e)
         return {"image_url": ""}
 
     data = response.json()
@@ -36,6 +42,6 @@ def get_unsplash_image(query: str) -> dict:
         # Return the 'small' version of the image from the first result
         image_url = results[0]["urls"]["small"]
         return {"image_url": image_url}
-    else: # If no image results are found, print an error message and return an empty string
-        print(f"No image results found for query: {query}")
+    else: # If no image results are found, log it and return an empty string
+        logger.info("No image results found for query: %s", query)
         return {"image_url": ""}
\ No newline at end of file